@@ -1,27 +1,16 @@
 import logging
-import fcntl
 import time
-from main_script import is_filesystem_busy, unmount_filesystem, append_filesystem, remount_filesystem
+from functools import partial
+from lvm_autoextend.core import append_filesystem, scan, size_extensions
+from lvm_autoextend.filesystems import get_filesystem_type, is_filesystem_busy, unmount_filesystem, remount_filesystem
+from lvm_autoextend.forecast import UsageForecaster
+from lvm_autoextend.locks import treatment_lock
+from lvm_autoextend.logs import setup_logging
+from lvm_autoextend.workers import ExtensionPool, MAX_WORKERS
+from lvm_autoextend.workqueue import LeaseRenewer, WorkQueue
 
-lock_file_path = "/tmp/extension_lock.lock"
-file_systems_to_extend_path = "/tmp/filesystems_to_extend.txt"
-
-def unlock_lock_file():
-    """
-    Release the lock file.
-    
-    Args:
-        None
-        
-    Returns:
-        None
-    """
-    try: # Release the lock file if it's acquired by this process (if it exists)
-        with open(lock_file_path, 'w') as lock_file:
-            fcntl.lockf(lock_file, fcntl.LOCK_UN)
-        logging.info("Treatement script : Lock file released.")
-    except Exception as e: # Log the error if the lock file is not acquired by this process
-        logging.error(f"Treatement script : Error releasing lock file: {e}")
+# Held for the whole run, so main_script.py doesn't start another instance
+lock = treatment_lock()
 
 def acquire_lock():
     """
@@ -33,56 +22,68 @@ def acquire_lock():
     Returns:
         bool: True if the lock file is acquired, False otherwise.
     """
-    try: # Acquire the lock file if it's not already in use by another process (if it exists)
-        with open(lock_file_path, 'w') as lock_file:
-            fcntl.lockf(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    try: # Acquire the lock file if it's not already in use by another process
+        if lock.acquire(blocking=False):
             return True # Return True if the lock file is acquired
-    except BlockingIOError: # Log a warning if the lock file is already in use by another process
         logging.warning("Treatement script : Lock file is already in use. Exiting.")
         return False
     except Exception as e: # Log the error if the lock file is not acquired
         logging.error(f"Treatement script : Error acquiring lock file: {e}")
         return False
 
-def process_filesystems(file_path):
+def process_entry(entry, forecaster=None):
     """
-    Process the filesystems listed in the file at the given file path.
+    Extend the filesystem of a queue entry.
 
     Args:
-        file_path (str): The path to the file containing the filesystem information.
+        entry (Entry): The leased queue entry.
+        forecaster (UsageForecaster, optional): The fill rates and previous grows used to size the extension.
 
     Returns:
-        None
+        bool: True if the entry is done (extended, or no possible way to extend it), False to retry it later.
     """
-    with open(file_path, "r+") as extension_file: # Open the file in read/write mode to be able to read and write to it
-        lines = extension_file.readlines() # Read the filesystem information from the file
-        extension_file.seek(0) # Go back to the beginning of the file
-        extension_file.truncate() # Clear the file
+    mount_point = entry.mount_point
+    if is_filesystem_busy(mount_point): # Check if the filesystem is in use
+        logging.warning(f"Treatement script : Filesystem at {mount_point} is in use. Skipping unmount.")
+        return False
+    filesystem_type = get_filesystem_type(mount_point) # Read from the mount table, so before unmounting
+    if not unmount_filesystem(mount_point): # Log an error if the filesystem cannot be unmounted
+        logging.error(f"Treatement script : Error handling filesystem at {mount_point}.")
+        return False
+
+    # Resize and remount the filesystem
+    size = size_extensions([{"Filesystem": entry.filesystem, "Mount Point": mount_point}], forecaster)[entry.lv]
+    if not append_filesystem(entry.lv, filesystem_type, mount_point, Size=f"{size}b"):
+        logging.critical(f"Treatement script : No possible way to append storage for filesystem at {mount_point}. Deleting from queue.")
+    remount_filesystem(entry.lv, mount_point)
+    return True
+
+def process_filesystems(queue, pool, forecaster=None):
+    """
+    Process the eligible filesystems of the queue, one VG per worker.
+
+    Args:
+        queue (WorkQueue): The queue of the filesystems to extend.
+        pool (ExtensionPool): The workers.
+        forecaster (UsageForecaster, optional): The fill rates and previous grows used to size the extensions.
 
-        processed_filesystems = 0
-        for line in lines: # Process each filesystem listed in the file
-            lv_name, filesystem_type, mount_point = line.strip().split(',') # Get the filesystem information from the line
-            if is_filesystem_busy(mount_point): # Check if the filesystem is in use
-                logging.warning(f"Treatement script : Filesystem at {mount_point} is in use. Skipping unmount.")
-                extension_file.write(line)  # Write back the line as it's not processed
-            elif unmount_filesystem(mount_point):
-                # Resize and remount the filesystem
-                if not append_filesystem(lv_name, filesystem_type, mount_point):
-                    logging.critical(f"Treatement script : No possible way to append storage for filesystem at {mount_point}. Deleting from file.")
-                    remount_filesystem(lv_name, mount_point)
-                    continue # Skip the filesystem if there is no possible way to append storage
-                remount_filesystem(lv_name, mount_point)
-                processed_filesystems += 1
-                if processed_filesystems % 5 == 0:
-                    # Release the lock every 5 processed filesystems and acquire it again
-                    unlock_lock_file()
-                    # Wait for a short period to allow other processes to acquire the lock
-                    time.sleep(5)
-                    if not acquire_lock():
-                        break
-            else: # Log an error if the filesystem cannot be unmounted
-                logging.error(f"Treatement script : Error handling filesystem at {mount_point}.")
-                extension_file.write(line)  # Write back the line as it's not processed
+    Returns:
+        None
+    """
+    while True:
+        entries = queue.lease(limit=MAX_WORKERS * 4) # Take the eligible filesystems with the highest priority
+        if not entries:
+            return
+        renewer = LeaseRenewer(queue.path, queue.owner, entries) # Keep the leases while the extensions run, however long
+        renewer.start()
+        try:
+            for entry, done in pool.run(entries, partial(process_entry, forecaster=forecaster), dm_name=lambda entry: entry.lv):
+                if done:
+                    queue.complete(entry)
+                else:
+                    queue.retry(entry)  # Retry later as it's not processed
+        finally:
+            renewer.stop()
 
 
 def main():
@@ -91,31 +92,28 @@ def main():
         lock_acquired = acquire_lock()
         if lock_acquired:
             # The lock is acquired, proceed with treating filesystems
+            queue = WorkQueue()
+            scan() # Probe the host once, before the workers unmount the filesystems they extend
+            pool = ExtensionPool()
+            forecaster = UsageForecaster.load() # read only, the samples are stored by main_script.py
             while True:
-                # Read filesystem information from the file
-                with open(file_systems_to_extend_path, "r") as extension_file:
-                    lines = extension_file.readlines()
-                    if not lines:
-                        logging.info("Treatement script : No more filesystems to extend. Exiting.")
-                        break  # Exit the loop if there are no more filesystems
-                    
-                # Process filesystems
-                process_filesystems(file_systems_to_extend_path)
-
+                # Process the eligible filesystems
+                process_filesystems(queue, pool, forecaster)
+                wait = queue.next_eligible_in()
+                if wait is None:
+                    logging.info("Treatement script : No more filesystems to extend. Exiting.")
+                    break  # Exit the loop if there are no more filesystems
+                time.sleep(wait) # Wait for the next filesystem to be eligible again
+            pool.shutdown()
         else:
             logging.warning("Treatement script : Another instance (possibly the main script) is already running. Exiting.")
     except Exception as e:
         logging.error(f"Treatement script : An unexpected error occurred: {e}")
     finally:
         # Make sure to unlock the lock file in case of an exception
-        unlock_lock_file()
+        lock.release()
         logging.info("Treatement script : Exiting.")
 
 if __name__ == "__main__":
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="[%(asctime)s] %(levelname)s : %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        filename=f'logs/treatment_script.log'
-    )
+    setup_logging('treatment_script.log')
     main()
@@ -0,0 +1,78 @@
+import argparse
+from .logs import setup_logging
+
+
+def run_daemon(args):
+    from .daemon import main  # only load asyncio and the daemon when it's started
+    main(args)
+
+
+def run_agent(args):
+    from .agent import main  # only load asyncio and the agent when it's started
+    main(args)
+
+
+def run_controller(args):
+    from .controller import main
+    main(args)
+
+
+def run_benchmark(args):
+    import sys
+    from .benchmark import main  # only load the simulator and the benchmark when they're run
+    sys.exit(main(args))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="lvm-autoextend", description="Automatically extend the logical volumes of the host.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    daemon = subparsers.add_parser("daemon", help="watch the filesystems and extend them before they are full")
+    daemon.add_argument("--threshold", type=int, default=80, help="Use%% from which a filesystem is extended until its trend is known (default: 80)")
+    daemon.add_argument("--min-interval", type=float, default=1, help="seconds between two polls of a filesystem at the threshold (default: 1)")
+    daemon.add_argument("--max-interval", type=float, default=60, help="seconds between two polls of an empty filesystem (default: 60)")
+    daemon.add_argument("--rescan-interval", type=float, default=300, help="seconds between two scans of the host (default: 300)")
+    daemon.add_argument("--workers", type=int, default=8, help="VGs extended at the same time (default: 8)")
+    daemon.add_argument("--online", action="store_true", help="grow mounted ext3/ext4/xfs filesystems with lvextend -r, even if they are busy")
+    daemon.add_argument("--metrics-port", type=int, help="serve the metrics in the Prometheus text format on http://127.0.0.1:PORT/metrics")
+    daemon.add_argument("--metrics-file", help="write the metrics in the Prometheus text format to this file after each scan (e.g. for the textfile collector of node_exporter)")
+    daemon.set_defaults(func=run_daemon, log_file="daemon.log")
+
+    agent = subparsers.add_parser("agent", help="serve the state of this host to a controller and run the extensions it schedules")
+    agent.add_argument("--listen", default="unix:/run/lvm-autoextend.sock", metavar="ADDRESS", help="unix:PATH or HOST:PORT to serve on (default: unix:/run/lvm-autoextend.sock)")
+    agent.add_argument("--san", help="name of the storage this host shares with others, the controller caps the heavy operations per SAN")
+    agent.add_argument("--threshold", type=int, default=80, help="Use%% from which a filesystem or a thin pool is extended until its trend is known (default: 80)")
+    agent.add_argument("--workers", type=int, default=8, help="VGs extended at the same time (default: 8)")
+    agent.add_argument("--online", action="store_true", help="grow mounted ext3/ext4/xfs filesystems with lvextend -r, even if they are busy")
+    agent.add_argument("--token-file", help="file holding the secret the controller must send with each request (required to listen on TCP)")
+    host = agent.add_mutually_exclusive_group()
+    host.add_argument("--synthetic", type=int, metavar="LVS", help="serve a simulated host of this many LVs instead of this host (e.g. to try a controller)")
+    host.add_argument("--replay", metavar="ARCHIVE", help="serve a host recorded with --record instead of this host")
+    agent.add_argument("--seed", type=int, default=0, help="seed of the simulated host (default: 0)")
+    agent.set_defaults(func=run_agent, log_file="agent.log")
+
+    controller = subparsers.add_parser("controller", help="poll many agents and schedule their extensions fleet-wide")
+    controller.add_argument("agents", nargs="+", metavar="ADDRESS", help="unix:PATH or HOST:PORT of each agent")
+    controller.add_argument("--interval", type=float, default=300, help="seconds between two rounds (default: 300)")
+    controller.add_argument("--max-heavy", type=int, default=1, help="fsck or donor shrinks running at the same time on the hosts of one SAN (default: 1)")
+    controller.add_argument("--token-file", help="file holding the secret of the agents")
+    controller.add_argument("--extend-timeout", type=float, help="seconds an agent may take to run an extension before its SAN slot is given back (default: the sum of the timeouts of the commands of a donor shrink and an offline extension, about 25 hours)")
+    controller.add_argument("--once", action="store_true", help="run a single round and exit")
+    controller.set_defaults(func=run_controller, log_file="controller.log")
+
+    benchmark = subparsers.add_parser("benchmark", help="time the whole pipeline against simulated hosts and compare it with a baseline")
+    benchmark.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="number of LVs of each simulated host (default: 10 100 1000 10000)")
+    benchmark.add_argument("--fixture", action="append", default=[], metavar="ARCHIVE", help="also run the pipeline against a host recorded with --record (repeatable)")
+    benchmark.add_argument("--seed", type=int, default=0, help="seed of the synthetic topologies (default: 0)")
+    benchmark.add_argument("--repeat", type=int, default=3, help="runs of each host, the fastest is kept (default and minimum: 3)")
+    benchmark.add_argument("--baseline", default="benchmarks/baseline.json", help="stored results to compare with (default: benchmarks/baseline.json)")
+    benchmark.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline instead of comparing them")
+    benchmark.set_defaults(func=run_benchmark, log_file="benchmark.log")
+
+    args = parser.parse_args(argv)
+    setup_logging(args.log_file)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
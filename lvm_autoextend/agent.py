@@ -0,0 +1,183 @@
+import socket
+import asyncio
+import logging
+import signal
+import tempfile
+from . import core
+from .filesystems import is_filesystem_busy
+from .forecast import UsageForecaster
+from .locks import LockManager
+from .protocol import DEFAULT_ADDRESS, PROTOCOL_VERSION, ProtocolError, check_token, parse_address, read_message, read_token, remove_socket, start_server, write_message
+from .thinpools import add_samples, sample_keys
+from .workers import ExtensionPool, MAX_WORKERS
+
+THRESHOLD = 80  # Use% from which a filesystem or a thin pool is a candidate until its trend is known
+
+
+def is_heavy(kind, steps, online):
+    """An extension is heavy if it unmounts and checks its filesystem, or shrinks a donor: it loads the storage for long."""
+    return (kind == "filesystem" and not online) or any(step.action == "shrink" for step in steps)
+
+
+class Agent:
+    """
+    Serves the state of this host to a controller and runs the extensions it schedules (see controller.py).
+
+    The requests and their answers are JSON lines (see protocol.py), each answer has "ok" and "error" if it failed:
+        snapshot {horizon}: scan the host, plan every filesystem and thin pool projected full within `horizon`
+            seconds at once (like main_script.py), and answer the usage of the host and these candidates.
+        extend {lv}: run the planned extension of a candidate of the last snapshot, answer "extended".
+    """
+
+    def __init__(self, threshold=THRESHOLD, online=False, san=None, token=None, max_workers=MAX_WORKERS, forecaster=None, locks=None):
+        self.threshold = threshold
+        self.online = online  # grow the mounted filesystems with lvextend -r when their type allows it
+        self.san = san  # storage shared with other hosts, the controller caps the heavy operations per SAN
+        self.token = token  # shared secret of the requests, None only on a Unix socket (0600: root alone can connect)
+        self.pool = ExtensionPool(max_workers, locks)
+        self.forecaster = forecaster or UsageForecaster.load()
+        self.plan = None  # plan of the last snapshot
+        self.candidates = {}  # dm name -> (kind, parsed filesystem or pool usage) of the last snapshot
+        self.running = set()  # futures of the extensions in progress
+        self.scanning = asyncio.Lock()  # a scan replaces the topology: no extension runs meanwhile
+        self.stopping = None
+
+    def candidate(self, kind, usage, size, plan):
+        dm_name = usage["Filesystem"].split("/")[-1]
+        steps = plan.steps.get(dm_name)
+        online = kind == "pool" or (self.online and core.can_grow_online(usage))
+        time_to_full = self.forecaster.time_to_full(usage["Mount Point"])
+        self.candidates[dm_name] = (kind, usage)
+        return {
+            "lv": dm_name, "kind": kind, "mount_point": usage["Mount Point"] if kind == "filesystem" else None,
+            "use_percent": max(usage["Use%"], usage["Metadata"]["Use%"]) if kind == "pool" else usage["Use%"],
+            "time_to_full": time_to_full if time_to_full not in (None, float("inf")) else None, "size": size,
+            "feasible": steps is not None, "steps": [step.describe() for step in steps or []],
+            "heavy": is_heavy(kind, steps or [], online), "busy": not online and is_filesystem_busy(usage["Mount Point"]),
+        }
+
+    def take_snapshot(self, horizon):
+        """Scan the host and plan its candidates (blocking, see snapshot)."""
+        filesystems = core.calculate_and_sort_filesystems(core.scan())
+        for obj in filesystems:
+            self.forecaster.add(obj["Mount Point"], obj["Used"], obj["Available"])
+        pools = core.scan_pools()
+        for usage in pools:
+            add_samples(self.forecaster, usage)
+        self.forecaster.forget([obj["Mount Point"] for obj in filesystems] + [key for usage in pools for key in sample_keys(usage)])
+
+        to_extend = [obj for obj in filesystems if self.forecaster.should_extend(obj, self.threshold, horizon)]
+        pool_sizes = core.size_pool_extensions(pools, self.forecaster, self.threshold, horizon)
+        sizes = core.size_extensions(to_extend, self.forecaster)
+        self.plan = core.plan_extensions([obj["Filesystem"].split("/")[-1] for obj in to_extend], sizes=sizes, pools=pool_sizes)
+        self.candidates = {}
+        candidates = [self.candidate("pool", usage, sum(pool_sizes[usage["Filesystem"].split("/")[-1]]), self.plan)
+                      for usage in pools if usage["Filesystem"].split("/")[-1] in pool_sizes]
+        candidates += [self.candidate("filesystem", obj, sizes[obj["Filesystem"].split("/")[-1]], self.plan) for obj in to_extend]
+        return {
+            "host": socket.gethostname(), "san": self.san, "version": PROTOCOL_VERSION,
+            "filesystems": filesystems, "pools": pools,
+            "vgs": [{"name": vg.vg_name, "size": vg.vsize, "free": vg.free_count * vg.extent_size} for vg in core.topology.vgs],
+            "candidates": candidates,
+        }
+
+    def extend(self, kind, usage):
+        """Run the planned extension of a candidate (blocking, in the worker pool with its locks)."""
+        if kind == "pool":
+            return self.forecaster.track(core.treat_pool)(usage, self.plan)
+        online = self.online and core.can_grow_online(usage)
+        if not online and is_filesystem_busy(usage["Mount Point"]):
+            logging.warning(f"Agent : Filesystem at {usage['Mount Point']} is in use. Skipping it.")
+            return False
+        return self.forecaster.track(core.treat_filesystem)(usage, online, self.plan)
+
+    async def snapshot(self, horizon):
+        async with self.scanning:
+            await asyncio.gather(*self.running, return_exceptions=True)
+            return await asyncio.get_running_loop().run_in_executor(self.pool.executor, self.take_snapshot, horizon)
+
+    async def extend_candidate(self, dm_name):
+        async with self.scanning:
+            candidate = self.candidates.pop(dm_name, None)  # extended once per snapshot
+            if candidate is None:
+                raise ProtocolError(f"{dm_name} is not a candidate of the last snapshot")
+            future = asyncio.wrap_future(self.pool.submit(dm_name, self.extend, *candidate))
+            self.running.add(future)
+        try:
+            return await future
+        finally:
+            self.running.discard(future)
+
+    async def answer(self, request):
+        if not check_token(request, self.token):
+            return {"ok": False, "error": "invalid token"}
+        operation = request.get("op")
+        try:
+            if operation == "snapshot":
+                return {"ok": True, **await self.snapshot(request.get("horizon", 0))}
+            if operation == "extend":
+                return {"ok": True, "extended": bool(await self.extend_candidate(request["lv"]))}
+            return {"ok": False, "error": f"unknown operation {operation}"}
+        except Exception as e:
+            logging.error(f"Agent : Error answering {operation}: {e}")
+            return {"ok": False, "error": str(e)}
+
+    async def handle(self, reader, writer):
+        """Answer the requests of one connection, in order."""
+        try:
+            while True:
+                try:
+                    request = await read_message(reader)
+                except ProtocolError as e:
+                    await write_message(writer, {"ok": False, "error": str(e)})
+                    break
+                if request is None:
+                    break
+                await write_message(writer, await self.answer(request))
+        except (ConnectionError, ValueError) as e:  # ValueError: a line over protocol.MESSAGE_LIMIT
+            logging.warning(f"Agent : connection lost: {e}")
+        finally:
+            writer.close()
+
+    async def run(self, address=DEFAULT_ADDRESS):
+        """
+        Serve the controller on an address (see protocol.parse_address) until SIGTERM or SIGINT is received.
+
+        Raises:
+            ValueError: a TCP address without a token: any host reaching the port could run extensions as root.
+        """
+        if parse_address(address)[0] == "tcp" and self.token is None:
+            raise ValueError(f"{address}: a TCP listener needs a token (--token-file)")
+        loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stopping.set)
+        server = await start_server(self.handle, address)
+        logging.info(f"Agent : serving on {address}.")
+        await self.stopping.wait()
+        server.close()
+        await server.wait_closed()
+        remove_socket(address)
+        await asyncio.gather(*self.running, return_exceptions=True)
+        self.pool.shutdown(wait=True)
+        logging.info("Agent : Exiting.")
+
+
+def main(args):
+    token = read_token(args.token_file)
+    if parse_address(args.listen)[0] == "tcp" and token is None:
+        raise SystemExit(f"agent: --listen {args.listen} needs --token-file, any host reaching the port could run extensions as root")
+    rehearsal = args.synthetic is not None or args.replay is not None  # nothing of the host is changed
+    if args.synthetic is not None:
+        from .benchmark import LVS_PER_VG, generate_topology  # only load the generator for a test host
+        from .executor import set_executor
+        set_executor(generate_topology(max(args.synthetic // LVS_PER_VG, 1), min(args.synthetic, LVS_PER_VG), seed=args.seed))
+    elif args.replay is not None:
+        from .recording import start_replay
+        start_replay(args.replay, speed=0)
+    agent = Agent(threshold=args.threshold, online=args.online, san=args.san, token=token, max_workers=args.workers,
+                  forecaster=UsageForecaster() if rehearsal else None,
+                  locks=LockManager(tempfile.mkdtemp(prefix="lvm-autoextend-agent-")) if rehearsal else None)  # test hosts share the VG names
+    asyncio.run(agent.run(args.listen))
+    if not rehearsal:
+        agent.forecaster.save()
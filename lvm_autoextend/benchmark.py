@@ -0,0 +1,252 @@
+import os
+import json
+import random
+import logging
+import platform
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from time import perf_counter
+from . import core
+from .executor import set_executor
+from .filesystems import is_filesystem_busy
+from .locks import LockManager
+from .recording import ReplayExecutor
+from .simulator import SimulatedExecutor
+from .workers import ExtensionPool
+
+GiB = 1024 ** 3
+SIZES = (10, 100, 1000, 10000)  # number of LVs of each benchmarked host
+LVS_PER_VG = 10
+PHASES = ("probe", "sort", "busy", "plan", "extend")
+REPEAT = 3  # runs of each host size, the fastest is kept
+MIN_REPEAT = 3  # runs before a time is compared or stored: a single run is mostly scheduler noise on the large hosts
+TIME_TOLERANCE = 2.0  # a phase regresses if it's this many times slower than the baseline...
+TIME_FLOOR = 0.05  # ...and slower by more than this many seconds (timer noise on the small hosts)
+RSS_TOLERANCE = 1.5  # a phase regresses if the peak RSS grows by this factor
+
+
+def generate_topology(vgs, lvs_per_vg, lv_size=10 * GiB, usage=(0.1, 0.95), busy_fraction=0.1, write_rate=50,
+                      unused_fraction=0.05, vg_free_fraction=0.1, free_pvs=2, seed=0):
+    """
+    Build a synthetic host in the simulator.
+
+    Args:
+        vgs (int): number of VGs, one PV each.
+        lvs_per_vg (int): number of LVs of each VG.
+        lv_size (int, optional): size of every LV in bytes. Defaults to 10 GiB.
+        usage (tuple, optional): bounds of the uniform usage of the filesystems. Defaults to 10% to 95%.
+        busy_fraction (float, optional): fraction of the filesystems held by a process. Defaults to 0.1.
+        write_rate (float, optional): mean write throughput in kB/s (exponentially distributed). Defaults to 50.
+        unused_fraction (float, optional): fraction of the LVs without a filesystem. Defaults to 0.05.
+        vg_free_fraction (float, optional): free space of each VG, relative to its LVs. Defaults to 0.1.
+        free_pvs (int, optional): PVs in no VG. Defaults to 2.
+        seed (int, optional): seed of the random generator. Defaults to 0.
+
+    Returns:
+        SimulatedExecutor: the synthetic host.
+    """
+    rng = random.Random(seed)
+    simulator = SimulatedExecutor()
+    for v in range(vgs):
+        pv = simulator.add_pv(f"/dev/bench{v}", int(lvs_per_vg * lv_size * (1 + vg_free_fraction)) + GiB)
+        simulator.add_vg(f"vg{v}", [pv.name])
+        for l in range(lvs_per_vg):
+            lv = simulator.add_lv(f"vg{v}", f"lv{l}", lv_size)
+            if rng.random() < unused_fraction:
+                continue
+            simulator.add_filesystem(lv.dm_path, "ext4", int(rng.uniform(*usage) * lv.size), f"/srv/vg{v}/lv{l}",
+                                     busy=rng.random() < busy_fraction, writing_speed=rng.expovariate(1 / write_rate) if write_rate else 0.0)
+    for p in range(free_pvs):
+        simulator.add_pv(f"/dev/benchfree{p}", 5 * GiB)
+    return simulator
+
+
+def run_pipeline(simulator, threshold=80):
+    """
+    Run the whole pipeline of script.py against a simulated host and measure each phase.
+
+    Args:
+        simulator (SimulatedExecutor): the host, or a ReplayExecutor of a recorded one.
+        threshold (int, optional): Use% from which a filesystem is extended. Defaults to 80.
+
+    Returns:
+        dict: phase -> {"seconds", "subprocesses", "rss_kb"} (peak RSS of the process at the end of the phase).
+    """
+    results = {}
+    state = {}
+    previous = set_executor(simulator)
+    core.scanned = False
+
+    def measure(phase, function):
+        calls, start = simulator.calls, perf_counter()
+        value = function()
+        results[phase] = {"seconds": round(perf_counter() - start, 4), "subprocesses": simulator.calls - calls,
+                          "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+        return value
+
+    try:
+        with tempfile.TemporaryDirectory() as lock_dir:
+            state["filesystems"] = measure("probe", core.scan)
+            state["sorted"] = measure("sort", lambda: core.calculate_and_sort_filesystems(state["filesystems"]))
+            to_extend = measure("busy", lambda: [obj for obj in state["sorted"] if obj["Use%"] >= threshold and not is_filesystem_busy(obj["Mount Point"])])
+            plan = measure("plan", lambda: core.plan_extensions([obj["Filesystem"].split("/")[-1] for obj in to_extend], sizes=core.size_extensions(to_extend)))
+            pool = ExtensionPool(locks=LockManager(lock_dir))
+            measure("extend", lambda: pool.run(to_extend, partial(core.treat_filesystem, plan=plan), dm_name=lambda obj: obj["Filesystem"].split("/")[-1]))
+            pool.shutdown()
+    finally:
+        set_executor(previous)
+        core.scanned = False
+    return results
+
+
+def benchmark_size(lvs, seed=0, repeat=REPEAT):
+    """
+    Run the pipeline against a host of the given number of LVs (in a fresh process, see run).
+
+    The host is generated again for each repetition and the fastest time of each phase is kept, the others
+    are mostly scheduler and filesystem noise.
+    """
+    logging.disable(logging.CRITICAL)  # thousands of extensions would flood the log
+    best = None
+    for _ in range(repeat):
+        results = run_pipeline(generate_topology(max(lvs // LVS_PER_VG, 1), min(lvs, LVS_PER_VG), seed=seed))
+        if best is None:
+            best = results
+            continue
+        for phase, measures in results.items():
+            best[phase]["seconds"] = min(best[phase]["seconds"], measures["seconds"])
+            best[phase]["rss_kb"] = max(best[phase]["rss_kb"], measures["rss_kb"])
+    return best
+
+
+def benchmark_fixture(path, repeat=REPEAT):
+    """Run the pipeline against a recorded host (see recording.py), answered at once, keeping the fastest run."""
+    logging.disable(logging.CRITICAL)
+    best = None
+    for _ in range(repeat):
+        results = run_pipeline(ReplayExecutor.load(path, speed=0))
+        if best is None:
+            best = results
+            continue
+        for phase, measures in results.items():
+            best[phase]["seconds"] = min(best[phase]["seconds"], measures["seconds"])
+            best[phase]["rss_kb"] = max(best[phase]["rss_kb"], measures["rss_kb"])
+    return best
+
+
+def run(sizes=SIZES, seed=0, repeat=REPEAT, fixtures=()):
+    """
+    Benchmark every host size and every recorded host, each in a fresh process so the peak RSS of one doesn't hide the next.
+
+    Returns:
+        dict: number of LVs (as a string, like in the baseline) or name of the archive -> phase -> measures.
+    """
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for lvs in sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as process:
+            results[str(lvs)] = process.submit(benchmark_size, lvs, seed, repeat).result()
+    for path in fixtures:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as process:
+            results[os.path.basename(path)] = process.submit(benchmark_fixture, path, repeat).result()
+    return results
+
+
+def machine():
+    """
+    Describe the machine and the Python running the benchmark, stored with the baseline.
+
+    Returns:
+        dict: host name, system, CPU model and count, Python implementation and version.
+    """
+    cpu = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as file:
+            cpu = next((line.split(":", 1)[1].strip() for line in file if line.startswith("model name")), cpu)
+    except OSError:
+        pass
+    return {"host": platform.node(), "system": f"{platform.system()} {platform.machine()}", "cpu": cpu,
+            "cpus": os.cpu_count(), "python": f"{platform.python_implementation()} {platform.python_version()}"}
+
+
+def compare(results, baseline, same_machine=True):
+    """
+    Compare the results with the baseline.
+
+    The number of commands of a phase doesn't depend on the machine and is always compared. The times and the
+    peak RSS are only compared with a baseline recorded on the same machine and Python (see machine()).
+
+    Args:
+        results (dict): the results of run().
+        baseline (dict): the stored results of a previous run().
+        same_machine (bool, optional): the baseline was recorded on this machine. Defaults to True.
+
+    Returns:
+        list: one message per regression, empty if there is none.
+    """
+    regressions = []
+    for lvs, phases in results.items():
+        for phase, measures in phases.items():
+            reference = baseline.get(lvs, {}).get(phase)
+            if reference is None:
+                continue
+            if measures["subprocesses"] > reference["subprocesses"]:
+                regressions.append(f"{lvs} LVs, {phase}: {measures['subprocesses']} subprocesses instead of {reference['subprocesses']}")
+            if not same_machine:
+                continue
+            if measures["seconds"] > reference["seconds"] * TIME_TOLERANCE and measures["seconds"] - reference["seconds"] > TIME_FLOOR:
+                regressions.append(f"{lvs} LVs, {phase}: {measures['seconds']}s instead of {reference['seconds']}s")
+            if measures["rss_kb"] > reference["rss_kb"] * RSS_TOLERANCE:
+                regressions.append(f"{lvs} LVs, {phase}: peak RSS {measures['rss_kb']} kB instead of {reference['rss_kb']} kB")
+    return regressions
+
+
+def format_results(results):
+    width = max([6] + [len(host) for host in results])
+    lines = [f"{'LVs':>{width}} {'phase':<8} {'seconds':>9} {'subprocesses':>13} {'peak RSS kB':>12}"]
+    for lvs, phases in results.items():
+        for phase in PHASES:
+            measures = phases[phase]
+            lines.append(f"{lvs:>{width}} {phase:<8} {measures['seconds']:>9.4f} {measures['subprocesses']:>13} {measures['rss_kb']:>12}")
+    return "\n".join(lines)
+
+
+def main(args):
+    """
+    Run the benchmark and compare it with the baseline, or store it as the baseline (--save-baseline).
+
+    The baseline holds the machine it was recorded on: the times and memory only gate on that machine, other
+    machines only gate on the command counts. Regenerate it on the machine that runs the check (e.g. the CI
+    runner) after an intended change or a change of machine or Python, with the default sizes and seed.
+
+    Returns:
+        int: the exit status, 1 if a phase regressed.
+    """
+    repeat = max(args.repeat, MIN_REPEAT)
+    if repeat != args.repeat:
+        print(f"Running each host {repeat} times (--repeat {args.repeat}): the times are compared on the fastest of at least {MIN_REPEAT} runs.")
+    results = run(args.sizes, args.seed, repeat, args.fixture)
+    print(format_results(results))
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump({"machine": machine(), "results": results}, file, indent=2)
+        print(f"Saved the baseline to {args.baseline}.")
+        return 0
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create it.")
+        return 0
+    recorded_on = baseline.get("machine")
+    same_machine = recorded_on == machine()
+    if not same_machine:
+        print(f"The baseline was recorded on another machine or Python ({recorded_on or 'unknown'}): only the command counts are compared. "
+              f"Run with --save-baseline on this machine to compare the times and memory.")
+    regressions = compare(results, baseline.get("results", {}), same_machine)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
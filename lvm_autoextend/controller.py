@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import signal
+from .executor import COMMAND_TIMEOUTS
+from .protocol import ProtocolError, open_connection, read_message, read_token, write_message
+
+INTERVAL = 300  # seconds between two rounds: poll every agent, then extend the candidates
+MAX_HEAVY = 1  # heavy operations (fsck, donor shrink) running at the same time on the hosts of one SAN
+CONNECT_TIMEOUT = 10  # seconds to connect to an agent
+SNAPSHOT_TIMEOUT = 300  # seconds an agent may take to scan its host
+# The commands of the longest extension an agent runs: a donor shrink, then an offline extension
+EXTENSION_COMMANDS = ("umount", "e2fsck", "resize2fs", "lvreduce", "resize2fs", "mount",
+                      "umount", "e2fsck", "lvextend", "resize2fs", "mount")
+# seconds an agent may take to extend, every command running until its timeout: an agent that hangs or is
+# cut off then gives back its heavy slot instead of holding it forever
+EXTEND_TIMEOUT = sum(COMMAND_TIMEOUTS[command] for command in EXTENSION_COMMANDS) + SNAPSHOT_TIMEOUT
+
+
+def urgency(candidate):
+    """Sort key of the candidates of the fleet: the soonest full first, then the fullest."""
+    time_to_full = candidate["time_to_full"]
+    return (time_to_full if time_to_full is not None else float("inf"), -candidate["use_percent"])
+
+
+class Controller:
+    """
+    Polls many agents (see agent.py) concurrently, keeps a fleet-wide view of their candidates and schedules
+    their extensions.
+
+    Every round, all the agents are asked for a snapshot at once. The candidates of the whole fleet are then
+    started in order of urgency, each on its own agent, except that at most `max_heavy` heavy operations
+    (unmount and fsck, or donor shrink) run at the same time on the hosts of a SAN. A host that doesn't
+    tell its SAN is a SAN of its own. An unreachable agent is reported and retried at the next round.
+    """
+
+    def __init__(self, agents, interval=INTERVAL, max_heavy=MAX_HEAVY, token=None, snapshot_timeout=SNAPSHOT_TIMEOUT, extend_timeout=EXTEND_TIMEOUT):
+        self.agents = list(agents)  # addresses of the agents (see protocol.parse_address)
+        self.interval = interval
+        self.max_heavy = max_heavy
+        self.token = token
+        self.snapshot_timeout = snapshot_timeout
+        self.extend_timeout = extend_timeout
+        self.hosts = {}  # address -> last snapshot of the agent, or {"error": ...} if it failed
+        self.heavy_slots = {}  # SAN -> semaphore of its heavy operations
+        self.stopping = None
+
+    async def request(self, address, message, timeout=None):
+        """
+        Send one request to an agent and wait for its answer.
+
+        Args:
+            address (str): the agent.
+            message (dict): the request (see Agent).
+            timeout (float, optional): seconds to wait for the answer. Defaults to no limit.
+
+        Returns:
+            dict: the answer.
+
+        Raises:
+            ProtocolError: the agent answered with an error.
+            OSError, asyncio.TimeoutError: the agent can't be reached or didn't answer in time.
+        """
+        if self.token is not None:
+            message = {**message, "token": self.token}
+        reader, writer = await asyncio.wait_for(open_connection(address), CONNECT_TIMEOUT)
+        try:
+            await write_message(writer, message)
+            answer = await asyncio.wait_for(read_message(reader), timeout)
+        finally:
+            writer.close()
+        if answer is None:
+            raise ProtocolError("connection closed without an answer")
+        if not answer.get("ok"):
+            raise ProtocolError(answer.get("error", "unknown error"))
+        return answer
+
+    async def poll(self):
+        """Ask every agent for a snapshot at once."""
+        answers = await asyncio.gather(*(self.request(address, {"op": "snapshot", "horizon": self.interval}, self.snapshot_timeout)
+                                         for address in self.agents), return_exceptions=True)
+        for address, answer in zip(self.agents, answers):
+            if isinstance(answer, Exception):
+                logging.error(f"Controller : Error polling the agent {address}: {answer!r}")
+                self.hosts[address] = {"error": str(answer) or repr(answer)}
+            else:
+                self.hosts[address] = answer
+
+    def fleet_view(self):
+        """
+        Get the candidates of the whole fleet, the most urgent first.
+
+        Returns:
+            list: (agent address, candidate) tuples.
+        """
+        view = [(address, candidate) for address, snapshot in self.hosts.items() for candidate in snapshot.get("candidates", [])]
+        return sorted(view, key=lambda item: urgency(item[1]))
+
+    def name(self, address):
+        """Name of an agent in the logs: its host name and its address (agents on one host share the host name)."""
+        return f"{self.hosts[address].get('host', '?')} ({address})"
+
+    def heavy_slot(self, address):
+        san = self.hosts[address].get("san") or address
+        if san not in self.heavy_slots:
+            self.heavy_slots[san] = asyncio.Semaphore(self.max_heavy)
+        return self.heavy_slots[san]
+
+    async def extend(self, address, candidate):
+        """Have an agent run the extension of one of its candidates, in a heavy slot of its SAN if it's heavy."""
+        slot = self.heavy_slot(address) if candidate["heavy"] else None
+        if slot is not None:
+            await slot.acquire()
+        try:
+            answer = await self.request(address, {"op": "extend", "lv": candidate["lv"]}, self.extend_timeout)
+        except (OSError, ProtocolError, asyncio.TimeoutError) as e:
+            logging.error(f"Controller : Error extending {candidate['lv']} on {address}: {e!r}")
+            return False
+        finally:
+            if slot is not None:
+                slot.release()
+        logging.info(f"Controller : {'Extended' if answer['extended'] else 'Failed to extend'} {candidate['kind']} {candidate['lv']} on {self.name(address)}.")
+        return answer["extended"]
+
+    async def schedule(self):
+        """
+        Start the extensions of the fleet in order of urgency (the semaphores wake their waiters in order).
+
+        Returns:
+            int: the number of successful extensions.
+        """
+        tasks = []
+        for address, candidate in self.fleet_view():
+            if not candidate["feasible"]:
+                logging.critical(f"Controller : There's no available space for extending {candidate['lv']} on {self.name(address)}.")
+            elif candidate["busy"]:
+                logging.warning(f"Controller : {candidate['mount_point']} on {self.name(address)} is in use. Retrying at the next round.")
+            else:
+                tasks.append(asyncio.create_task(self.extend(address, candidate)))
+        return sum(await asyncio.gather(*tasks))
+
+    def log_view(self):
+        """Log the state of every agent and the candidates of the fleet."""
+        for address, snapshot in self.hosts.items():
+            if "error" in snapshot:
+                logging.warning(f"Controller : {address}: unreachable ({snapshot['error']}).")
+                continue
+            logging.info(f"Controller : {self.name(address)}, SAN {snapshot['san'] or '-'}: {len(snapshot['filesystems'])} filesystems, "
+                         f"{len(snapshot['pools'])} thin pools, {len(snapshot['candidates'])} to extend.")
+        for address, candidate in self.fleet_view():
+            time_to_full = f"{candidate['time_to_full']:.0f}s" if candidate["time_to_full"] is not None else "unknown"
+            logging.info(f"Controller : {self.name(address)} {candidate['kind']} {candidate['lv']}: {candidate['use_percent']}% full, "
+                         f"full in {time_to_full}, +{candidate['size']} bytes{' (heavy)' if candidate['heavy'] else ''}.")
+
+    async def round(self):
+        await self.poll()
+        self.log_view()
+        extended = await self.schedule()
+        reachable = sum(1 for snapshot in self.hosts.values() if "error" not in snapshot)
+        logging.info(f"Controller : round done, {extended} extensions on {reachable}/{len(self.agents)} hosts.")
+        return extended
+
+    async def run(self, once=False):
+        """Run a round every `interval` seconds until SIGTERM or SIGINT is received (a single one if `once`)."""
+        loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stopping.set)
+
+        logging.info(f"Controller : started with {len(self.agents)} agents.")
+        while not self.stopping.is_set():
+            await self.round()
+            if once:
+                break
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+        logging.info("Controller : Exiting.")
+
+
+def main(args):
+    controller = Controller(args.agents, interval=args.interval, max_heavy=args.max_heavy, token=read_token(args.token_file),
+                            extend_timeout=args.extend_timeout or EXTEND_TIMEOUT)
+    asyncio.run(controller.run(once=args.once))
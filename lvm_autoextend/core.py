@@ -0,0 +1,475 @@
+import logging
+import threading
+from . import metrics
+from .executor import get_executor, run_command, run_lvm
+from .filesystems import get_filesystem_type, is_filesystem_busy, unmount_filesystem, reduce_filesystem, remount_filesystem, scan_filesystems
+from .planner import plan_growth
+from .sizing import extension_size, metadata_extension_size
+from .thinpools import metadata_usage, pool_usage
+from .topology import FULLREPORT_ARGS, load_pools, load_topology
+from .units import convert_to_bytes
+
+ONLINE_GROW_TYPES = ("ext3", "ext4", "xfs")  # filesystems that can be grown while mounted
+EXT_TYPES = ("ext2", "ext3", "ext4")  # filesystems checked with e2fsck and grown with resize2fs while unmounted
+
+# State of the last scan, filled by scan() (nothing is probed at import time) and kept up to date by
+# execute_steps with the effect of each command, so a long run doesn't need a new scan after each extension
+topology = None
+pvs = []
+lvs = []
+parsed_objects = []
+scanned = False
+scan_lock = threading.Lock()  # the workers of an ExtensionPool may all need the first scan at once
+
+
+def scan():
+    """
+    Probe the host: load the LVM topology and the usage of every mounted logical volume.
+
+    Returns:
+        list: the parsed filesystems.
+    """
+    global topology, pvs, lvs, parsed_objects, scanned
+    # Load the PVs, VGs and LVs with a single lvm fullreport call
+    with metrics.phase_duration.time("probe_topology"):
+        topology = load_topology()
+    pvs = topology.pvs
+    lvs = topology.lvs
+    with metrics.phase_duration.time("probe_usage"):
+        parsed_objects = scan_filesystems()
+    topology.index_filesystems(parsed_objects)
+    metrics.record_host(parsed_objects, topology)
+    scanned = True
+    return parsed_objects
+
+
+def ensure_scanned():
+    """
+    Run scan() if the host was not probed yet in this process.
+
+    Safe from several workers: a single one scans, the others wait for its topology instead of replacing it
+    while it's planned against. Entry points should still scan before unmounting anything, as a scan doesn't
+    see the unmounted filesystems.
+    """
+    if scanned:
+        return
+    with scan_lock:
+        if not scanned:
+            scan()
+
+
+def refresh_vg(vg_name):
+    """
+    Reload one VG, its PVs and its LVs into the topology (a report of that VG only, not a new scan).
+
+    Args:
+        vg_name (str): the VG whose state is uncertain (e.g. after a failed command).
+    """
+    try:
+        with metrics.phase_duration.time("refresh"):
+            topology.replace_vg(vg_name, load_topology(FULLREPORT_ARGS + [vg_name]))
+        logging.info(f"Reloaded the topology of {vg_name}.")
+    except Exception as e:
+        logging.error(f"Error reloading the topology of {vg_name}: {e}")
+
+
+def scan_pools():
+    """
+    Get the fill of the data and metadata of every thin pool, from the last scan or refresh_pools().
+
+    Returns:
+        list: the usage of each pool (see thinpools.pool_usage).
+    """
+    ensure_scanned()
+    return [pool_usage(pool) for pool in topology.thin_pools]
+
+
+def refresh_pools():
+    """
+    Read the fill of the thin pools again (a report of the pools alone, not a new scan).
+
+    Returns:
+        list: the usage of each pool (see thinpools.pool_usage).
+    """
+    ensure_scanned()
+    with metrics.phase_duration.time("probe_pools"):
+        topology.update_pools(load_pools())
+    pools = scan_pools()
+    metrics.record_pools(pools)
+    return pools
+
+
+def refresh_usage(fs):
+    """Update the usage of a parsed filesystem in place (a single statvfs, see Executor.usage)."""
+    try:
+        fs.update(get_executor().usage(fs["Mount Point"]))
+    except OSError as e:
+        logging.error(f"Error reading the usage of {fs['Mount Point']}: {e}")
+
+
+def get_writing_speed(device, interval=1):
+    """
+    Get the writing speed of a device from the sampler of the current executor
+    
+    Args:
+        device (str): device name
+        interval (int, optional): length of the sample window if no sample was taken yet. Defaults to 1.
+        
+        Returns:
+            float: writing speed of the device in kB/s
+    """
+    return get_executor().writing_speed(device, interval)
+
+
+def calculate_and_sort_filesystems(file_systems):
+    """
+    calculate the writing speed of each filesystem and sort them by descending order
+
+    Args:
+        file_systems (list): list of filesystems
+
+    Returns:
+            list: sorted list of filesystems
+    """
+    with metrics.phase_duration.time("write_sampling"):
+        get_executor().sample_writes() # a single sample window for all the filesystems
+        for fs in file_systems:
+            fs["writing_speed"] = get_writing_speed(fs["Filesystem"])
+
+    sorted_file_systems = sorted(file_systems, key=lambda fs: fs["writing_speed"] or 0, reverse=True)
+    return sorted_file_systems
+
+
+def size_extensions(file_systems, forecaster=None):
+    """
+    Choose the increment of each filesystem to extend (see sizing.extension_size).
+
+    Args:
+        file_systems (list): the parsed filesystems to extend, in order of priority.
+        forecaster (UsageForecaster, optional): their fill rates and previous grows. Defaults to none known.
+
+    Returns:
+        dict: name of each LV under /dev/mapper -> bytes to add.
+    """
+    ensure_scanned()
+    vg_free = {}  # VG name -> free bytes not given to a previous filesystem yet
+    sizes = {}
+    for fs in file_systems:
+        lv_name = fs["Filesystem"].split("/")[-1]
+        lv = topology.lv(lv_name)
+        if lv is None or lv.vg is None:
+            sizes[lv_name] = int(convert_to_bytes("1G"))
+            continue
+        growth_rate = forecaster.growth_rate(fs["Mount Point"]) if forecaster is not None else None
+        recent_grows = forecaster.recent_grows(fs["Mount Point"]) if forecaster is not None else 0
+        if lv.is_thin:  # grows its virtual size only, the VG is not touched
+            sizes[lv_name] = extension_size(lv.lv_size, growth_rate, None, recent_grows)
+            continue
+        free = vg_free.setdefault(lv.vg_name, lv.vg.free_count * lv.vg.extent_size)
+        sizes[lv_name] = extension_size(lv.lv_size, growth_rate, free, recent_grows)
+        vg_free[lv.vg_name] = max(free - sizes[lv_name], 0)
+    return sizes
+
+
+def size_pool_extensions(pools, forecaster, threshold, horizon=0):
+    """
+    Choose the thin pools to extend and the increment of their data and of their metadata.
+
+    The data and the metadata are forecast separately (see UsageForecaster.should_extend): the data grows
+    like a filesystem (see sizing.extension_size), the metadata by sizing.metadata_extension_size.
+
+    Args:
+        pools (list): the usage of the thin pools (see scan_pools).
+        forecaster (UsageForecaster): their fill rates and previous grows.
+        threshold (int): Use% from which the data or the metadata is extended when its trend is unknown.
+        horizon (float, optional): seconds until the pools are checked again. Defaults to 0.
+
+    Returns:
+        dict: name under /dev/mapper of each pool to extend -> (bytes of data, bytes of metadata) to add.
+    """
+    ensure_scanned()
+    sizes = {}
+    for usage in pools:
+        pool_name = usage["Filesystem"].split("/")[-1]
+        pool = topology.lv(pool_name)
+        if pool is None or pool.vg is None:
+            continue
+        data = metadata = 0
+        recent_grows = forecaster.recent_grows(usage["Mount Point"])
+        if forecaster.should_extend(usage, threshold, horizon):
+            data = extension_size(pool.lv_size, forecaster.growth_rate(usage["Mount Point"]),
+                                  pool.vg.free_count * pool.vg.extent_size, recent_grows)
+        metadata_fill = metadata_usage(usage)
+        if forecaster.should_extend(metadata_fill, threshold, horizon):
+            metadata = metadata_extension_size(pool.metadata_size, forecaster.growth_rate(metadata_fill["Mount Point"]), recent_grows)
+            if not metadata:
+                logging.critical(f"The metadata of the thin pool {pool_name} is {metadata_fill['Use%']}% full and can't grow any more.")
+        if data or metadata:
+            sizes[pool_name] = (data, metadata)
+    return sizes
+
+
+def plan_extensions(lv_names, Size="1G", sizes=None, pools=None):
+    """
+    Plan where the space of a set of LVs comes from, before any LVM command is run (see planner.plan_growth).
+
+    Args:
+        lv_names (list): names of the LVs to extend under /dev/mapper, in order of priority.
+        Size (str, optional): The size to add to each logical volume. Defaults to "1G".
+        sizes (dict, optional): bytes to add to each LV (see size_extensions), instead of Size.
+        pools (dict, optional): thin pools to extend before the LVs (see size_pool_extensions), a full pool
+            stops all its thin LVs.
+
+    Returns:
+        Plan: the steps of each LV that can be extended and the missing bytes of the others.
+    """
+    ensure_scanned()
+    sizes = sizes or {}
+    pools = pools or {}
+    demands = {pool_name: data + metadata for pool_name, (data, metadata) in pools.items()}
+    demands.update((lv_name, sizes.get(lv_name) or int(convert_to_bytes(Size))) for lv_name in lv_names if lv_name not in demands)
+    with metrics.phase_duration.time("plan"):
+        return plan_growth(topology, parsed_objects, demands, is_busy=is_filesystem_busy,
+                           writing_speed=get_writing_speed, filesystem_type=get_filesystem_type,
+                           metadata={pool_name: metadata for pool_name, (_, metadata) in pools.items()})
+
+
+def execute_steps(steps, resize_fs=False):
+    """
+    Run the steps of a plan once, in order, and stop at the first failure.
+
+    The effect of each successful step is applied to the topology. After a failure, or a donor shrink
+    (whose lvreduce may fail while the filesystem is restored), the VG is reloaded instead.
+
+    Args:
+        steps (list): the steps of one LV (see planner.Step), the last one is its lvextend.
+        resize_fs (bool, optional): Grow the filesystem together with the LV (lvextend -r). Defaults to False.
+
+    Returns:
+        bool: True if every step succeeded, False otherwise.
+    """
+    for step in steps:
+        logging.info(f"Plan step: {step.describe()}")
+        lv = step.target if step.action in ("lvremove", "lvreduce", "lvextend", "poolmetadata") else None
+        if lv is not None:
+            lv = topology.lv(lv.dm_name) or lv  # the VG may have been reloaded since the plan
+        if step.action == "vgextend":
+            c = run_lvm(["vgextend", step.vg, step.target])
+        elif step.action == "lvremove":
+            c = run_lvm(["lvremove", "-f", lv.dm_path])
+        elif step.action == "lvreduce":
+            c = run_lvm(["lvreduce", "-f", "-L", f"-{step.size}b", lv.dm_path])
+        elif step.action == "shrink":
+            fs = step.target
+            donor = fs["Filesystem"].split("/")[-1]
+            with metrics.phase_duration.time("donor_shrink"):
+                fs_type = get_filesystem_type(fs["Mount Point"])  # read while it's mounted
+                if not unmount_filesystem(fs["Mount Point"]):
+                    logging.error(f"Error unmounting donor filesystem at {fs['Mount Point']}.")
+                    return False
+                reduced = reduce_filesystem(donor, fs_type, fs["Mount Point"], f"{(step.lv.lv_size - step.size) // 1024}K")  # the new size of its LV
+                remount_filesystem(donor, fs["Mount Point"])
+            refresh_vg(step.vg)
+            refresh_usage(fs)
+            if not reduced:
+                return False
+            continue
+        elif step.action == "poolmetadata":
+            c = run_lvm(["lvextend", "--poolmetadatasize", f"+{step.size}b", lv.dm_path])
+        else:  # lvextend
+            command = ["lvextend", "-L", f"+{step.size}b", lv.dm_path]
+            if resize_fs:
+                command.insert(1, "-r")
+            c = run_lvm(command)
+        if c.returncode != 0:
+            logging.error(f"Plan step {step.describe()} failed: {c.stderr}")
+            refresh_vg(step.vg)
+            return False
+        logging.info(c.stdout)
+        if step.action == "vgextend":
+            topology.add_pv(topology.pv(step.target), topology.vg(step.vg))
+        elif step.action == "lvremove":
+            topology.remove_lv(lv)
+        elif step.action == "lvreduce":
+            topology.resize_lv(lv, -step.size)
+        elif step.action == "poolmetadata":
+            topology.resize_pool_metadata(lv, step.size)
+        else:
+            topology.resize_lv(lv, step.size)
+    return True
+
+
+def extendLV(lvName, Size="1G", resize_fs=False, steps=None):
+    """
+    Extends the logical volume (LV) with the specified name by the given size.
+
+    The space is planned first (free extents, free PVs, unused LVs, then donor filesystems), so nothing is
+    reduced or removed if the extension can't be done, and the plan is run once.
+
+    Args:
+        lvName (str): The name of the logical volume to extend.
+        Size (str, optional): The size to add to the logical volume. Defaults to "1G".
+        resize_fs (bool, optional): Grow the filesystem together with the LV (lvextend -r), which works on a
+            mounted ext3/ext4/xfs filesystem. Defaults to False.
+        steps (list, optional): The steps planned for this LV by plan_extensions. Defaults to planning it alone.
+
+    Returns:
+        bool: True if the logical volume was successfully extended, False otherwise.
+    """
+    if steps is None:
+        plan = plan_extensions([lvName], Size)
+        if lvName in plan.infeasible:
+            logging.critical(f"There's no available space for extending {lvName}.")
+            return False
+        steps = plan.steps[lvName]
+    return execute_steps(steps, resize_fs)
+
+
+def append_filesystem(lv_name, filesystem_type, mount_point, steps=None, Size="1G"):
+    """
+    Extend the unmounted filesystem of the given mount point.
+
+    An ext2/3/4 filesystem is checked with e2fsck then grown with resize2fs while unmounted. xfs can only be
+    grown mounted (and has no e2fsck), so it's remounted and grown with xfs_growfs. Other types aren't extended.
+
+    Args:
+        lv_name (str): The name of the logical volume to extend.
+        filesystem_type (str): The type of the filesystem (e.g. ext4), read before it was unmounted (see get_filesystem_type).
+        mount_point (str): The mount point of the filesystem.
+        steps (list, optional): The steps planned for this LV (see extendLV). Defaults to planning it alone.
+        Size (str, optional): The size to add when the LV is planned alone. Defaults to "1G".
+
+    Returns:
+        bool: True if the filesystem was successfully extended, False otherwise.
+    """
+    if filesystem_type not in EXT_TYPES and filesystem_type != "xfs":
+        logging.error(f"Can't grow the {filesystem_type} filesystem at {mount_point}: only ext2/3/4 and xfs are supported.")
+        return False
+
+    if not extendLV(lv_name, Size, steps=steps): # the filesystem is only resized once its LV was extended
+        return False
+
+    if filesystem_type == "xfs":
+        remount_filesystem(lv_name, mount_point)
+        resize_result = run_command(["xfs_growfs", mount_point])
+    else:
+        # Run e2fsck before resizing
+        check_result = run_command(["e2fsck", "-f", "-y", f"/dev/mapper/{lv_name}"])
+        if check_result.returncode != 0:
+            logging.error(f"Error running e2fsck: {check_result.stderr}")
+            return False
+        resize_result = run_command(["resize2fs", f"/dev/mapper/{lv_name}"])
+
+    if resize_result.returncode != 0:
+        logging.error(f"Error resizing filesystem at {mount_point}: {resize_result.stderr}")
+    else:
+        logging.info(f"Resized filesystem at {mount_point}.")
+
+    return resize_result.returncode == 0
+
+
+def grow_filesystem_online(lv_name, mount_point, steps=None, Size="1G"):
+    """
+    Extend the LV and grow its mounted filesystem in one step (lvextend -r), without unmount, e2fsck or remount.
+
+    Args:
+        lv_name (str): The name of the logical volume to extend.
+        mount_point (str): The mount point of the filesystem.
+        steps (list, optional): The steps planned for this LV (see extendLV). Defaults to planning it alone.
+        Size (str, optional): The size to add when the LV is planned alone. Defaults to "1G".
+
+    Returns:
+        bool: True if the filesystem was successfully extended, False otherwise.
+    """
+    if extendLV(lv_name, Size, resize_fs=True, steps=steps):
+        logging.info(f"Resized filesystem at {mount_point} online.")
+        return True
+    logging.error(f"Error resizing filesystem at {mount_point} online.")
+    return False
+
+
+def can_grow_online(obj):
+    """
+    Check if a filesystem can be grown while mounted.
+
+    Args:
+        obj (dict): The parsed filesystem (see filesystems.scan_filesystems).
+
+    Returns:
+        bool: True if the filesystem type supports online growth.
+    """
+    return get_filesystem_type(obj["Mount Point"]) in ONLINE_GROW_TYPES
+
+
+@metrics.instrument_extension
+def treat_filesystem(obj, online=False, plan=None, Size="1G"):
+    """
+    Extend the filesystem of a parsed filesystem.
+
+    Args:
+        obj (dict): The parsed filesystem (see filesystems.scan_filesystems).
+        online (bool, optional): Grow the filesystem while mounted if its type supports it, even if it's busy.
+            Otherwise it's unmounted, checked, extended and remounted. Defaults to False.
+        plan (Plan, optional): The plan of all the LVs extended in this run (see plan_extensions), so the
+            LVs share the free PVs and donors without conflicts. Defaults to planning this LV alone.
+        Size (str, optional): The size to add when the LV is planned alone. Defaults to "1G".
+
+    Returns:
+        bool: True if the filesystem was successfully extended, False otherwise.
+    """
+    lv_name = obj["Filesystem"].split("/")[-1]  # Extract the LV name from the filesystem path
+    mount_point = obj["Mount Point"]
+    steps = plan.steps.get(lv_name) if plan is not None else None
+    if plan is not None and steps is None:
+        logging.critical(f"There's no available space for extending {lv_name}.")
+        return False
+    if online and can_grow_online(obj):
+        extended = grow_filesystem_online(lv_name, mount_point, steps, Size)
+        if extended:
+            refresh_usage(obj)
+        return extended
+
+    filesystem_type = get_filesystem_type(mount_point) # read from the mount table, so before unmounting
+    if not unmount_filesystem(mount_point): # if the filesystem is busy or can't be unmounted we log it
+        logging.error(f"Error handling filesystem at {mount_point}.")
+        return False
+
+    # Resize and remount the filesystem
+    extended = append_filesystem(lv_name, filesystem_type, mount_point, steps, Size)
+    remount_filesystem(lv_name, mount_point)
+    if extended:
+        refresh_usage(obj)
+    return extended
+
+
+@metrics.instrument_extension
+def treat_pool(usage, plan=None, size=None):
+    """
+    Extend the data and/or the metadata of a thin pool, while its thin LVs stay online.
+
+    Args:
+        usage (dict): The usage of the pool (see scan_pools), updated once it's extended.
+        plan (Plan, optional): The plan of all the LVs and pools extended in this run (see plan_extensions).
+            Defaults to planning this pool alone.
+        size (tuple, optional): (bytes of data, bytes of metadata) to add when the pool is planned alone
+            (see size_pool_extensions).
+
+    Returns:
+        bool: True if the pool was successfully extended, False otherwise.
+    """
+    pool_name = usage["Filesystem"].split("/")[-1]
+    if plan is None:
+        plan = plan_extensions([], pools={pool_name: size})
+    steps = plan.steps.get(pool_name)
+    if steps is None:
+        logging.critical(f"There's no available space for extending the thin pool {pool_name}.")
+        return False
+    if not execute_steps(steps):
+        logging.error(f"Error extending the thin pool {pool_name}.")
+        return False
+    pool = topology.lv(pool_name)
+    if pool is not None:
+        usage.update(pool_usage(pool))
+        metrics.record_pools([usage])
+    logging.info(f"Extended the thin pool {pool_name}: data {usage['Use%']}% full, metadata {usage['Metadata']['Use%']}% full.")
+    return True
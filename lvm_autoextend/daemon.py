@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import signal
+import threading
+from . import core, metrics
+from .executor import get_executor
+from .filesystems import get_filesystem_type, is_filesystem_busy, statvfs_usage
+from .forecast import UsageForecaster
+from .thinpools import add_samples, sample_keys
+from .workers import ExtensionPool, MAX_WORKERS
+
+THRESHOLD = 80  # Use% from which a filesystem is extended
+MIN_INTERVAL = 1  # seconds between two polls of a filesystem at the threshold
+MAX_INTERVAL = 60  # seconds between two polls of an empty filesystem
+RESCAN_INTERVAL = 300  # seconds between two scans of the LVM topology and the mounted filesystems
+
+
+def poll_interval(use_percent, threshold=THRESHOLD, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+    """
+    Get the time to wait before polling a filesystem again: the closer to the threshold, the faster.
+
+    Args:
+        use_percent (int): current Use% of the filesystem.
+        threshold (int, optional): Use% from which the filesystem is extended. Defaults to THRESHOLD.
+        min_interval (float, optional): interval at (or above) the threshold. Defaults to MIN_INTERVAL.
+        max_interval (float, optional): interval of an empty filesystem. Defaults to MAX_INTERVAL.
+
+    Returns:
+        float: seconds to wait.
+    """
+    headroom = max(threshold - use_percent, 0) / threshold  # 1 when empty, 0 at the threshold
+    return min_interval + (max_interval - min_interval) * headroom ** 2
+
+
+class Daemon:
+    """
+    Long-running watcher that extends the filesystems before they are full.
+
+    The topology and the usage of the filesystems are kept in memory. Every filesystem is polled with
+    statvfs by its own task at an adaptive interval (see poll_interval), and extended when its trend says it
+    will be full before an extension started at the next poll ends (see forecast.py). The thin pools are
+    polled together with a single report, and a pool is extended when its data or its metadata is projected
+    full. The blocking LVM/filesystem operations run in a worker pool (one VG at a time per worker) so the
+    event loop never waits for them.
+    """
+
+    def __init__(self, threshold=THRESHOLD, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, rescan_interval=RESCAN_INTERVAL, max_workers=MAX_WORKERS, online=False, metrics_file=None):
+        self.threshold = threshold
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.rescan_interval = rescan_interval
+        self.online = online  # grow the mounted filesystems with lvextend -r when their type allows it
+        self.metrics_file = metrics_file  # Prometheus textfile written after each scan
+        self.filesystems = {}  # mount point -> parsed filesystem
+        self.watchers = {}  # mount point -> polling task
+        self.pool_watcher = None  # polling task of the thin pools
+        self.in_progress = set()  # mount points being extended
+        self.pool = ExtensionPool(max_workers)
+        self.forecaster = UsageForecaster.load()
+        self.stopping = None
+        self.wakeup = None  # set to rescan before the rescan interval, e.g. when the mounts change
+
+    async def run_blocking(self, function, *args):
+        """Run a blocking operation in the worker pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.pool.executor, function, *args)
+
+    async def rescan(self):
+        """Scan the host and start/stop the watchers of the filesystems that were mounted/unmounted."""
+        parsed_objects = await self.run_blocking(core.scan)
+        current = {obj["Mount Point"]: obj for obj in parsed_objects}
+        self.forecaster.forget(list(current) + [key for usage in core.scan_pools() for key in sample_keys(usage)])
+        for mount_point in set(self.watchers) - set(current):
+            self.watchers.pop(mount_point).cancel()
+            self.filesystems.pop(mount_point, None)
+            logging.info(f"Daemon : stopped watching {mount_point}.")
+        for mount_point, obj in current.items():
+            if mount_point in self.filesystems:
+                self.filesystems[mount_point].update(obj)
+            else:
+                self.filesystems[mount_point] = obj
+                self.watchers[mount_point] = asyncio.create_task(self.watch(mount_point))
+                logging.info(f"Daemon : watching {mount_point}.")
+        if self.pool_watcher is None:
+            self.pool_watcher = asyncio.create_task(self.watch_pools())
+
+    def sample(self, obj):
+        """
+        Read the usage of a watched filesystem and record it.
+
+        No sample is taken while the filesystem is unmounted, by its own offline extension or as the donor of
+        another one: statvfs would then report the filesystem holding the mount point.
+
+        Returns:
+            bool: True if the usage was recorded.
+        """
+        mount_point = obj["Mount Point"]
+        if mount_point in self.in_progress:
+            return False
+        try:
+            usage = statvfs_usage(mount_point)  # a single syscall, cheap enough to run on the loop
+        except OSError as e:
+            logging.error(f"Daemon : Error reading the usage of {mount_point}: {e}")
+            return False
+        if get_filesystem_type(mount_point) is None:  # checked after statvfs: the usage read was the one of the LV if it's still mounted
+            logging.debug(f"Daemon : {mount_point} is not mounted, skipping its sample.")
+            return False
+        obj.update(usage)
+        self.forecaster.add(mount_point, obj["Used"], obj["Available"])
+        metrics.record_filesystem(obj)
+        return True
+
+    async def watch(self, mount_point):
+        """Poll the usage of one filesystem and extend it when it's projected full before the next poll."""
+        while not self.stopping.is_set():
+            obj = self.filesystems[mount_point]
+            sampled = self.sample(obj)
+
+            interval = poll_interval(obj["Use%"], self.threshold, self.min_interval, self.max_interval)
+            if sampled and self.forecaster.should_extend(obj, self.threshold, horizon=interval):
+                await self.extend(obj)
+
+            await asyncio.sleep(interval)
+
+    async def watch_pools(self):
+        """Poll the fill of every thin pool with one report and extend the pools projected full before the next poll."""
+        while not self.stopping.is_set():
+            if not core.topology.thin_pools:  # none at the last scan
+                await asyncio.sleep(self.max_interval)
+                continue
+            try:
+                pools = await self.run_blocking(core.refresh_pools)
+            except Exception as e:
+                logging.error(f"Daemon : Error reading the fill of the thin pools: {e}")
+                await asyncio.sleep(self.max_interval)
+                continue
+            for usage in pools:
+                add_samples(self.forecaster, usage)
+
+            fullest = max((max(usage["Use%"], usage["Metadata"]["Use%"]) for usage in pools), default=0)
+            interval = poll_interval(fullest, self.threshold, self.min_interval, self.max_interval)
+            idle = [usage for usage in pools if usage["Mount Point"] not in self.in_progress]
+            sizes = core.size_pool_extensions(idle, self.forecaster, self.threshold, horizon=interval)
+            for usage in idle:
+                size = sizes.get(usage["Filesystem"].split("/")[-1])
+                if size is not None:
+                    await self.extend_pool(usage, size)
+
+            await asyncio.sleep(interval)
+
+    async def extend_pool(self, usage, size):
+        """Extend one thin pool in the worker pool, holding the locks of its VG and LV."""
+        pool_name = usage["Filesystem"].split("/")[-1]
+        logging.info(f"Daemon : Thin pool {pool_name} is {usage['Use%']}% full (metadata {usage['Metadata']['Use%']}%). Extending it.")
+        self.in_progress.add(usage["Mount Point"])
+        try:
+            await asyncio.wrap_future(self.pool.submit(pool_name, self.forecaster.track(core.treat_pool), usage, None, size))
+        finally:
+            self.in_progress.discard(usage["Mount Point"])
+
+    async def extend(self, obj):
+        """Extend one filesystem in the worker pool, holding the locks of its VG and LV."""
+        mount_point = obj["Mount Point"]
+        self.in_progress.add(mount_point)
+        try:
+            dm_name = obj["Filesystem"].split("/")[-1]
+            await asyncio.wrap_future(self.pool.submit(dm_name, self.extend_if_idle, obj))  # the topology follows the extension (see core.execute_steps)
+        finally:
+            self.in_progress.discard(mount_point)
+
+    def extend_if_idle(self, obj):
+        """Extend a filesystem unless it's busy, in which case it's retried at the next poll."""
+        mount_point = obj["Mount Point"]
+        online = self.online and core.can_grow_online(obj)  # a filesystem grown online can be busy
+        if not online and is_filesystem_busy(mount_point):
+            logging.warning(f"Daemon : Filesystem at {mount_point} is in use. Retrying later.")
+            return False
+        logging.info(f"Daemon : Filesystem at {mount_point} is {obj['Use%']}% full. Extending it.")
+        size = core.size_extensions([obj], self.forecaster)[obj["Filesystem"].split("/")[-1]]
+        return self.forecaster.track(core.treat_filesystem)(obj, online, Size=f"{size}b")
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+    def watch_mounts(self, loop, stop):
+        """Rescan as soon as a filesystem is mounted or unmounted, if the backend can tell (see mounts.MountTable)."""
+        backend = get_executor()
+        table = getattr(backend, "mount_table", None) or getattr(getattr(backend, "inner", None), "mount_table", None)  # a recording wraps the host
+        if table is None:
+            return
+        thread = threading.Thread(target=table.watch, args=(lambda: loop.call_soon_threadsafe(self.wakeup.set), stop), name="mount-watch", daemon=True)
+        thread.start()
+
+    async def run(self):
+        """Watch the filesystems until SIGTERM or SIGINT is received."""
+        loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.wakeup = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stop)
+        stop_watching = threading.Event()
+        self.watch_mounts(loop, stop_watching)
+
+        logging.info("Daemon : started.")
+        while not self.stopping.is_set():
+            self.wakeup.clear()
+            try:
+                await self.rescan()
+            except Exception as e:
+                logging.error(f"Daemon : Error scanning the host: {e}")
+            self.write_metrics()
+            self.save_forecast()  # a crash loses the samples of one rescan interval at most
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.rescan_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        stop_watching.set()
+        tasks = list(self.watchers.values()) + ([self.pool_watcher] if self.pool_watcher is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.pool.shutdown(wait=True)  # let the running extensions finish
+        self.save_forecast()
+        self.write_metrics()
+        logging.info("Daemon : Exiting.")
+
+    def save_forecast(self):
+        try:
+            self.forecaster.save()
+        except OSError as e:
+            logging.error(f"Daemon : Error saving the usage samples: {e}")
+
+    def write_metrics(self):
+        if self.metrics_file is None:
+            return
+        try:
+            metrics.write_textfile(self.metrics_file)
+        except OSError as e:
+            logging.error(f"Daemon : Error writing the metrics to {self.metrics_file}: {e}")
+
+
+def main(args):
+    daemon = Daemon(threshold=args.threshold, min_interval=args.min_interval, max_interval=args.max_interval, rescan_interval=args.rescan_interval, max_workers=args.workers, online=args.online, metrics_file=args.metrics_file)
+    server = metrics.serve(args.metrics_port) if args.metrics_port else None
+    try:
+        asyncio.run(daemon.run())
+    finally:
+        if server is not None:
+            server.shutdown()
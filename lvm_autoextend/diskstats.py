@@ -0,0 +1,105 @@
+import os
+import logging
+from time import monotonic, sleep
+
+DISKSTATS_PATH = "/proc/diskstats"
+SECTOR_SIZE = 512  # /proc/diskstats always counts 512-byte sectors, whatever the real sector size of the device
+DM_PREFIX = "dm-"  # kernel name of device-mapper devices (the LVs)
+
+
+def resolve_device(device):
+    """
+    Resolve a device path to its kernel name as it appears in /proc/diskstats.
+
+    Args:
+        device (str): device path or name (e.g. /dev/mapper/vg-lv, /dev/dm-3 or dm-3).
+
+    Returns:
+        str: kernel name of the device (e.g. dm-3).
+    """
+    return os.path.basename(os.path.realpath(device)) if device.startswith("/") else device
+
+
+def read_diskstats(path=DISKSTATS_PATH, prefix=DM_PREFIX):
+    """
+    Read the cumulative written sectors of every block device in one pass.
+
+    Args:
+        path (str, optional): path of the diskstats file. Defaults to /proc/diskstats.
+        prefix (str, optional): only keep the devices whose name starts with this prefix. Defaults to "dm-".
+
+    Returns:
+        dict: kernel device name -> number of sectors written since boot.
+    """
+    counters = {}
+    with open(path) as file:
+        for line in file:
+            fields = line.split()
+            if len(fields) < 10 or not fields[2].startswith(prefix):
+                continue
+            counters[fields[2]] = int(fields[9])  # field 10 is the number of sectors written
+    return counters
+
+
+class DiskStatsSampler:
+    """
+    Sample the write throughput of every dm device at once.
+
+    Each call to sample() reads /proc/diskstats once and compares it with the previous reading, so a single
+    window is shared by all the devices instead of running one iostat per device. The throughput of each
+    device is smoothed with an exponentially weighted moving average (EWMA) and kept in a cache.
+    """
+
+    def __init__(self, interval=1, alpha=0.5, path=DISKSTATS_PATH):
+        self.interval = interval  # length of the first sample window in seconds
+        self.alpha = alpha  # weight of the newest sample in the EWMA
+        self.path = path
+        self.speeds = {}  # kernel device name -> EWMA write throughput in kB/s
+        self._counters = None
+        self._timestamp = None
+
+    def sample(self, interval=None):
+        """
+        Update the write throughput of every device.
+
+        The first call reads the counters twice, `interval` seconds apart. Later calls reuse the previous
+        reading as the start of the window and do not sleep.
+
+        Args:
+            interval (int, optional): length of the first window in seconds. Defaults to the sampler interval.
+
+        Returns:
+            dict: kernel device name -> EWMA write throughput in kB/s.
+        """
+        if self._counters is None:
+            self._counters, self._timestamp = read_diskstats(self.path), monotonic()
+            sleep(self.interval if interval is None else interval)
+
+        counters, timestamp = read_diskstats(self.path), monotonic()
+        elapsed = timestamp - self._timestamp
+        if elapsed > 0:
+            for name, sectors in counters.items():
+                previous = self._counters.get(name)
+                if previous is None or sectors < previous:  # new device or counter reset
+                    continue
+                speed = (sectors - previous) * SECTOR_SIZE / 1024 / elapsed
+                cached = self.speeds.get(name)
+                self.speeds[name] = speed if cached is None else self.alpha * speed + (1 - self.alpha) * cached
+            self._counters, self._timestamp = counters, timestamp
+        logging.debug(f"Sampled the write throughput of {len(counters)} devices over {elapsed:.2f}s.")
+        return self.speeds
+
+    def has_sample(self):
+        return self._timestamp is not None
+
+    def get(self, device):
+        """
+        Get the cached write throughput of a device.
+
+        Args:
+            device (str): device path or name.
+
+        Returns:
+            float: EWMA write throughput in kB/s, or None if the device was never sampled.
+        """
+        return self.speeds.get(resolve_device(device))
@@ -0,0 +1,297 @@
+import os
+import abc
+import re
+import shlex
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+from time import perf_counter, sleep
+from . import lvmshell, metrics
+from .diskstats import DiskStatsSampler
+from .mounts import MountTable
+from .openfiles import OpenFileIndex
+
+DEFAULT_TIMEOUT = 600  # seconds a command may run before it's stopped
+COMMAND_TIMEOUTS = {  # the commands that walk a whole filesystem get longer
+    "e2fsck": 4 * 3600, "resize2fs": 4 * 3600, "xfs_growfs": 3600, "lvreduce": 4 * 3600, "lvextend": 3600,
+    "umount": 120, "mount": 120, "fullreport": 120, "lvs": 120,
+}
+MAX_COMMANDS = 16  # external commands running at the same time in the process
+MAX_COMMANDS_PER_DEVICE = 1  # external commands running at the same time on one device or mount point
+LVM_RETRIES = 3  # attempts after the first one of an LVM command that failed to get its lock
+RETRY_BACKOFF = 1  # seconds before the first retry, doubled for each of the next ones
+LOCK_CONTENTION = re.compile(r"Can't get lock|Giving up waiting for lock|Failed to lock|Resource temporarily unavailable")
+
+
+class Executor(abc.ABC):
+    """
+    Backend running the commands and answering the probes of a run.
+
+    Every command and probe of the package goes through the current executor (see set_executor), so a run
+    can be rehearsed against a simulated host (see simulator.py) instead of the real one. A backend must
+    implement every method: one that misses any can't be instantiated.
+    """
+
+    @abc.abstractmethod
+    def run(self, argv, timeout=None):
+        """
+        Run a system command as root.
+
+        Args:
+            argv (list): the command without sudo (e.g. ["umount", "/data"]).
+            timeout (float, optional): seconds the command may run, it's stopped after. Defaults to no limit.
+
+        Returns:
+            CompletedProcess: the return code and the text output of the command.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def run_lvm(self, argv, timeout=None):
+        """
+        Run an LVM command.
+
+        Args:
+            argv (list): the command without `lvm` (e.g. ["lvextend", "-L", "+1G", "/dev/mapper/vg-lv"]).
+            timeout (float, optional): seconds the command may run, it's stopped after. Defaults to no limit.
+
+        Returns:
+            CompletedProcess: the return code and the text output. Its `report` attribute may hold the JSON output.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def is_busy(self, mount_point):
+        """Check if a process holds the filesystem mounted at the given mount point."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def filesystem_type(self, mount_point):
+        """Get the type of the filesystem mounted at the given mount point, None if nothing is mounted there."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def mounted_lvs(self):
+        """
+        Get the mounted device-mapper devices (the LVs).
+
+        Returns:
+            list: (/dev/mapper path, mount point) pairs, one per device.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def usage(self, mount_point):
+        """
+        Get the usage of a mounted filesystem.
+
+        Returns:
+            dict: Size, Used, Available in bytes and Use% rounded up like df does.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def sample_writes(self, interval=None):
+        """Take a new write throughput sample of every device."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def writing_speed(self, device, interval=1):
+        """Get the write throughput of a device in kB/s, sampling it first if needed. None if it's unknown."""
+        raise NotImplementedError
+
+
+class SystemExecutor(Executor):
+    """Runs the commands on the host: LVM commands in the lvm shell (see lvmshell.py), the others with sudo."""
+
+    def __init__(self):
+        self.mount_table = MountTable()  # read again only when the kernel signals a change (see mounts.py)
+        self.busy_index = OpenFileIndex()  # shared index of the processes holding each device (see openfiles.py)
+        self.disk_sampler = DiskStatsSampler()  # shared write throughput sampler (see diskstats.py)
+
+    def run(self, argv, timeout=None):
+        return lvmshell.run_process(["sudo"] + argv, timeout)
+
+    def run_lvm(self, argv, timeout=None):
+        return lvmshell.run_lvm(argv, timeout=timeout)
+
+    def is_busy(self, mount_point):
+        return self.busy_index.is_busy(mount_point)
+
+    def filesystem_type(self, mount_point):
+        return self.mount_table.filesystem_type(mount_point)
+
+    def mounted_lvs(self):
+        return self.mount_table.lv_mounts()
+
+    def usage(self, mount_point):
+        stat = os.statvfs(mount_point)
+        size = stat.f_blocks * stat.f_frsize
+        used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+        available = stat.f_bavail * stat.f_frsize
+        use_percent = -(-used * 100 // (used + available)) if used + available else 0 # ceil, like df
+        return {"Size": size, "Used": used, "Available": available, "Use%": use_percent}
+
+    def sample_writes(self, interval=None):
+        self.disk_sampler.sample(interval)
+
+    def writing_speed(self, device, interval=1):
+        if not self.disk_sampler.has_sample(): # one window samples every device at once, so it's only taken once per run
+            self.disk_sampler.sample(interval)
+        writing_speed = self.disk_sampler.get(device)
+        if writing_speed is None:
+            logging.error(f"Error retrieving writing speed for {device}: device not found in {self.disk_sampler.path}")
+        return writing_speed
+
+
+# Backend of the current process, the host unless set_executor() was called
+executor = SystemExecutor()
+
+
+def get_executor():
+    return executor
+
+
+def set_executor(new_executor):
+    """
+    Replace the backend of the current process.
+
+    Args:
+        new_executor (Executor): the backend of the next commands and probes.
+
+    Returns:
+        Executor: the previous backend.
+    """
+    global executor
+    previous, executor = executor, new_executor
+    return previous
+
+
+# Slots of the commands running at the same time: one pool for the process, one per device
+command_slots = threading.BoundedSemaphore(MAX_COMMANDS)
+device_slots = {}  # device or mount point -> its semaphore
+device_slots_lock = threading.Lock()
+
+
+def command_timeout(argv):
+    return COMMAND_TIMEOUTS.get(argv[0], DEFAULT_TIMEOUT)
+
+
+def command_device(argv):
+    """Get the device (or the mount point) a command works on: its first absolute path argument, None if it has none."""
+    return next((arg for arg in argv[1:] if arg.startswith("/")), None)
+
+
+def is_lock_contention(result):
+    """Check if an LVM command failed because another command held the lock of its VG (nothing was done, it can run again)."""
+    return result.returncode != 0 and LOCK_CONTENTION.search(f"{result.stdout}\n{result.stderr}") is not None
+
+
+@contextmanager
+def command_slot(argv):
+    """Hold a slot of the device of a command, then one of the process, while it runs."""
+    device = command_device(argv)
+    slots = [command_slots]
+    if device is not None:
+        with device_slots_lock:
+            slots.insert(0, device_slots.setdefault(device, threading.BoundedSemaphore(MAX_COMMANDS_PER_DEVICE)))
+    metrics.command_waiting.inc()
+    acquired = []
+    try:
+        for slot in slots:  # the device first, so a command waiting for its device doesn't hold a slot of the process
+            slot.acquire()
+            acquired.append(slot)
+        metrics.command_waiting.dec()
+        yield
+    finally:
+        if len(acquired) < len(slots):
+            metrics.command_waiting.dec()
+        for slot in reversed(acquired):
+            slot.release()
+
+
+def call(argv, lvm, timeout):
+    """Run one attempt of a command with the current backend, within the concurrency limits, and record it."""
+    with command_slot(argv):
+        start = perf_counter()
+        result = executor.run_lvm(argv, timeout) if lvm else executor.run(argv, timeout)
+        seconds = perf_counter() - start
+    output = len(result.stdout or "") + len(result.stderr or "")
+    metrics.command_duration.observe(argv[0], value=seconds)
+    metrics.command_output.observe(argv[0], value=output)
+    if result.returncode != 0:
+        metrics.command_failures.inc(argv[0])
+    if result.returncode == lvmshell.TIMEOUT_RETURNCODE:
+        metrics.command_timeouts.inc(argv[0])
+        logging.error(f"Command : {shlex.join(argv)} was stopped after {timeout}s.")
+    logging.debug(f"Command : {shlex.join(argv)} exited with {result.returncode} in {seconds:.3f}s ({output} bytes of output).",
+                  extra={"command": argv[0], "duration": round(seconds, 6), "returncode": result.returncode})
+    return result
+
+
+def execute(argv, lvm=False, check=False, timeout=None):
+    """
+    Run a command with the current backend: every external command of the package goes through here.
+
+    The command is stopped at its timeout (see COMMAND_TIMEOUTS), waits for a free slot (see MAX_COMMANDS and
+    MAX_COMMANDS_PER_DEVICE), and an LVM command that failed to get the lock of its VG is run again up to
+    LVM_RETRIES times with an exponential back-off. The duration, return code and output size of every
+    attempt are recorded (see metrics.py).
+
+    Args:
+        argv (list): the command, without sudo or `lvm`.
+        lvm (bool, optional): run it as an LVM command. Defaults to False.
+        check (bool, optional): raise CalledProcessError if the command fails. Defaults to False.
+        timeout (float, optional): seconds the command may run. Defaults to command_timeout(argv).
+
+    Returns:
+        CompletedProcess: the return code and the text output of the last attempt.
+    """
+    timeout = command_timeout(argv) if timeout is None else timeout
+    retries = LVM_RETRIES if lvm else 0
+    for attempt in range(retries + 1):
+        result = call(argv, lvm, timeout)
+        if attempt == retries or not is_lock_contention(result):
+            break
+        delay = RETRY_BACKOFF * 2 ** attempt
+        metrics.command_retries.inc(argv[0])
+        logging.warning(f"Command : {argv[0]} couldn't get its LVM lock, retrying in {delay}s.")
+        sleep(delay)
+    return check_result(result, check)
+
+
+def check_result(result, check):
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return result
+
+
+def run_command(argv, check=False, timeout=None):
+    """
+    Run a system command as root with the current backend.
+
+    Args:
+        argv (list): the command without sudo (e.g. ["umount", "/data"]).
+        check (bool, optional): raise CalledProcessError if the command fails. Defaults to False.
+        timeout (float, optional): seconds the command may run. Defaults to command_timeout(argv).
+
+    Returns:
+        CompletedProcess: the return code and the text output of the command.
+    """
+    return execute(argv, check=check, timeout=timeout)
+
+
+def run_lvm(argv, check=False, timeout=None):
+    """
+    Run an LVM command with the current backend.
+
+    Args:
+        argv (list): the command without `lvm` (e.g. ["lvremove", "-f", "/dev/mapper/vg-lv"]).
+        check (bool, optional): raise CalledProcessError if the command fails. Defaults to False.
+        timeout (float, optional): seconds the command may run. Defaults to command_timeout(argv).
+
+    Returns:
+        CompletedProcess: the return code and the text output of the command.
+    """
+    return execute(argv, lvm=True, check=check, timeout=timeout)
@@ -0,0 +1,141 @@
+import subprocess
+import logging
+from . import metrics
+from .executor import get_executor, run_command, run_lvm
+
+
+def scan_filesystems():
+    """
+    Get the usage of every mounted logical volume, in exact bytes (the mount table and one statvfs each, no process is started).
+
+    Returns:
+        list: one dictionary per logical volume (Filesystem, Size, Used, Available, Use%, Mount Point).
+    """
+    executor = get_executor()
+    parsed_objects = []
+    for device, mount_point in executor.mounted_lvs():
+        try:
+            usage = executor.usage(mount_point)
+        except OSError as e:  # unmounted since the mount table was read
+            logging.warning(f"Error reading the usage of {mount_point}: {e}")
+            continue
+        parsed_objects.append({"Filesystem": device, **usage, "Mount Point": mount_point})
+    return parsed_objects
+
+
+def statvfs_usage(mount_point):
+    """
+    Get the usage of a mounted filesystem with statvfs (no process is started).
+
+    Args:
+        mount_point (str): The mount point of the filesystem.
+
+    Returns:
+        dict: Size, Used, Available in bytes and Use% rounded up like df does.
+    """
+    return get_executor().usage(mount_point)
+
+
+def get_filesystem_type(mount_point):
+    """
+    Get the type of the filesystem mounted at the given mount point.
+
+    Args:
+        mount_point (str): The mount point of the filesystem.
+
+    Returns:
+        str: The filesystem type (e.g. ext4), None if nothing is mounted there.
+    """
+    return get_executor().filesystem_type(mount_point)
+
+
+def is_filesystem_busy(mount_point):
+    """
+    Check if the filesystem at the given mount point is in use.
+    
+    Args:
+        mount_point (str): The mount point of the filesystem.
+        
+    Returns:
+        bool: True if the filesystem is in use, False otherwise.
+    """
+    with metrics.phase_duration.time("busy_detection"):
+        return get_executor().is_busy(mount_point) # if a process holds the device the filesystem is in use
+
+        
+def unmount_filesystem(mount_point):
+    """
+    Unmount the filesystem at the given mount point.
+    
+    Args:
+        mount_point (str): The mount point of the filesystem.
+        
+    Returns:
+        bool: True if the filesystem was successfully unmounted, False otherwise.
+    """
+    if is_filesystem_busy(mount_point): # if the filesystem is in use we log a warning
+        logging.warning(f"Filesystem at {mount_point} is in use. Skipping unmount.")
+        return False
+
+    try: # if the filesystem is not in use we unmount it
+        run_command(["umount", mount_point], check=True)
+        logging.info(f"Unmounted filesystem at {mount_point}.")
+        return True
+    except subprocess.CalledProcessError as e: # if there's an error we log it
+        logging.error(f"Error unmounting filesystem at {mount_point}: {e}")
+        return False
+
+
+def reduce_filesystem(lv_name, filesystem_type, mount_point, new_size="1G"):
+    """
+    Reduce the filesystem at the given mount point.
+    
+    Args:
+        lv_name (str): The name of the logical volume to reduce.
+        filesystem_type (str): The type of the filesystem.
+        mount_point (str): The mount point of the filesystem.
+        new_size (str, optional): The new size of the filesystem. Defaults to "1G".
+        
+    Returns:
+        bool: True if the filesystem and its LV were reduced, False otherwise (nothing was freed).
+    """
+
+    # Run e2fsck before resizing
+    check_result = run_command(["e2fsck", "-f", "-y", f"/dev/mapper/{lv_name}"])
+    if check_result.returncode != 0:# if there's an error we log it
+        logging.error(f"Error running e2fsck: {check_result.stderr}")
+        return False
+
+    # Shrink the filesystem first: the LV is only reduced under a filesystem that fits in its new size
+    shrink_result = run_command(["resize2fs", f"/dev/mapper/{lv_name}", new_size])
+    if shrink_result.returncode != 0:
+        logging.error(f"Error shrinking filesystem at {mount_point}: {shrink_result.stderr}")
+        return False
+
+    try:
+        lvreduce_result = run_lvm(["lvreduce", "-f", "-L", new_size, f"/dev/mapper/{lv_name}"], check=True)
+        lvreduce_output = lvreduce_result.stdout.strip().splitlines()[-1]  # Extract the last line of the stdout
+        logging.info(lvreduce_output)  # Log the last line as info
+        reduced = True
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error reducing logical volume: {e.stderr}")
+        reduced = False  # no space was freed, the filesystem is grown back to its LV below
+
+    # Grow the filesystem to the exact size of its LV (the sizes are rounded to extents)
+    if filesystem_type == "xfs":
+        resize_result = run_command(["xfs_growfs", mount_point])
+    else:
+        resize_result = run_command(["resize2fs", f"/dev/mapper/{lv_name}"])
+
+    if resize_result.returncode != 0:
+        logging.error(f"Error resizing filesystem at {mount_point}: {resize_result.stderr}")
+    else:
+        logging.info(f"Resized filesystem at {mount_point}.")
+
+    return reduced # True only if the space of the LV was freed
+
+
+def remount_filesystem(lv_name, mount_point):
+    if get_filesystem_type(mount_point) is not None:  # already remounted, e.g. to grow an xfs filesystem
+        return
+    run_command(["mount", "/dev/mapper/" + lv_name, mount_point])
@@ -0,0 +1,210 @@
+import os
+import json
+import logging
+from collections import deque
+from functools import wraps
+from time import monotonic, time
+from .sizing import BACKOFF_WINDOW
+
+FORECAST_PATH = "/tmp/filesystem_usage.json"  # samples kept between two runs of the scripts
+WINDOW = 3600  # seconds of samples used to fit the growth rate
+MAX_SAMPLES = 120  # samples kept per filesystem, at least WINDOW / MAX_SAMPLES seconds apart
+MIN_SAMPLES = 3  # below this many samples the threshold decides
+MIN_SPAN = 60  # seconds the samples must cover before the trend is trusted
+EXTENSION_LATENCY = 120  # expected seconds of an extension (unmount, fsck, resize, remount) until one is measured
+SAFETY_MARGIN = 600  # seconds of usage kept ahead of the projected time to full
+GROWS_KEPT = 3600 * 24  # seconds the times of the grows of a filesystem are kept (see sizing.py)
+LATENCY_ALPHA = 0.5  # weight of the newest measure in the EWMA of the extension latency
+CRITICAL = 98  # Use% from which a filesystem is extended whatever its trend (a full filesystem stops growing)
+
+
+def fit_growth_rate(samples):
+    """
+    Fit the growth rate of the used space with a least squares line.
+
+    Args:
+        samples (list): (timestamp, used bytes, available bytes) tuples.
+
+    Returns:
+        float: growth rate in bytes per second (negative if the usage decreases).
+    """
+    count = len(samples)
+    mean_t = sum(sample[0] for sample in samples) / count
+    mean_used = sum(sample[1] for sample in samples) / count
+    variance = sum((sample[0] - mean_t) ** 2 for sample in samples)
+    if variance == 0:
+        return 0.0
+    return sum((sample[0] - mean_t) * (sample[1] - mean_used) for sample in samples) / variance
+
+
+class UsageForecaster:
+    """
+    Forecast when each filesystem will be full from its recent usage samples.
+
+    The growth rate is fitted over the last WINDOW seconds, and a filesystem is extended when its projected
+    time to full drops below the expected latency of its extension (measured on the previous ones) plus a
+    safety margin. Until there are enough samples, the Use% threshold decides.
+    """
+
+    def __init__(self, window=WINDOW, max_samples=MAX_SAMPLES, safety_margin=SAFETY_MARGIN, critical=CRITICAL):
+        self.window = window
+        self.max_samples = max_samples
+        self.safety_margin = safety_margin
+        self.critical = critical
+        self.samples = {}  # mount point -> deque of (timestamp, used, available)
+        self.latencies = {}  # mount point -> EWMA of the duration of its extensions in seconds
+        self.grows = {}  # mount point -> times of its successful extensions
+
+    def add(self, mount_point, used, available, timestamp=None):
+        """
+        Record a usage sample of a filesystem.
+
+        Args:
+            mount_point (str): The mount point of the filesystem.
+            used (int): used bytes.
+            available (int): available bytes.
+            timestamp (float, optional): time of the sample. Defaults to now.
+        """
+        timestamp = time() if timestamp is None else timestamp
+        samples = self.samples.setdefault(mount_point, deque(maxlen=self.max_samples))
+        if samples and timestamp - samples[-1][0] < self.window / self.max_samples:
+            samples[-1] = (timestamp, used, available)  # too close to the previous one, keep only the latest
+        else:
+            samples.append((timestamp, used, available))
+        while samples and samples[0][0] < timestamp - self.window:
+            samples.popleft()
+
+    def growth_rate(self, mount_point):
+        """
+        Get the growth rate of a filesystem.
+
+        Returns:
+            float: bytes per second, None if there are not enough samples to trust the trend.
+        """
+        samples = self.samples.get(mount_point)
+        if not samples or len(samples) < MIN_SAMPLES or samples[-1][0] - samples[0][0] < MIN_SPAN:
+            return None
+        return fit_growth_rate(samples)
+
+    def time_to_full(self, mount_point):
+        """
+        Get the projected time until a filesystem is full.
+
+        Returns:
+            float: seconds (inf if it's not growing), None if there are not enough samples.
+        """
+        rate = self.growth_rate(mount_point)
+        if rate is None:
+            return None
+        if rate <= 0:
+            return float("inf")
+        return max(self.samples[mount_point][-1][2], 0) / rate
+
+    def latency(self, mount_point):
+        """Get the expected duration of the extension of a filesystem in seconds."""
+        return self.latencies.get(mount_point, EXTENSION_LATENCY)
+
+    def record_extension(self, mount_point, seconds):
+        previous = self.latencies.get(mount_point)
+        self.latencies[mount_point] = seconds if previous is None else LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * previous
+
+    def record_grow(self, mount_point, timestamp=None):
+        timestamp = time() if timestamp is None else timestamp
+        self.grows[mount_point] = [grow for grow in self.grows.get(mount_point, []) if grow >= timestamp - GROWS_KEPT] + [timestamp]
+
+    def recent_grows(self, mount_point, window=None):
+        """
+        Count the successful extensions of a filesystem.
+
+        Args:
+            mount_point (str): The mount point of the filesystem.
+            window (float, optional): seconds to look back. Defaults to sizing.BACKOFF_WINDOW.
+
+        Returns:
+            int: the number of extensions in the window.
+        """
+        window = BACKOFF_WINDOW if window is None else window
+        return sum(1 for grow in self.grows.get(mount_point, []) if grow >= time() - window)
+
+    def track(self, function):
+        """Wrap an extension function taking a parsed filesystem so its duration and its success are recorded."""
+        @wraps(function)
+        def tracked(obj, *args, **kwargs):
+            start = monotonic()
+            extended = False
+            try:
+                extended = function(obj, *args, **kwargs)
+                return extended
+            finally:
+                self.record_extension(obj["Mount Point"], monotonic() - start)
+                if extended:
+                    self.record_grow(obj["Mount Point"])
+        return tracked
+
+    def should_extend(self, obj, threshold, horizon=0):
+        """
+        Decide if a filesystem must be extended now.
+
+        Args:
+            obj (dict): The parsed filesystem, with its Use%.
+            threshold (int): Use% from which the filesystem is extended when its trend is unknown.
+            horizon (float, optional): seconds until the filesystem is checked again (time between two runs
+                or two polls). Defaults to 0.
+
+        Returns:
+            bool: True if the filesystem would be full before an extension started at its next check ends.
+        """
+        mount_point = obj["Mount Point"]
+        if obj["Use%"] >= self.critical:
+            return True
+        time_to_full = self.time_to_full(mount_point)
+        if time_to_full is None:
+            return obj["Use%"] >= threshold
+        deadline = self.latency(mount_point) + self.safety_margin + horizon
+        if time_to_full <= deadline:
+            logging.info(f"Forecast : {mount_point} is projected full in {time_to_full:.0f}s (deadline {deadline:.0f}s).")
+            return True
+        return False
+
+    def forget(self, mount_points):
+        """Drop the samples of the filesystems that are no longer mounted."""
+        for mount_point in set(self.samples) - set(mount_points):
+            del self.samples[mount_point]
+            self.latencies.pop(mount_point, None)
+            self.grows.pop(mount_point, None)
+
+    @classmethod
+    def load(cls, path=FORECAST_PATH, **kwargs):
+        """
+        Load the samples stored by a previous run.
+
+        Args:
+            path (str, optional): the samples file. Defaults to FORECAST_PATH.
+
+        Returns:
+            UsageForecaster: the forecaster, empty if the file is missing or invalid.
+        """
+        forecaster = cls(**kwargs)
+        try:
+            with open(path) as file:
+                state = json.load(file)
+            for mount_point, entry in state.items():
+                for timestamp, used, available in entry["samples"]:
+                    forecaster.add(mount_point, used, available, timestamp)
+                if entry.get("latency") is not None:
+                    forecaster.latencies[mount_point] = entry["latency"]
+                forecaster.grows[mount_point] = entry.get("grows", [])
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Forecast : ignoring the invalid samples file {path}: {e}")
+        return forecaster
+
+    def save(self, path=FORECAST_PATH):
+        """Store the samples for the next run (written atomically)."""
+        state = {mount_point: {"samples": list(samples), "latency": self.latencies.get(mount_point), "grows": self.grows.get(mount_point, [])}
+                 for mount_point, samples in self.samples.items()}
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(state, file)
+        os.replace(temporary, path)
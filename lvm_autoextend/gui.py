@@ -0,0 +1,427 @@
+import os
+import queue
+import logging
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from time import monotonic, time
+from .filesystems import scan_filesystems
+from .forecast import CRITICAL, UsageForecaster
+from .locks import held_locks, split_dm_name
+from .workqueue import WorkQueue, queue_db_path
+
+REFRESH_INTERVAL = 0.5  # seconds between two collections (the mount table and one statvfs per mounted LV)
+DRAIN_INTERVAL = 100  # milliseconds between two checks of the collected updates in the Tk main loop
+THRESHOLD = 80  # Use% from which the scripts extend a filesystem until its trend is known
+ROW_HEIGHT = 22  # pixels of a row of the list
+VISIBLE_ROWS = 30  # rows shown before the window is resized
+BAR_WIDTH = 100  # pixels of the usage bar of a row
+BAR_COLORS = {"normal": "#4a90d9", "warning": "#e6a23c", "critical": "#d9534f"}
+WHEEL_ROWS = 3  # rows scrolled by a step of the mouse wheel
+ALL_VGS = "All"
+# (heading, width in pixels, sort key) of each column of the list
+COLUMNS = (
+    ("Mount point", 260, lambda obj: obj["Mount Point"]),
+    ("VG", 110, lambda obj: (obj["vg"], obj["Mount Point"])),
+    ("Use%", BAR_WIDTH + 50, lambda obj: obj["Use%"]),
+    ("Used / Size", 130, lambda obj: obj["Used"]),
+    ("Fill rate", 90, lambda obj: float("-inf") if obj["rate"] is None else obj["rate"]),
+    ("Full in", 70, lambda obj: float("inf") if obj["time_to_full"] is None else obj["time_to_full"]),
+    ("State", 210, lambda obj: (obj["extending"] is None, obj["queued"] is None, -(obj["extending"] or obj["queued"] or 0))),
+)
+DEFAULT_SORT = 2  # the fullest first
+DESCENDING = ("Use%", "Used / Size", "Fill rate")  # columns sorted from the largest at their first click
+
+
+def format_size(size):
+    """Format a number of bytes with one decimal, e.g. 1.5G."""
+    for unit, factor in (("T", 1024 ** 4), ("G", 1024 ** 3), ("M", 1024 ** 2), ("K", 1024)):
+        if abs(size) >= factor:
+            return f"{size / factor:.1f}{unit}"
+    return f"{size:.0f}B"
+
+
+def format_duration(seconds):
+    """Format a duration in its largest unit, e.g. 12m. None (unknown) is "?" and inf is "never"."""
+    if seconds is None:
+        return "?"
+    if seconds == float("inf"):
+        return "never"
+    for unit, factor in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= factor:
+            return f"{seconds // factor:.0f}{unit}"
+    return f"{seconds:.0f}s"
+
+
+def describe_state(obj):
+    """Text of the state of a filesystem: the extension in progress on its LV, or its wait in the queue."""
+    if obj["extending"] is not None:
+        return f"extending for {format_duration(obj['extending'])}" + ("" if obj["mounted"] else " (unmounted)")
+    if obj["queued"] is not None:
+        return f"queued for {format_duration(obj['queued'])}"
+    return ""
+
+
+def cells(obj):
+    """Texts of the columns of a filesystem in the list."""
+    rate = "?" if obj["rate"] is None else f"{format_size(obj['rate'])}/s"
+    return (obj["Mount Point"], obj["vg"], f"{obj['Use%']}%", f"{format_size(obj['Used'])} / {format_size(obj['Size'])}",
+            rate, format_duration(obj["time_to_full"]), describe_state(obj))
+
+
+def fit(text, width):
+    """Shorten a text to about the width of its column, keeping its end (the end of a mount point tells it apart)."""
+    length = width // 7 - 1
+    return text if len(text) <= length else "…" + text[-(length - 1):]
+
+
+class Collector(threading.Thread):
+    """
+    Collects the state of the host in the background and hands it to the window through a queue.
+
+    Tk isn't thread-safe: the collector never touches a widget, the main loop drains the queue (see
+    Dashboard.drain). Every `interval` seconds, it reads the usage of the mounted LVs, fits their fill rate,
+    reads the queue of bg_script.py and the locks held by the extensions in progress, in any process.
+    """
+
+    def __init__(self, updates, interval=REFRESH_INTERVAL, forecaster=None, queue_path=queue_db_path):
+        super().__init__(name="collector", daemon=True)
+        self.updates = updates
+        self.interval = interval
+        self.forecaster = forecaster or UsageForecaster.load()  # the samples of the scripts give the fill rates at once, never saved
+        self.queue_path = queue_path  # None to show no queue
+        self.work_queue = None  # opened in the collector thread, the only one using it
+        self.queue_error = None  # last error reading the queue, logged once
+        self.known = {}  # mount point -> last collected filesystem, kept while its LV is unmounted for an extension
+        self.stopping = threading.Event()
+
+    def queued(self):
+        """
+        Get the queued LVs and the time they have been waiting, empty until the scripts create the queue.
+
+        The database of the scripts is opened read-only: the user of the GUI may not be allowed to write it.
+
+        Returns:
+            dict: name of the LV -> seconds since it was queued, None if the queue can't be read.
+        """
+        try:
+            if self.work_queue is None:
+                if self.queue_path is None or not os.path.exists(self.queue_path):
+                    return {}
+                self.work_queue = WorkQueue(self.queue_path, read_only=True)
+            ages = self.work_queue.ages()
+        except sqlite3.Error as e:  # only the queue is left blank, opened again at the next collection
+            if str(e) != self.queue_error:
+                logging.error(f"GUI : Error reading the queue {self.queue_path}: {e}")
+            self.queue_error = str(e)
+            if self.work_queue is not None:
+                self.work_queue.close()
+                self.work_queue = None
+            return None
+        self.queue_error = None
+        return ages
+
+    def collect(self):
+        """
+        Collect the state of the host.
+
+        Returns:
+            dict: the filesystems (parsed filesystems with lv, vg, mounted, rate, time_to_full, queued and extending)
+                by mount point, the number of queued LVs, whether bg_script.py is running and the time of the collection.
+        """
+        now = time()
+        held = held_locks()
+        extending = {name[len("lv-"):]: now - taken for name, (pid, taken) in held.items() if name.startswith("lv-")}
+        ages = self.queued()
+        filesystems = {obj["Mount Point"]: {**obj, "mounted": True} for obj in scan_filesystems()}
+        for mount_point, obj in self.known.items():  # an extension unmounts its filesystem for a while
+            if mount_point not in filesystems and obj["lv"] in extending:
+                filesystems[mount_point] = {**obj, "mounted": False}
+        for obj in filesystems.values():
+            if obj["mounted"]:
+                self.forecaster.add(obj["Mount Point"], obj["Used"], obj["Available"], now)
+        self.forecaster.forget(filesystems)
+
+        for mount_point, obj in filesystems.items():
+            obj["lv"] = obj["Filesystem"].split("/")[-1]
+            obj["vg"] = split_dm_name(obj["lv"])[0]
+            obj["rate"] = self.forecaster.growth_rate(mount_point)
+            obj["time_to_full"] = self.forecaster.time_to_full(mount_point)
+            obj["queued"] = None if ages is None else ages.get(obj["lv"])
+            obj["extending"] = extending.get(obj["lv"])
+        self.known = filesystems
+        return {"filesystems": filesystems, "queued": "?" if ages is None else len(ages), "treatment": "treatment" in held, "time": now}
+
+    def run(self):
+        while not self.stopping.is_set():
+            started = monotonic()
+            try:
+                update = self.collect()
+            except Exception as e:  # shown in the window, the next collection may succeed
+                logging.error(f"GUI : Error collecting the state of the host: {e}")
+                update = {"error": str(e), "time": time()}
+            self.updates.put(update)
+            self.stopping.wait(max(self.interval - (monotonic() - started), 0))
+        if self.work_queue is not None:
+            self.work_queue.close()
+
+    def stop(self):
+        self.stopping.set()
+
+
+class FilesystemList:
+    """
+    Virtualized list of the filesystems, drawn on a Canvas.
+
+    Only the visible rows have canvas items: scrolling or an update changes the texts and the bars of these
+    items, so the number of items stays the same however many filesystems there are. The rows are sorted by
+    the column whose heading was clicked last, a second click reverses the order.
+    """
+
+    def __init__(self, parent, threshold=THRESHOLD):
+        from tkinter import Canvas
+        from tkinter.ttk import Scrollbar
+
+        self.threshold = threshold
+        self.canvas = Canvas(parent, width=sum(column[1] for column in COLUMNS), height=ROW_HEIGHT * VISIBLE_ROWS,
+                             background="white", highlightthickness=0)
+        self.scrollbar = Scrollbar(parent, orient="vertical", command=self.yview)
+        self.canvas.grid(column=0, row=0, sticky="nsew")
+        self.scrollbar.grid(column=1, row=0, sticky="ns")
+        parent.rowconfigure(0, weight=1)
+        parent.columnconfigure(0, weight=1)
+        self.filesystems = []  # filesystems to show, unsorted
+        self.rows = []  # the same, sorted
+        self.first = 0  # index in rows of the top visible row
+        self.slots = []  # canvas items of each visible row: column index (or "bar", "fill") -> item
+        self.shown = {}  # canvas item -> what it shows, an item is only configured when it changes
+        self.sort_column, self.descending = DEFAULT_SORT, True
+        self.headings = self.draw_headings()
+        self.canvas.bind("<Configure>", self.resize)
+        for event in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.bind(event, self.wheel)
+
+    def draw_headings(self):
+        self.canvas.create_rectangle(0, 0, sum(column[1] for column in COLUMNS), ROW_HEIGHT, fill="#e8e8e8", outline="")
+        headings, x = [], 0
+        for index, (heading, width, _) in enumerate(COLUMNS):
+            item = self.canvas.create_text(x + 4, ROW_HEIGHT // 2, anchor="w", font=("Arial Bold", 10))
+            self.canvas.tag_bind(item, "<Button-1>", lambda event, index=index: self.sort_by(index))
+            headings.append(item)
+            x += width
+        self.label_headings(headings)
+        return headings
+
+    def label_headings(self, headings):
+        for index, item in enumerate(headings):
+            arrow = (" ▼" if self.descending else " ▲") if index == self.sort_column else ""
+            self.canvas.itemconfigure(item, text=COLUMNS[index][0] + arrow)
+
+    def make_slot(self, slot):
+        top = (slot + 1) * ROW_HEIGHT  # the headings take the first row
+        middle = top + ROW_HEIGHT // 2
+        items, x = {}, 0
+        for index, (heading, width, _) in enumerate(COLUMNS):
+            if heading == "Use%":
+                items["bar"] = self.canvas.create_rectangle(x + 4, top + 5, x + 4 + BAR_WIDTH, top + ROW_HEIGHT - 5, outline="#999999")
+                items["fill"] = self.canvas.create_rectangle(x + 4, top + 5, x + 4, top + ROW_HEIGHT - 5, outline="")
+                items[index] = self.canvas.create_text(x + BAR_WIDTH + 8, middle, anchor="w")
+            else:
+                items[index] = self.canvas.create_text(x + 4, middle, anchor="w")
+            x += width
+        return items
+
+    def resize(self, event):
+        """Keep one slot per row that fits in the canvas."""
+        visible = max(-(-event.height // ROW_HEIGHT) - 1, 0)
+        while len(self.slots) < visible:
+            self.slots.append(self.make_slot(len(self.slots)))
+        while len(self.slots) > visible:
+            for item in self.slots.pop().values():
+                self.canvas.delete(item)
+                self.shown.pop(item, None)
+        self.scroll_to(self.first)
+
+    def set(self, item, **options):
+        shown = self.shown.setdefault(item, {})
+        changed = {name: value for name, value in options.items() if shown.get(name) != value}
+        if changed:
+            self.canvas.itemconfigure(item, **changed)
+            shown.update(changed)
+
+    def set_coords(self, item, *coords):
+        shown = self.shown.setdefault(item, {})
+        if shown.get("coords") != coords:
+            self.canvas.coords(item, *coords)
+            shown["coords"] = coords
+
+    def draw(self):
+        """Show the visible rows in the slots and hide the slots past the last row."""
+        for slot, items in enumerate(self.slots):
+            index = self.first + slot
+            obj = self.rows[index] if index < len(self.rows) else None
+            for item in items.values():
+                self.set(item, state="hidden" if obj is None else "normal")
+            if obj is None:
+                continue
+            for column, text in enumerate(cells(obj)):
+                self.set(items[column], text=fit(text, COLUMNS[column][1]))
+            style = "critical" if obj["Use%"] >= CRITICAL else "warning" if obj["Use%"] >= self.threshold else "normal"
+            left, top, _, bottom = self.canvas.coords(items["bar"])
+            self.set_coords(items["fill"], left, top, left + BAR_WIDTH * min(obj["Use%"], 100) / 100, bottom)
+            self.set(items["fill"], fill=BAR_COLORS[style])
+        if self.rows:
+            self.scrollbar.set(self.first / len(self.rows), min((self.first + len(self.slots)) / len(self.rows), 1))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll_to(self, first):
+        self.first = max(min(first, len(self.rows) - len(self.slots)), 0)
+        self.draw()
+
+    def yview(self, action, value, unit=None):
+        """Command of the scrollbar: moveto FRACTION, or scroll N units or pages."""
+        if action == "moveto":
+            self.scroll_to(int(float(value) * len(self.rows)))
+        else:
+            self.scroll_to(self.first + int(value) * (len(self.slots) if unit == "pages" else 1))
+
+    def wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.scroll_to(self.first + (-WHEEL_ROWS if up else WHEEL_ROWS))
+
+    def sort_by(self, column):
+        """Sort by a column, or reverse the order if it's already sorted by it."""
+        if column == self.sort_column:
+            self.descending = not self.descending
+        else:
+            self.sort_column, self.descending = column, COLUMNS[column][0] in DESCENDING
+        self.label_headings(self.headings)
+        self.show(self.filesystems)
+
+    def show(self, filesystems):
+        """Show these filesystems (a new update, or a new filter), sorted, at the same scroll position."""
+        self.filesystems = filesystems
+        self.rows = sorted(filesystems, key=COLUMNS[self.sort_column][2], reverse=self.descending)
+        self.scroll_to(self.first)
+
+
+class Dashboard:
+    """
+    Window showing the usage of the filesystems, their fill rate and time to full, the queue of bg_script.py and
+    the extensions in progress, fed by a Collector.
+
+    The filesystems are listed in a FilesystemList, filtered by a search on their mount point or LV, their VG,
+    a minimum Use% and whether they're growing.
+    """
+
+    def __init__(self, root, updates, threshold=THRESHOLD):
+        from tkinter import BooleanVar, Checkbutton, Entry, Frame, Label, Spinbox, StringVar
+        from tkinter.ttk import Combobox
+
+        self.root = root
+        self.updates = updates
+        self.update = None  # the last update shown
+
+        self.header = Label(root, anchor="w", font=("Arial Bold", 14))
+        self.header.grid(column=0, row=0, sticky="we", padx=4, pady=4)
+        filters = Frame(root)
+        filters.grid(column=0, row=1, sticky="we", padx=4)
+        self.search = StringVar()
+        self.vg = StringVar(value=ALL_VGS)
+        self.min_use = StringVar(value="0")
+        self.growing = BooleanVar(value=False)
+        Label(filters, text="Search").pack(side="left")
+        Entry(filters, textvariable=self.search, width=24).pack(side="left", padx=(2, 10))
+        Label(filters, text="VG").pack(side="left")
+        self.vg_choice = Combobox(filters, textvariable=self.vg, values=[ALL_VGS], state="readonly", width=16)
+        self.vg_choice.pack(side="left", padx=(2, 10))
+        Label(filters, text="Use% ≥").pack(side="left")
+        Spinbox(filters, textvariable=self.min_use, from_=0, to=100, increment=5, width=4).pack(side="left", padx=(2, 10))
+        Checkbutton(filters, text="Growing only", variable=self.growing).pack(side="left")
+        for variable in (self.search, self.vg, self.min_use, self.growing):
+            variable.trace_add("write", lambda *_: self.refilter())
+
+        frame = Frame(root)
+        frame.grid(column=0, row=2, sticky="nsew")
+        root.rowconfigure(2, weight=1)
+        root.columnconfigure(0, weight=1)
+        self.list = FilesystemList(frame, threshold)
+
+    def drain(self):
+        """Show the latest collected update, if any, then check again in DRAIN_INTERVAL milliseconds."""
+        update = None
+        while True:
+            try:
+                update = self.updates.get_nowait()  # older updates are skipped if the window was busy
+            except queue.Empty:
+                break
+        if update is not None:
+            self.show(update)
+        self.root.after(DRAIN_INTERVAL, self.drain)
+
+    def matches(self):
+        """Get the filter of the filesystems from the controls."""
+        search, vg, growing = self.search.get(), self.vg.get(), self.growing.get()
+        try:
+            min_use = int(self.min_use.get())
+        except ValueError:  # being typed
+            min_use = 0
+        return lambda obj: ((search in obj["Mount Point"] or search in obj["lv"]) and (vg == ALL_VGS or obj["vg"] == vg)
+                            and obj["Use%"] >= min_use and (not growing or (obj["rate"] or 0) > 0))
+
+    def refilter(self):
+        if self.update is None or "error" in self.update:
+            return
+        matches = self.matches()
+        filesystems = self.update["filesystems"]
+        self.list.show([obj for obj in filesystems.values() if matches(obj)])
+        extending = sum(1 for obj in filesystems.values() if obj["extending"] is not None)
+        updated = datetime.fromtimestamp(self.update["time"]).strftime("%H:%M:%S")
+        self.header.configure(fg="black", text=f"{len(self.list.rows)}/{len(filesystems)} filesystems, {extending} extending, "
+                                               f"{self.update['queued']} queued, bg_script.py {'running' if self.update['treatment'] else 'idle'} ({updated})")
+
+    def show(self, update):
+        if "error" in update:
+            updated = datetime.fromtimestamp(update["time"]).strftime("%H:%M:%S")
+            self.header.configure(text=f"Error collecting the state of the host: {update['error']} ({updated})", fg="red")
+            return
+        self.update = update
+        vgs = [ALL_VGS] + sorted({obj["vg"] for obj in update["filesystems"].values()})
+        if list(self.vg_choice["values"]) != vgs:
+            self.vg_choice["values"] = vgs
+        self.refilter()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the usage of the filesystems, their fill rate, the queue and the extensions in progress, live.")
+    parser.add_argument("--interval", type=float, default=REFRESH_INTERVAL, help=f"seconds between two refreshes (default: {REFRESH_INTERVAL})")
+    parser.add_argument("--synthetic", type=int, metavar="LVS", help="show a simulated host of this many LVs instead of this host")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the simulated host (default: 0)")
+    args = parser.parse_args(argv)
+    if args.synthetic is not None:
+        from .benchmark import LVS_PER_VG, generate_topology  # only load the generator for a test host
+        from .executor import set_executor
+        set_executor(generate_topology(max(args.synthetic // LVS_PER_VG, 1), min(args.synthetic, LVS_PER_VG), seed=args.seed))
+
+    # tkinter is only imported when the GUI is started
+    from tkinter import Tk
+
+    root = Tk()
+    root.title("LVM autoextend")
+    updates = queue.Queue()
+    collector = Collector(updates, args.interval, forecaster=UsageForecaster() if args.synthetic is not None else None,
+                          queue_path=None if args.synthetic is not None else queue_db_path)
+    dashboard = Dashboard(root, updates)
+
+    def close():
+        collector.stop()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", close)
+    # The host is probed by the collector once the window is shown, never in the main loop
+    collector.start()
+    root.after(DRAIN_INTERVAL, dashboard.drain)
+    logging.debug("GUI started.")
+    root.mainloop()
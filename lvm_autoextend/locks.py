@@ -0,0 +1,208 @@
+import os
+import re
+import fcntl
+import logging
+from contextlib import contextmanager
+from time import monotonic, sleep, time
+
+LOCK_DIR = "/tmp/lvm-autoextend-locks"
+POLL_INTERVAL = 0.1  # seconds between two attempts to take a busy lock
+
+
+def split_dm_name(dm_name):
+    """
+    Split a /dev/mapper name into its VG and LV names (hyphens inside the names are doubled).
+
+    Args:
+        dm_name (str): name of the LV under /dev/mapper (e.g. my--vg-data).
+
+    Returns:
+        tuple: (VG name, LV name), e.g. ("my-vg", "data"). The LV name is "" if the name can't be split.
+    """
+    match = re.fullmatch(r"((?:[^-]|--)+)-((?:[^-]|--)+)", dm_name)
+    if match is None:
+        return dm_name, ""
+    return match.group(1).replace("--", "-"), match.group(2).replace("--", "-")
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # the process exists but belongs to another user
+        return True
+    return True
+
+
+class ResourceLock:
+    """
+    Exclusive lock on one resource (a VG, an LV...), held for the whole operation.
+
+    The lock is a flock on a file of the lock directory, kept open until release(), so it's released by the
+    kernel if the holder dies: a lock is never broken. The file is never removed either, as another process
+    may be locking it. The holder writes its PID and the time it took the lock in the file: a lock that is
+    busy while its recorded holder is dead (the descriptor leaked to a child that is still running) is only
+    logged, it's freed once that child exits.
+    """
+
+    def __init__(self, name, lock_dir=LOCK_DIR):
+        self.name = name
+        self.path = os.path.join(lock_dir, f"{name}.lock")
+        self.fd = None
+
+    def holder(self):
+        """
+        Get the holder recorded in the lock file.
+
+        Returns:
+            tuple: (PID, time the lock was taken), or None if the lock file is empty or missing.
+        """
+        try:
+            with open(self.path) as file:
+                pid, taken = file.read().split()
+            return int(pid), float(taken)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def is_stale(self):
+        holder = self.holder()
+        return holder is not None and not is_process_alive(holder[0])
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+        Take the lock.
+
+        Args:
+            blocking (bool, optional): wait for the lock if it's busy. Defaults to True.
+            timeout (float, optional): maximum time to wait in seconds. Defaults to no limit.
+
+        Returns:
+            bool: True if the lock was taken, False otherwise.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        deadline = None if timeout is None else monotonic() + timeout
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        reported = None  # stale holder already logged
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                holder = self.holder()
+                if holder is not None and holder != reported and not is_process_alive(holder[0]):
+                    logging.warning(f"Lock {self.name}: holder {holder[0]} is dead but the lock is still held, "
+                                    f"its descriptor leaked to a running process.")
+                    reported = holder
+                if not blocking or (deadline is not None and monotonic() >= deadline):
+                    os.close(fd)
+                    return False
+                sleep(POLL_INTERVAL)
+
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()} {time()}\n".encode())
+        self.fd = fd
+        return True
+
+    def release(self):
+        if self.fd is None:
+            return
+        os.ftruncate(self.fd, 0)
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class LockManager:
+    """
+    Locks of the VGs and LVs.
+
+    An extension holds the lock of its VG (LVM metadata changes, donors of the same VG) and of its LV
+    (unmount, resize, remount) for its whole duration. Locks are always taken VG first, then LV, so two
+    operations can't deadlock.
+    """
+
+    def __init__(self, lock_dir=LOCK_DIR):
+        self.lock_dir = lock_dir
+
+    def vg(self, vg_name):
+        return ResourceLock(f"vg-{vg_name}", self.lock_dir)
+
+    def lv(self, vg_name, lv_name):
+        return ResourceLock(f"lv-{vg_name.replace('-', '--')}-{lv_name.replace('-', '--')}", self.lock_dir)
+
+    def acquire(self, dm_name, blocking=True, timeout=None):
+        """
+        Take the locks of the VG and of the LV of a device.
+
+        Args:
+            dm_name (str): name of the LV under /dev/mapper.
+            blocking (bool, optional): wait for the locks. Defaults to True.
+            timeout (float, optional): maximum time to wait for each lock. Defaults to no limit.
+
+        Returns:
+            list: the held locks (release them with release()), or None if they could not be taken.
+        """
+        vg_name, lv_name = split_dm_name(dm_name)
+        held = []
+        for lock in (self.vg(vg_name), self.lv(vg_name, lv_name)):
+            if not lock.acquire(blocking, timeout):
+                self.release(held)
+                return None
+            held.append(lock)
+        return held
+
+    def release(self, held):
+        for lock in reversed(held):
+            lock.release()
+
+    @contextmanager
+    def hold(self, dm_name):
+        """Hold the locks of the VG and of the LV of a device for the duration of a with block."""
+        held = self.acquire(dm_name)
+        try:
+            yield
+        finally:
+            self.release(held)
+
+
+def held_locks(lock_dir=LOCK_DIR):
+    """
+    Get the locks held by live processes, without taking any (e.g. to show the operations in progress).
+
+    Returns:
+        dict: lock name (e.g. lv-<dm name>, treatment) -> (PID, time the lock was taken).
+    """
+    try:
+        names = os.listdir(lock_dir)
+    except FileNotFoundError:
+        return {}
+    held = {}
+    for name in names:
+        if not name.endswith(".lock"):
+            continue
+        holder = ResourceLock(name[:-len(".lock")], lock_dir).holder()  # the file is emptied when the lock is released
+        if holder is not None and is_process_alive(holder[0]):
+            held[name[:-len(".lock")]] = holder
+    return held
+
+
+def treatment_lock():
+    """Lock held by bg_script.py for its whole run, so a single instance is started."""
+    return ResourceLock("treatment")
+
+
+# Function to check if the treatment script is running
+def is_treatment_script_running():
+    lock = treatment_lock()
+    if lock.acquire(blocking=False):
+        lock.release()
+        return False
+    return True
@@ -0,0 +1,162 @@
+import os
+import copy
+import json
+import uuid
+import queue
+import atexit
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from time import perf_counter, time
+
+MAX_BYTES = 10 * 1024 ** 2  # size from which a log file is rotated
+MAX_AGE = 24 * 3600  # seconds after which a log file is rotated, whatever its size
+BACKUP_COUNT = 5  # rotated files kept next to the current one (name.log.1 is the newest)
+FIELDS = ("op", "lv", "vg", "mount_point", "duration", "command", "returncode")  # structured fields of the records, when set
+
+ENCODER = json.JSONEncoder(default=str)  # json.dumps with default= would build an encoder for each record
+log_context = ContextVar("log_context", default={})  # fields of the operation in progress in this thread or task
+
+
+@contextmanager
+def operation(name, **fields):
+    """
+    Tag the records logged during a with block with a new operation id and fields (lv, vg, mount_point...).
+
+    Every record of the block, from any module, carries them, so the lines of one extension can be told apart
+    among those of the other workers. The end of the block is logged with its duration.
+
+    Args:
+        name (str): what the operation does, in the record of its end.
+        **fields: fields of the records of the block (see FIELDS).
+    """
+    token = log_context.set({**log_context.get(), **fields, "op": uuid.uuid4().hex[:12]})
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        seconds = perf_counter() - start
+        logging.debug(f"{name} ended after {seconds:.3f}s.", extra={"duration": round(seconds, 6)})
+        log_context.reset(token)
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Hands the records to the listener thread, tagged with the fields of the operation in progress.
+
+    Only the message is merged with its arguments here, in the logging thread: the record is serialized and
+    written by the listener thread, so a worker never waits for the disk.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)  # the record may still be used by the caller
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        for field, value in log_context.get().items():
+            if not hasattr(record, field):  # an extra= of the call wins
+                setattr(record, field, value)
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON line: time, level, thread, message, the fields that are set and the exception."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return ENCODER.encode(entry)
+
+
+class SizeAndAgeRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotates its file once it reaches max_bytes or max_age seconds.
+
+    The size of the file is counted as the records are written (the JSON lines are ASCII), instead of formatting
+    each record twice or asking the file its position, which flushes it. The records aren't flushed one by one:
+    the listener flushes the file once the queue is empty. Like TimedRotatingFileHandler, an existing file is as
+    old as its last modification.
+    """
+
+    def __init__(self, filename, max_bytes=MAX_BYTES, max_age=MAX_AGE, backup_count=BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.max_age = max_age
+        self.size = os.path.getsize(filename)
+        self.rollover_at = (os.stat(filename).st_mtime if self.size else time()) + max_age
+
+    def emit(self, record):
+        try:
+            line = self.format(record) + "\n"
+            if self.size and (time() >= self.rollover_at or (self.maxBytes > 0 and self.size + len(line) > self.maxBytes)):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(line)
+            self.size += len(line)
+        except Exception:
+            self.handleError(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.size = 0
+        self.rollover_at = time() + self.max_age
+
+
+class BatchingQueueListener(QueueListener):
+    """Writes the queued records and flushes the files once the queue is empty: one write for a burst of records."""
+
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+
+
+def setup_logging(filename="lvm_autoextend.log", log_dir="logs", max_bytes=MAX_BYTES, max_age=MAX_AGE, backup_count=BACKUP_COUNT):
+    """
+    Configure the logging of an entry point. Nothing is configured at import time, and only once per process.
+
+    The records are JSON lines (see JsonFormatter), written by a listener thread to a file rotated by size and age.
+
+    Args:
+        filename (str, optional): name of the log file in log_dir, one per entry point. Defaults to "lvm_autoextend.log".
+        log_dir (str, optional): directory of the log files. Defaults to "logs".
+        max_bytes (int, optional): size from which the file is rotated. Defaults to MAX_BYTES.
+        max_age (float, optional): seconds after which the file is rotated. Defaults to MAX_AGE.
+        backup_count (int, optional): rotated files kept. Defaults to BACKUP_COUNT.
+
+    Returns:
+        None
+    """
+    root = logging.getLogger()
+    if root.handlers: # already configured, like logging.basicConfig
+        return
+    # Check if the logs directory exists, if not create it
+    os.makedirs(log_dir, exist_ok=True)
+    handler = SizeAndAgeRotatingFileHandler(os.path.join(log_dir, filename), max_bytes, max_age, backup_count)
+    handler.setFormatter(JsonFormatter())
+
+    records = queue.SimpleQueue() # unbounded and lock-free for the loggers, the listener is the only consumer
+    listener = BatchingQueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop) # write the records still queued at exit
+    root.addHandler(ContextQueueHandler(records))
+    root.setLevel(logging.DEBUG) # Set the logging level to DEBUG to log all messages
+    # The records don't show where they were logged from or the process: skip collecting it (see the Optimization part of the logging HOWTO)
+    logging._srcfile = None
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
@@ -0,0 +1,265 @@
+import os
+import json
+import atexit
+import logging
+import selectors
+import subprocess
+import threading
+from time import monotonic
+
+# sudo resets the environment (env_reset), so the variables of lvm are set by env(1) on its side
+LVM_COMMAND = ["sudo", "env", "LC_ALL=C", "LVM_SUPPRESS_FD_WARNINGS=1", "lvm"]
+PROMPT = b"lvm> "
+# Every command reports its own log (and its return code) as JSON, next to its report if it has one
+REPORT_OPTIONS = ["--reportformat", "json", "--config", "log/report_command_log=1"]
+LVM_SUCCESS = 1  # log_ret_code of a successful command (ECMD_PROCESSED)
+TIMEOUT_RETURNCODE = 124  # return code of a command stopped at its timeout, like timeout(1)
+KILL_GRACE = 5  # seconds a command has to exit after SIGTERM before it's killed
+
+enabled = True  # run the LVM commands in a persistent `lvm shell`, set to False to start one process per command
+_local = threading.local()  # one shell per thread, so the workers of different VGs don't wait for each other
+_running = set()  # the shells with a running lvm process, of every thread (see close_all)
+_running_lock = threading.Lock()
+
+
+def quote(arg):
+    return f'"{arg}"' if not arg or any(c in arg for c in " \t'\"") else arg
+
+
+def terminate(process, grace=KILL_GRACE):
+    """
+    Stop a process: SIGTERM first (sudo relays it to the command), SIGKILL if it's still running after the grace period.
+    """
+    process.terminate()
+    try:
+        process.wait(grace)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    for pipe in (process.stdin, process.stdout, process.stderr):
+        if pipe is not None:
+            pipe.close()
+
+
+def run_process(argv, timeout=None):
+    """
+    Run a process to completion, stopping it if it outlives its timeout.
+
+    Args:
+        argv (list): the command.
+        timeout (float, optional): seconds the command may run. Defaults to no limit.
+
+    Returns:
+        CompletedProcess: the return code and the text output, TIMEOUT_RETURNCODE if the command was stopped.
+    """
+    process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        terminate(process)  # its output is dropped, a command still holding the pipes would block the read
+        return subprocess.CompletedProcess(argv, TIMEOUT_RETURNCODE, "", f"timed out after {timeout}s")
+    return subprocess.CompletedProcess(argv, process.returncode, stdout, stderr)
+
+
+def extract_json(text):
+    """
+    Extract and merge the JSON objects printed by LVM, ignoring the other lines.
+
+    Args:
+        text (str): output of the command.
+
+    Returns:
+        dict: the merged JSON objects (e.g. {"report": [...], "log": [...]}), empty if there are none.
+    """
+    decoder = json.JSONDecoder()
+    merged = {}
+    position = text.find("{")
+    while position != -1:
+        try:
+            value, end = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            position = text.find("{", position + 1)
+            continue
+        if isinstance(value, dict):
+            merged.update(value)
+        position = text.find("{", end)
+    return merged
+
+
+class LVMShell:
+    """
+    Persistent `lvm shell` session.
+
+    The commands are written to the stdin of a single lvm process, which reads the device metadata once,
+    instead of starting `sudo` and `lvm` and rescanning the devices for every command. Each command reports
+    its log as JSON, which gives its return code.
+    """
+
+    def __init__(self, command=LVM_COMMAND):
+        self.command = command
+        self.process = None
+
+    def start(self):
+        if self.process is not None:  # the previous shell exited: reap it and close its pipes
+            self.close()
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with _running_lock:
+            _running.add(self)
+        self._read_until_prompt()
+        logging.debug(f"Started lvm shell (pid {self.process.pid}).")
+
+    def close(self):
+        with _running_lock:
+            _running.discard(self)
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(b"exit\n")
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        for pipe in (self.process.stdout, self.process.stderr):
+            pipe.close()
+        self.process = None
+
+    def _read_until_prompt(self, timeout=None):
+        """
+        Read the output of the shell until its next prompt.
+
+        Args:
+            timeout (float, optional): seconds to wait for the prompt. Defaults to no limit.
+
+        Raises:
+            TimeoutExpired: if the prompt didn't come back in time.
+
+        Returns:
+            tuple: (stdout, stderr) as bytes, without the prompt.
+        """
+        output = {self.process.stdout.fileno(): b"", self.process.stderr.fileno(): b""}
+        stdout_fd = self.process.stdout.fileno()
+        deadline = None if timeout is None else monotonic() + timeout
+        with selectors.DefaultSelector() as selector:
+            for fd in output:
+                selector.register(fd, selectors.EVENT_READ)
+            while not output[stdout_fd].endswith(PROMPT):
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise subprocess.TimeoutExpired(self.command, timeout)
+                for key, _ in selector.select(remaining):
+                    data = os.read(key.fd, 65536)
+                    if not data:
+                        raise EOFError(f"lvm shell exited: {output[self.process.stderr.fileno()].decode(errors='replace')}")
+                    output[key.fd] += data
+        return output[stdout_fd][:-len(PROMPT)], output[self.process.stderr.fileno()]
+
+    def run(self, argv, timeout=None):
+        """
+        Run one LVM command in the shell.
+
+        Args:
+            argv (list): the command without `lvm` (e.g. ["lvextend", "-L", "+1G", "/dev/mapper/vg-lv"]).
+            timeout (float, optional): seconds the command may run, the shell is stopped after. Defaults to no limit.
+
+        Returns:
+            CompletedProcess: the return code and the text output. Its `report` attribute holds the JSON output.
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        options = REPORT_OPTIONS if "--reportformat" not in argv else REPORT_OPTIONS[2:]
+        line = " ".join(quote(arg) for arg in argv + options)
+        try:
+            self.process.stdin.write(line.encode() + b"\n")
+            self.process.stdin.flush()
+        except BrokenPipeError:  # the shell exited since the last command, the command was not sent
+            self.start()
+            self.process.stdin.write(line.encode() + b"\n")
+            self.process.stdin.flush()
+        try:
+            stdout, stderr = self._read_until_prompt(timeout)
+        except EOFError as e:  # the shell died while running the command: don't run it again, report the failure
+            self.close()
+            return subprocess.CompletedProcess(["lvm"] + argv, 5, "", str(e))
+        except subprocess.TimeoutExpired:  # the command hangs (e.g. on a lock): stop the shell, the next command starts a new one
+            terminate(self.process)
+            self.process = None
+            self.close()  # forget the stopped shell
+            return subprocess.CompletedProcess(["lvm"] + argv, TIMEOUT_RETURNCODE, "", f"timed out after {timeout}s")
+
+        stdout = stdout.decode(errors="replace")
+        if stdout.startswith(line):  # some builds of lvm echo the command
+            stdout = stdout[len(line):].lstrip("\n")
+        report = extract_json(stdout)
+        log = report.get("log", [])
+        if log:
+            returncode = 0 if int(log[-1].get("log_ret_code", LVM_SUCCESS)) == LVM_SUCCESS else 5
+        else:
+            returncode = 5 if stderr else 0
+        result = subprocess.CompletedProcess(["lvm"] + argv, returncode, stdout, stderr.decode(errors="replace"))
+        result.report = report
+        return result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get_shell():
+    """Get the shell of the current thread, started on first use."""
+    if getattr(_local, "shell", None) is None:
+        _local.shell = LVMShell()
+    return _local.shell
+
+
+def run_lvm(argv, check=False, timeout=None):
+    """
+    Run an LVM command, in the persistent shell of the thread if it's enabled.
+
+    Args:
+        argv (list): the command without `lvm` (e.g. ["lvremove", "-f", "/dev/mapper/vg-lv"]).
+        check (bool, optional): raise CalledProcessError if the command fails. Defaults to False.
+        timeout (float, optional): seconds the command may run. Defaults to no limit.
+
+    Returns:
+        CompletedProcess: the return code and the text output of the command.
+    """
+    global enabled
+    result = None
+    if enabled:
+        try:
+            result = get_shell().run(argv, timeout)
+        except (OSError, EOFError) as e:  # lvm too old to have a shell, or the shell could not be started
+            logging.warning(f"lvm shell unavailable ({e}), running the LVM commands one by one.")
+            _local.shell = None
+            enabled = False
+    if result is None:
+        result = run_process(LVM_COMMAND + argv, timeout)
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return result
+
+
+def close():
+    """Close the shell of the current thread."""
+    shell = getattr(_local, "shell", None)
+    if shell is not None:
+        shell.close()
+        _local.shell = None
+
+
+def close_all():
+    """
+    Close the shells of every thread, e.g. once a worker pool is shut down: the lvm processes would otherwise
+    run as root until the process exits. Call it when no command is running, a closed shell starts again at
+    its next command.
+    """
+    with _running_lock:
+        shells = list(_running)
+    for shell in shells:
+        shell.close()
+
+
+atexit.register(close_all)
@@ -0,0 +1,252 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter, time
+from .thinpools import pool_usage
+
+PREFIX = "lvm_autoextend"
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric family: one value (or one histogram) per combination of label values."""
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}  # label values -> value
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """Drop every label combination (e.g. the LVs that no longer exist)."""
+        with self.lock:
+            self.values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, *label_values, value):
+        with self.lock:
+            self.values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *label_values, value):
+        with self.lock:
+            counts, total = self.values.get(label_values, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets + (float("inf"),)):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[label_values] = (counts, total + value)
+
+    @contextmanager
+    def time(self, *label_values):
+        """Observe the duration of a with block, even if it raises."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*label_values, value=perf_counter() - start)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            for label_values, (counts, total) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    labels = format_labels(self.labels + ("le",), label_values + (format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+# Pipeline timings
+phase_duration = Histogram("phase_duration_seconds", "Duration of the phases of the scan and of the extensions.", ["phase"])
+command_duration = Histogram("command_duration_seconds", "Duration of the external commands.", ["command"])
+command_failures = Counter("command_failures_total", "External commands that exited with a non-zero status.", ["command"])
+command_timeouts = Counter("command_timeouts_total", "External commands stopped at their timeout.", ["command"])
+command_retries = Counter("command_retries_total", "LVM commands run again after a lock contention.", ["command"])
+command_output = Histogram("command_output_bytes", "Size of the output (stdout and stderr) of the external commands.", ["command"], buckets=SIZE_BUCKETS)
+command_waiting = Gauge("commands_waiting", "External commands waiting for a free slot (see executor.MAX_COMMANDS).")
+extensions = Counter("extensions_total", "Extensions of a filesystem, by result.", ["result"])
+extensions_in_progress = Gauge("extensions_in_progress", "Extensions running now (a stuck extension keeps it above 0).")
+last_extension = Gauge("last_extension_timestamp_seconds", "Time of the last successful extension of each LV.", ["lv"])
+
+# State of the host at the last scan
+filesystem_size = Gauge("filesystem_size_bytes", "Size of each mounted LV.", ["lv", "mount_point"])
+filesystem_used = Gauge("filesystem_used_bytes", "Used bytes of each mounted LV.", ["lv", "mount_point"])
+filesystem_use_ratio = Gauge("filesystem_use_ratio", "Use% of each mounted LV, between 0 and 1.", ["lv", "mount_point"])
+vg_free_extents = Gauge("vg_free_extents", "Free extents of each VG.", ["vg"])
+thin_pool_data_ratio = Gauge("thin_pool_data_ratio", "Fill of the data of each thin pool, between 0 and 1.", ["pool"])
+thin_pool_metadata_ratio = Gauge("thin_pool_metadata_ratio", "Fill of the metadata of each thin pool, between 0 and 1.", ["pool"])
+queue_depth = Gauge("queue_depth", "Busy filesystems waiting in the queue of bg_script.py.")
+queue_age = Gauge("queue_entry_age_seconds", "Time each LV has been waiting in the queue.", ["lv"])
+
+REGISTRY = [phase_duration, command_duration, command_failures, command_timeouts, command_retries, command_output, command_waiting,
+            extensions, extensions_in_progress, last_extension, filesystem_size, filesystem_used, filesystem_use_ratio, vg_free_extents, thin_pool_data_ratio, thin_pool_metadata_ratio, queue_depth, queue_age]
+
+
+def render():
+    """Render every metric in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def write_textfile(path):
+    """
+    Write the metrics for the textfile collector of node_exporter (written atomically, it's read at any time).
+
+    Args:
+        path (str): the .prom file, in the directory of the collector.
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        file.write(render())
+    os.replace(temporary, path)
+
+
+def serve(port, address="127.0.0.1"):
+    """
+    Serve the metrics on http://address:port/metrics from a background thread.
+
+    Returns:
+        ThreadingHTTPServer: the server, stop it with shutdown().
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # only loaded when the endpoint is enabled
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"Metrics : {self.address_string()} {format % args}")
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="lvm-autoextend-metrics", daemon=True).start()
+    logging.info(f"Metrics : serving on http://{address}:{port}/metrics.")
+    return server
+
+
+def record_filesystem(fs):
+    """Set the gauges of one mounted LV from its parsed filesystem."""
+    labels = (fs["Filesystem"].split("/")[-1], fs["Mount Point"])
+    filesystem_size.set(*labels, value=fs["Size"])
+    filesystem_used.set(*labels, value=fs["Used"])
+    filesystem_use_ratio.set(*labels, value=fs["Use%"] / 100)
+
+
+def record_host(filesystems, topology=None):
+    """
+    Set the gauges of the mounted LVs and of the VGs from a scan.
+
+    Args:
+        filesystems (list): the parsed filesystems.
+        topology (Topology, optional): the LVM topology.
+    """
+    for metric in (filesystem_size, filesystem_used, filesystem_use_ratio):
+        metric.clear()
+    for fs in filesystems:
+        record_filesystem(fs)
+    if topology is not None:
+        vg_free_extents.clear()
+        for vg in topology.vgs:
+            vg_free_extents.set(vg.vg_name, value=vg.free_count)
+        thin_pool_data_ratio.clear()
+        thin_pool_metadata_ratio.clear()
+        record_pools([pool_usage(pool) for pool in topology.thin_pools])
+
+
+def record_pools(pools):
+    """Set the gauges of the thin pools from their usage (see thinpools.pool_usage)."""
+    for usage in pools:
+        pool = usage["Filesystem"].split("/")[-1]
+        thin_pool_data_ratio.set(pool, value=usage["Used"] / usage["Size"] if usage["Size"] else 0.0)
+        metadata = usage["Metadata"]
+        thin_pool_metadata_ratio.set(pool, value=metadata["Used"] / metadata["Size"] if metadata["Size"] else 0.0)
+
+
+def record_queue(ages):
+    """
+    Set the gauges of the queue of the busy filesystems.
+
+    Args:
+        ages (dict): name of each queued LV -> seconds it has been waiting.
+    """
+    queue_depth.set(value=len(ages))
+    queue_age.clear()
+    for lv, age in ages.items():
+        queue_age.set(lv, value=age)
+
+
+def instrument_extension(function):
+    """Count the extensions of a function taking a parsed filesystem, their duration and their result."""
+    @wraps(function)
+    def instrumented(obj, *args, **kwargs):
+        extended = False
+        extensions_in_progress.inc()
+        try:
+            with phase_duration.time("extension"):
+                extended = function(obj, *args, **kwargs)
+            return extended
+        finally:
+            extensions_in_progress.dec()
+            extensions.inc("success" if extended else "failure")
+            if extended:
+                last_extension.set(obj["Filesystem"].split("/")[-1], value=time())
+    return instrumented
@@ -0,0 +1,146 @@
+import re
+import select
+import logging
+import threading
+
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+SYS_BLOCK_PATH = "/sys/dev/block"  # <major>:<minor>/dm/name holds the name of a device-mapper device
+CHANGE_EVENTS = select.POLLPRI | select.POLLERR  # what the kernel signals on the mount table when it changes
+
+
+def unescape(field):
+    """Decode the octal escapes of a mountinfo field (e.g. \\040 for a space)."""
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+
+class Mount:
+    """One line of the mount table."""
+    __slots__ = ("mount_id", "device", "root", "mount_point", "fs_type", "source")
+
+    def __init__(self, mount_id, device, root, mount_point, fs_type, source):
+        self.mount_id = mount_id
+        self.device = device  # major:minor of the mounted device
+        self.root = root  # directory of the filesystem mounted there, "/" unless it's a bind mount
+        self.mount_point = mount_point
+        self.fs_type = fs_type
+        self.source = source
+
+
+def parse_mountinfo(text):
+    """
+    Parse /proc/self/mountinfo.
+
+    Args:
+        text (str): content of the file.
+
+    Returns:
+        list: one Mount per line, in mount order.
+    """
+    mounts = []
+    for line in text.splitlines():
+        fields = line.split()
+        if "-" not in fields:
+            continue
+        separator = fields.index("-", 6)  # the optional fields end with a single hyphen
+        mounts.append(Mount(fields[0], fields[2], unescape(fields[3]), unescape(fields[4]),
+                            fields[separator + 1], unescape(fields[separator + 2])))
+    return mounts
+
+
+class MountTable:
+    """
+    Mount table of the process, read from mountinfo only when it changed.
+
+    The file is kept open and polled for POLLPRI, which the kernel raises when a filesystem is mounted or
+    unmounted, so asking for the mounts costs a poll() until the table really changes. Device-mapper
+    devices are matched by their major:minor, whatever path they were mounted from.
+    """
+
+    def __init__(self, path=MOUNTINFO_PATH, sys_block=SYS_BLOCK_PATH):
+        self.path = path
+        self.sys_block = sys_block
+        self.mounts = []
+        self.types = {}  # mount point -> filesystem type
+        self.dm_names = {}  # major:minor -> dm name, None if the device is not a dm device
+        self.file = None
+        self.poller = None
+        self.lock = threading.Lock()  # the workers ask for the mounts in parallel
+
+    def refresh(self):
+        """
+        Read the mount table again if it changed since it was last read.
+
+        Returns:
+            bool: True if it was read.
+        """
+        with self.lock:
+            if self.file is not None and not self.poller.poll(0):
+                return False
+            if self.file is None:
+                self.file = open(self.path, "rb")
+                self.poller = select.poll()
+                self.poller.register(self.file, CHANGE_EVENTS)
+            self.file.seek(0)
+            self.mounts = parse_mountinfo(self.file.read().decode(errors="replace"))
+            self.types = {mount.mount_point: mount.fs_type for mount in self.mounts}  # the last mount on a mount point hides the previous ones
+            self.dm_names = {}  # a removed device's number can be given to a new one
+            logging.debug(f"Mount table : read {len(self.mounts)} mounts.")
+            return True
+
+    def dm_name(self, device):
+        """
+        Get the name of a device-mapper device.
+
+        Args:
+            device (str): major:minor of the device.
+
+        Returns:
+            str: its name under /dev/mapper, None if it's not a dm device.
+        """
+        if device not in self.dm_names:
+            try:
+                with open(f"{self.sys_block}/{device}/dm/name") as file:
+                    self.dm_names[device] = file.read().strip()
+            except OSError:
+                self.dm_names[device] = None
+        return self.dm_names[device]
+
+    def lv_mounts(self):
+        """
+        Get the mounted device-mapper devices (the LVs), each at its first mount point.
+
+        Returns:
+            list: (/dev/mapper path, mount point) tuples.
+        """
+        self.refresh()
+        mounts, seen = [], set()
+        for mount in self.mounts:
+            if mount.root != "/" or mount.device in seen:  # bind mounts show the same filesystem again
+                continue
+            name = self.dm_name(mount.device)
+            if name is None:
+                continue
+            seen.add(mount.device)
+            mounts.append((f"/dev/mapper/{name}", mount.mount_point))
+        return mounts
+
+    def filesystem_type(self, mount_point):
+        """Get the type of the filesystem mounted at a mount point, None if nothing is mounted there."""
+        self.refresh()
+        return self.types.get(mount_point)
+
+    def watch(self, callback, stop, interval=1):
+        """
+        Call `callback` each time the mount table changes, until `stop` is set (run it in a thread).
+
+        Args:
+            callback (callable): called without arguments after each change.
+            stop (threading.Event): stops the watch.
+            interval (float, optional): seconds between two checks of `stop`. Defaults to 1.
+        """
+        with open(self.path, "rb") as file:  # its own file: each open file gets every change event
+            poller = select.poll()
+            poller.register(file, CHANGE_EVENTS)
+            while not stop.is_set():
+                if poller.poll(interval * 1000):
+                    callback()
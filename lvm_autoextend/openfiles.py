@@ -0,0 +1,170 @@
+import os
+import re
+import logging
+import threading
+from time import monotonic
+
+PROC_PATH = "/proc"
+
+
+def mount_of(path, mount_points):
+    """
+    Get the device of the mount holding a path, from the mount table only (nothing under the path is accessed).
+
+    Args:
+        path (str): absolute path, e.g. the target of /proc/<pid>/cwd.
+        mount_points (dict): mount point -> st_dev (see read_mountinfo).
+
+    Returns:
+        int: st_dev of the deepest mount point containing the path, None if none does.
+    """
+    if path.endswith(" (deleted)"):  # the directory was removed, it's still on its filesystem
+        path = path[:-len(" (deleted)")]
+    while True:
+        if path in mount_points:
+            return mount_points[path]
+        if path in ("/", ""):
+            return None
+        path = os.path.dirname(path)
+
+
+def read_mountinfo(proc=PROC_PATH):
+    """
+    Read the mount table of the current process.
+
+    Args:
+        proc (str, optional): path of the proc filesystem. Defaults to /proc.
+
+    Returns:
+        tuple: (mount id -> st_dev, mount point -> st_dev)
+    """
+    by_id, by_mount_point = {}, {}
+    with open(f"{proc}/self/mountinfo") as file:
+        for line in file:
+            fields = line.split()
+            major, minor = fields[2].split(":")
+            dev = os.makedev(int(major), int(minor))
+            by_id[fields[0]] = dev
+            # mount points are octal-escaped (e.g. \040 for a space)
+            by_mount_point[re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[4])] = dev
+    return by_id, by_mount_point
+
+
+class OpenFileIndex:
+    """
+    Index of the processes holding each device, built in one sweep over /proc.
+
+    Every process is inspected once (open file descriptors, cwd, root and memory mapped files) and the
+    devices they use are mapped to the set of PIDs holding them, so checking whether a filesystem is busy
+    is a dictionary lookup instead of one lsof per mount point. The index is rebuilt when its TTL expires
+    or when invalidate() is called. The worker threads share one index: a lookup waits for the rebuild in
+    progress instead of sweeping /proc again.
+    """
+
+    def __init__(self, ttl=5, proc=PROC_PATH):
+        self.ttl = ttl  # seconds before the index is considered stale
+        self.proc = proc
+        self.holders = {}  # st_dev -> set of PIDs holding the device
+        self.mount_points = {}  # mount point -> st_dev
+        self._built_at = None
+        self.lock = threading.Lock()  # the workers check their filesystems in parallel
+
+    def invalidate(self):
+        """Force the index to be rebuilt on the next lookup."""
+        self._built_at = None
+
+    def rebuild(self):
+        """
+        Sweep /proc and rebuild the index.
+
+        Returns:
+            dict: st_dev -> set of PIDs holding the device.
+        """
+        mounts_by_id, self.mount_points = read_mountinfo(self.proc)
+        holders = {}
+        denied = 0
+        own_pid = str(os.getpid())
+        for pid in os.listdir(self.proc):
+            if not pid.isdigit() or pid == own_pid:
+                continue
+            try:
+                devices = self._process_devices(f"{self.proc}/{pid}", mounts_by_id, self.mount_points)
+            except PermissionError:
+                denied += 1
+                continue
+            except (FileNotFoundError, ProcessLookupError):  # the process exited during the sweep
+                continue
+            for dev in devices:
+                holders.setdefault(dev, set()).add(int(pid))
+
+        if denied:
+            logging.warning(f"Open file index: {denied} processes could not be inspected (not running as root?).")
+        self.holders = holders
+        self._built_at = monotonic()
+        return holders
+
+    def _process_devices(self, base, mounts_by_id, mount_points):
+        """
+        Collect the devices used by one process.
+
+        Args:
+            base (str): /proc/<pid> directory of the process.
+            mounts_by_id (dict): mount id -> st_dev.
+            mount_points (dict): mount point -> st_dev.
+
+        Returns:
+            set: st_dev of every device the process holds.
+        """
+        devices = set()
+        # readlink only prints the path of the cwd and root (stat() would ask their filesystem, and hang on a
+        # stale NFS mount): their device is the one of the mount holding that path
+        for link in ("cwd", "root"):
+            try:
+                dev = mount_of(os.readlink(f"{base}/{link}"), mount_points)
+            except FileNotFoundError:  # kernel threads have no cwd/root
+                continue
+            if dev is not None:
+                devices.add(dev)
+
+        # fdinfo gives the mount id of every open file without stat()ing it, so stale NFS mounts can't hang the sweep
+        for fd in os.listdir(f"{base}/fdinfo"):
+            try:
+                with open(f"{base}/fdinfo/{fd}") as file:
+                    for line in file:
+                        if line.startswith("mnt_id:"):
+                            dev = mounts_by_id.get(line.split()[1])
+                            if dev is not None:
+                                devices.add(dev)
+                            break
+            except FileNotFoundError:  # the file was closed during the sweep
+                continue
+
+        with open(f"{base}/maps") as file:
+            for line in file:
+                fields = line.split(maxsplit=5)
+                if len(fields) < 6 or fields[4] == "0":  # anonymous mapping
+                    continue
+                major, minor = fields[3].split(":")
+                devices.add(os.makedev(int(major, 16), int(minor, 16)))
+        return devices
+
+    def pids(self, mount_point):
+        """
+        Get the PIDs holding the filesystem mounted at the given mount point.
+
+        Args:
+            mount_point (str): The mount point of the filesystem.
+
+        Returns:
+            set: PIDs holding the filesystem.
+        """
+        with self.lock:
+            if self._built_at is None or monotonic() - self._built_at > self.ttl:
+                self.rebuild()
+            dev, holders = self.mount_points.get(mount_point), self.holders
+        if dev is None:
+            dev = os.stat(mount_point).st_dev
+        return holders.get(dev, set())
+
+    def is_busy(self, mount_point):
+        return bool(self.pids(mount_point))
@@ -0,0 +1,216 @@
+import logging
+
+GiB = 1024 ** 3
+
+# Cost model, in estimated seconds of work (or downtime) per source of space
+COST_VGEXTEND = 1  # add a free PV to the VG
+COST_LV_CHANGE = 1  # reduce or remove an LV without a filesystem
+COST_UNMOUNT = 5  # unmount and remount a donor filesystem
+FSCK_SECONDS_PER_GIB = 2  # e2fsck -f of a donor, proportional to its size
+MOVE_SECONDS_PER_GIB = 10  # blocks relocated by resize2fs when a donor is shrunk
+SHRINKABLE_TYPES = ("ext2", "ext3", "ext4")  # xfs can't be shrunk
+DONOR_TARGET_USAGE = 0.7  # a donor is shrunk to keep its usage under the threshold minus 10% for security
+DONOR_MIN_FREE = 0.8  # a donor must keep more than this fraction of its size available after giving space
+
+
+def round_up(size, extent_size):
+    return -(-size // extent_size) * extent_size if extent_size else size
+
+
+def round_down(size, extent_size):
+    return size // extent_size * extent_size if extent_size else size
+
+
+class Step:
+    """
+    One operation of a plan.
+
+    Actions:
+        vgextend: add the PV `target` to the VG `vg`.
+        lvreduce: reduce the LV `target` (without filesystem) by `size` bytes.
+        lvremove: remove the LV `target` (without filesystem), `size` is its size.
+        shrink: unmount the filesystem `target` (parsed filesystem), shrink it and its LV `lv` by `size` bytes, remount it.
+        lvextend: extend the LV `target` by `size` bytes.
+        poolmetadata: extend the metadata of the thin pool `target` by `size` bytes.
+    """
+    def __init__(self, action, target, size, vg=None, cost=0, lv=None):
+        self.action = action
+        self.target = target
+        self.size = size  # bytes
+        self.vg = vg
+        self.cost = cost  # estimated seconds
+        self.lv = lv  # LV of a donor filesystem
+
+    def describe(self):
+        name = self.target["Filesystem"] if self.action == "shrink" else getattr(self.target, "dm_path", self.target)
+        return f"{self.action} {name} {self.size}B" + (f" ({self.vg})" if self.action == "vgextend" else "")
+
+
+class Plan:
+    """Steps to grow a set of LVs, with the LVs that can't be grown."""
+    def __init__(self):
+        self.steps = {}  # dm name of the LV to grow -> list of Step, ending with its lvextend and/or poolmetadata
+        self.infeasible = {}  # dm name of the LV to grow -> missing bytes
+
+    @property
+    def feasible(self):
+        return not self.infeasible
+
+    @property
+    def cost(self):
+        return sum(step.cost for steps in self.steps.values() for step in steps)
+
+
+def donor_capacity(fs, extent_size, writing_speed=0):
+    """
+    Get the bytes a mounted filesystem can give without going over the threshold.
+
+    Args:
+        fs (dict): the parsed filesystem.
+        extent_size (int): extent size of its VG in bytes.
+        writing_speed (float, optional): its write throughput in kB/s, one hour of writes is kept available.
+
+    Returns:
+        int: bytes that can be taken from it, rounded down to extents.
+    """
+    capacity = int(fs["Size"] * DONOR_TARGET_USAGE - fs["Used"])
+    if fs["Available"] - capacity - writing_speed * 1024 * 3600 <= fs["Size"] * (1 - DONOR_MIN_FREE) and capacity > 0:
+        capacity = int(fs["Available"] - writing_speed * 1024 * 3600 - fs["Size"] * (1 - DONOR_MIN_FREE))
+    return max(round_down(capacity, extent_size), 0)
+
+
+def shrink_cost(fs, size):
+    """Estimated seconds to unmount, check, shrink and remount a donor filesystem."""
+    return COST_UNMOUNT + FSCK_SECONDS_PER_GIB * fs["Size"] / GiB + MOVE_SECONDS_PER_GIB * min(fs["Used"], size) / GiB
+
+
+def plan_growth(topology, filesystems, demands, is_busy=None, writing_speed=None, filesystem_type=None, metadata=None):
+    """
+    Compute the complete plan to grow a set of LVs before running any command.
+
+    The space of each LV comes, in order of cost, from the free extents of its VG, free PVs (vgextend),
+    LVs of its VG without a filesystem (lvreduce/lvremove), then mounted filesystems of its VG that can be
+    shrunk (the cheapest first: fsck time and relocated bytes). Busy donors can't be unmounted and are never
+    used. An LV whose demand can't be fully met gets no step at all, so nothing is shrunk for nothing.
+
+    A thin LV only grows its virtual size: it takes nothing from the VG and gets a single lvextend, its pool
+    is extended on its own when its data or metadata fills up. Thin pools, thin LVs and internal LVs are never
+    reduced, removed or shrunk for space, nor are the unmounted LVs that are open (swap, raw volumes, VM disks),
+    snapshots and their origins.
+
+    Args:
+        topology (Topology): the LVM topology.
+        filesystems (list): the parsed filesystems.
+        demands (dict): dm name of each LV to grow -> bytes to add, in order of priority.
+        is_busy (callable, optional): mount point -> True if the filesystem is in use. Defaults to never busy.
+        writing_speed (callable, optional): device -> write throughput in kB/s. Defaults to 0.
+        filesystem_type (callable, optional): mount point -> filesystem type. Defaults to shrinkable.
+        metadata (dict, optional): dm name of a thin pool -> the part of its demand that goes to its metadata.
+
+    Returns:
+        Plan: the steps of every LV that can be grown and the missing bytes of the others.
+    """
+    plan = Plan()
+    mounted = {fs["Filesystem"].split("/")[-1]: fs for fs in filesystems}
+    vg_free = {vg.vg_name: vg.free_count * vg.extent_size for vg in topology.vgs}
+    free_pvs = sorted(topology.free_pvs, key=lambda pv: pv.pv_free)
+    unused = {}  # VG name -> [LV, remaining bytes]
+    metadata = metadata or {}
+    for lv in topology.lvs:
+        if lv.is_thin_pool or lv.is_thin or lv.hidden:  # removing a pool destroys its thin LVs, a thin LV frees no extent
+            continue
+        if lv.is_open or lv.in_snapshot:  # not mounted but still in use (swap, raw volume, VM disk), or shared with a snapshot
+            continue
+        if lv.dm_name not in mounted and lv.dm_name not in demands:
+            unused.setdefault(lv.vg_name, []).append([lv, lv.lv_size])
+    donors = {}  # VG name -> [(cost per byte, fs, capacity, LV)], built lazily since it checks busy state
+    used_donors = set()
+
+    def get_donors(vg):
+        if vg.vg_name not in donors:
+            candidates = []
+            for lv in vg.lvs:
+                fs = mounted.get(lv.dm_name)
+                if fs is None or lv.dm_name in demands or lv.is_thin:
+                    continue
+                if filesystem_type is not None and filesystem_type(fs["Mount Point"]) not in SHRINKABLE_TYPES:
+                    continue
+                if is_busy is not None and is_busy(fs["Mount Point"]):
+                    continue
+                capacity = donor_capacity(fs, vg.extent_size, (writing_speed(fs["Filesystem"]) or 0) if writing_speed else 0)
+                if capacity > 0:
+                    candidates.append((shrink_cost(fs, capacity) / capacity, fs, capacity, lv))
+            donors[vg.vg_name] = sorted(candidates, key=lambda candidate: candidate[0])
+        return donors[vg.vg_name]
+
+    for dm_name, demand in demands.items():
+        lv = topology.lv(dm_name)
+        if lv is None or lv.vg is None:
+            logging.error(f"Planner : {dm_name} is not a known LV.")
+            plan.infeasible[dm_name] = demand
+            continue
+        vg = lv.vg
+        if lv.is_thin:
+            plan.steps[dm_name] = [Step("lvextend", lv, round_up(demand, vg.extent_size), vg.vg_name)]
+            continue
+        metadata_need = round_up(metadata.get(dm_name, 0), vg.extent_size)
+        need = round_up(demand - metadata.get(dm_name, 0), vg.extent_size) + metadata_need
+        steps = []
+        free = vg_free[vg.vg_name]
+        pvs_taken = []
+        unused_taken = []
+        donors_taken = []
+
+        # 1 - free PVs, only if the free extents of the VG are not enough
+        available = free
+        for pv in free_pvs:
+            if available >= need:
+                break
+            pvs_taken.append(pv)
+            available += round_down(pv.pv_free, vg.extent_size)
+            steps.append(Step("vgextend", pv.pv_name, pv.pv_free, vg.vg_name, COST_VGEXTEND))
+
+        # 2 - LVs of the VG without a filesystem
+        for entry in unused.get(vg.vg_name, []):
+            if available >= need:
+                break
+            unused_lv, remaining = entry
+            if remaining <= 0:
+                continue
+            take = min(remaining, round_up(need - available, vg.extent_size))
+            action = "lvremove" if take == remaining else "lvreduce"  # an earlier LV of the plan may have taken part of it
+            unused_taken.append((entry, take))
+            available += take
+            steps.append(Step(action, unused_lv, take, vg.vg_name, COST_LV_CHANGE))
+
+        # 3 - mounted filesystems of the VG that can be shrunk, the cheapest per byte first
+        if available < need:
+            for _, fs, capacity, donor_lv in get_donors(vg):
+                if available >= need:
+                    break
+                if fs["Filesystem"] in used_donors:
+                    continue
+                take = min(capacity, round_up(need - available, vg.extent_size))
+                donors_taken.append(fs["Filesystem"])
+                available += take
+                steps.append(Step("shrink", fs, take, vg.vg_name, shrink_cost(fs, take), donor_lv))
+
+        if available < need: # infeasible: report it and keep the sources for the next LVs
+            logging.critical(f"Planner : There's no available space for extending {dm_name}: {need - available} bytes missing.")
+            plan.infeasible[dm_name] = need - available
+            continue
+
+        # Commit the sources taken by this LV
+        for pv in pvs_taken:
+            free_pvs.remove(pv)
+        for entry, take in unused_taken:
+            entry[1] -= take
+        used_donors.update(donors_taken)
+        vg_free[vg.vg_name] = available - need
+        if metadata_need:
+            steps.append(Step("poolmetadata", lv, metadata_need, vg.vg_name))
+        if need > metadata_need:
+            steps.append(Step("lvextend", lv, need - metadata_need, vg.vg_name))
+        plan.steps[dm_name] = steps
+
+    return plan
@@ -0,0 +1,94 @@
+import os
+import json
+import hmac
+import asyncio
+
+PROTOCOL_VERSION = 1
+DEFAULT_ADDRESS = "unix:/run/lvm-autoextend.sock"
+MESSAGE_LIMIT = 64 * 1024 ** 2  # longest message, the snapshot of a host of thousands of LVs is a few MB
+
+
+class ProtocolError(Exception):
+    """An agent answered with an error, or not in the protocol."""
+
+
+def parse_address(address):
+    """
+    Parse the address of an agent.
+
+    Args:
+        address (str): "unix:/path/of/the.sock", or "host:port" for TCP.
+
+    Returns:
+        tuple: ("unix", path) or ("tcp", host, port).
+    """
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"{address}: expected unix:PATH or HOST:PORT")
+    return "tcp", host.strip("[]"), int(port)
+
+
+async def open_connection(address):
+    """Connect to an agent (see parse_address)."""
+    parsed = parse_address(address)
+    if parsed[0] == "unix":
+        return await asyncio.open_unix_connection(parsed[1], limit=MESSAGE_LIMIT)
+    return await asyncio.open_connection(parsed[1], parsed[2], limit=MESSAGE_LIMIT)
+
+
+async def start_server(handler, address):
+    """Serve the connections of an address (see parse_address) with `handler(reader, writer)`."""
+    parsed = parse_address(address)
+    if parsed[0] == "unix":
+        if os.path.exists(parsed[1]):  # left by an agent that didn't exit cleanly
+            os.unlink(parsed[1])
+        server = await asyncio.start_unix_server(handler, parsed[1], limit=MESSAGE_LIMIT)
+        os.chmod(parsed[1], 0o600)  # the agent runs the extensions as root
+        return server
+    return await asyncio.start_server(handler, parsed[1], parsed[2], limit=MESSAGE_LIMIT)
+
+
+def remove_socket(address):
+    """Remove the socket file of a Unix address once its server is closed."""
+    parsed = parse_address(address)
+    if parsed[0] == "unix" and os.path.exists(parsed[1]):
+        os.unlink(parsed[1])
+
+
+async def read_message(reader):
+    """
+    Read one message: a JSON object on one line.
+
+    Returns:
+        dict: the message, None at the end of the connection.
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        message = json.loads(line)
+    except ValueError as e:
+        raise ProtocolError(f"invalid message: {e}")
+    if not isinstance(message, dict):
+        raise ProtocolError("invalid message: not an object")
+    return message
+
+
+async def write_message(writer, message):
+    writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+    await writer.drain()
+
+
+def check_token(message, token):
+    """Check the shared secret of a request, any request is accepted if the agent has none (only on a Unix socket, see Agent.run)."""
+    return token is None or hmac.compare_digest(str(message.get("token", "")), token)
+
+
+def read_token(path):
+    """Read the shared secret of the agents and the controller from a file, None without a file."""
+    if path is None:
+        return None
+    with open(path) as file:
+        return file.read().strip()
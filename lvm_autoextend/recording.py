@@ -0,0 +1,225 @@
+import gzip
+import json
+import atexit
+import socket
+import logging
+import threading
+import subprocess
+from time import perf_counter, sleep, time
+from . import executor
+from .executor import Executor, SystemExecutor
+from .lvmshell import extract_json
+
+FORMAT_VERSION = 1
+NOT_RECORDED = 127  # return code of a command missing from the archive, like a command not found
+PROBES = ("is_busy", "filesystem_type", "mounted_lvs", "usage", "sample_writes", "writing_speed")
+
+
+class RecordingExecutor(Executor):
+    """
+    Passes every command and probe to another backend and records it: arguments, output, return code and duration.
+
+    The archive (see save) is gzipped JSON lines: a header, then one line per call in the order they were
+    made. ReplayExecutor feeds it back, so a run of a production host can be profiled on any machine.
+    """
+
+    def __init__(self, inner=None):
+        self.inner = inner or SystemExecutor()
+        self.records = []
+        self.started = time()
+        self.lock = threading.Lock()  # the workers of different VGs call in parallel
+
+    def _record(self, call, args, function, *call_args):
+        start = perf_counter()
+        record = {"call": call, "args": args}
+        try:
+            value = function(*call_args)
+        except OSError as e:  # e.g. statvfs of a filesystem unmounted meanwhile, raised again by the replay
+            record.update(seconds=round(perf_counter() - start, 6), error=str(e))
+            with self.lock:
+                self.records.append(record)
+            raise
+        record["seconds"] = round(perf_counter() - start, 6)
+        if isinstance(value, subprocess.CompletedProcess):
+            record.update(returncode=value.returncode, stdout=value.stdout or "", stderr=value.stderr or "")
+            if getattr(value, "report", None) is not None:
+                record["report"] = True  # extracted again from stdout when it's replayed
+        else:
+            record["value"] = value
+        with self.lock:
+            self.records.append(record)
+        return value
+
+    def run(self, argv, timeout=None):
+        return self._record("run", argv, self.inner.run, argv, timeout)
+
+    def run_lvm(self, argv, timeout=None):
+        return self._record("run_lvm", argv, self.inner.run_lvm, argv, timeout)
+
+    def is_busy(self, mount_point):
+        return self._record("is_busy", [mount_point], self.inner.is_busy, mount_point)
+
+    def filesystem_type(self, mount_point):
+        return self._record("filesystem_type", [mount_point], self.inner.filesystem_type, mount_point)
+
+    def mounted_lvs(self):
+        return self._record("mounted_lvs", [], self.inner.mounted_lvs)
+
+    def usage(self, mount_point):
+        return self._record("usage", [mount_point], self.inner.usage, mount_point)
+
+    def sample_writes(self, interval=None):
+        return self._record("sample_writes", [interval], self.inner.sample_writes, interval)
+
+    def writing_speed(self, device, interval=1):
+        return self._record("writing_speed", [device, interval], self.inner.writing_speed, device, interval)
+
+    def save(self, path):
+        """
+        Write the archive of the calls recorded so far.
+
+        Args:
+            path (str): the archive, gzipped JSON lines (e.g. host.jsonl.gz).
+        """
+        with self.lock:
+            records = list(self.records)
+        with gzip.open(path, "wt") as file:
+            file.write(json.dumps({"version": FORMAT_VERSION, "host": socket.gethostname(), "recorded": self.started}) + "\n")
+            for record in records:
+                file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        logging.info(f"Recording : saved {len(records)} calls to {path}.")
+
+
+class ReplayExecutor(Executor):
+    """
+    Answers the commands and probes from an archive of RecordingExecutor, without root nor LVM.
+
+    Each call gets the next recorded answer to the same call with the same arguments, in the recorded order,
+    and the last one again once they are used up (e.g. a probe polled more often than during the recording).
+    A command missing from the archive fails with NOT_RECORDED. The recorded durations are waited for,
+    divided by `speed`, so the run keeps the timing of the host (speed=0 answers at once).
+    """
+
+    def __init__(self, records, speed=1, header=None):
+        self.header = header or {}
+        self.speed = speed
+        self.answers = {}  # (call, arguments) -> its recorded answers, in order
+        for record in records:
+            self.answers.setdefault((record["call"], json.dumps(record["args"])), []).append(record)
+        self.replayed = {}  # (call, arguments) -> number of answers given
+        self.missing = []  # the calls that were not in the archive
+        self.calls = 0  # every command replayed (the processes a real run would start)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, speed=1):
+        """
+        Load an archive written by RecordingExecutor.save.
+
+        Args:
+            path (str): the archive.
+            speed (float, optional): time compression of the recorded durations, 0 to answer at once. Defaults to 1.
+
+        Returns:
+            ReplayExecutor: the backend replaying the archive.
+        """
+        with gzip.open(path, "rt") as file:
+            header = json.loads(file.readline())
+            if header.get("version") != FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported archive version {header.get('version')}")
+            records = [json.loads(line) for line in file if line.strip()]
+        return cls(records, speed, header)
+
+    def _answer(self, call, args):
+        key = (call, json.dumps(args))
+        with self.lock:
+            if call not in PROBES:
+                self.calls += 1
+            answers = self.answers.get(key)
+            if not answers:
+                self.missing.append(key)
+                return None
+            index = self.replayed.get(key, 0)
+            self.replayed[key] = index + 1
+            record = answers[min(index, len(answers) - 1)]
+        if self.speed:
+            sleep(record["seconds"] / self.speed)
+        return record
+
+    def _completed(self, call, argv, typed):
+        record = self._answer(call, argv)
+        if record is None:
+            logging.warning(f"Replay : {' '.join(typed)} is not in the archive.")
+            return subprocess.CompletedProcess(typed, NOT_RECORDED, "", f"{argv[0]}: not recorded")
+        completed = subprocess.CompletedProcess(typed, record["returncode"], record["stdout"], record["stderr"])
+        if record.get("report"):
+            completed.report = extract_json(record["stdout"])
+        return completed
+
+    def _probe(self, call, args, default=None):
+        record = self._answer(call, args)
+        if record is None:
+            return default
+        if "error" in record:
+            raise OSError(record["error"])
+        return record["value"]
+
+    def run(self, argv, timeout=None):
+        return self._completed("run", argv, ["sudo"] + argv)
+
+    def run_lvm(self, argv, timeout=None):
+        return self._completed("run_lvm", argv, ["lvm"] + argv)
+
+    def is_busy(self, mount_point):
+        return self._probe("is_busy", [mount_point], default=False)
+
+    def filesystem_type(self, mount_point):
+        return self._probe("filesystem_type", [mount_point])
+
+    def mounted_lvs(self):
+        return self._probe("mounted_lvs", [], default=[])
+
+    def usage(self, mount_point):
+        usage = self._probe("usage", [mount_point])
+        if usage is None:
+            raise FileNotFoundError(f"{mount_point}: usage not recorded")
+        return usage
+
+    def sample_writes(self, interval=None):
+        self._probe("sample_writes", [interval])
+
+    def writing_speed(self, device, interval=1):
+        return self._probe("writing_speed", [device, interval])
+
+
+def start_recording(path):
+    """
+    Record the commands and probes of the rest of the process, the archive is saved when it exits.
+
+    Args:
+        path (str): the archive to write.
+
+    Returns:
+        RecordingExecutor: the recording backend.
+    """
+    recorder = RecordingExecutor(executor.get_executor())
+    executor.set_executor(recorder)
+    atexit.register(recorder.save, path)  # saved even if the run fails, that's the run worth replaying
+    return recorder
+
+
+def start_replay(path, speed=1):
+    """
+    Replace the host by an archive for the rest of the process.
+
+    Args:
+        path (str): the archive written by a recording.
+        speed (float, optional): time compression of the recorded durations, 0 to answer at once. Defaults to 1.
+
+    Returns:
+        ReplayExecutor: the replaying backend.
+    """
+    replay = ReplayExecutor.load(path, speed)
+    executor.set_executor(replay)
+    logging.info(f"Replay : {path}, recorded on {replay.header.get('host')} at {replay.header.get('recorded')}.")
+    return replay
@@ -0,0 +1,512 @@
+import json
+import shlex
+import logging
+import threading
+import subprocess
+from . import executor
+from .executor import Executor, SystemExecutor
+from .filesystems import scan_filesystems
+from .topology import load_topology
+from .units import convert_to_bytes
+
+DEFAULT_EXTENT_SIZE = 4 * 1024 ** 2  # 4 MiB, the default of vgcreate
+ONLINE_GROW_TYPES = ("ext3", "ext4", "xfs")  # resize2fs and xfs_growfs can grow them while mounted
+EXT_TYPES = ("ext2", "ext3", "ext4")  # the filesystems e2fsck and resize2fs know
+# Commands understood by the simulator -> method applying them to the model
+SIMULATED_COMMANDS = {
+    "fullreport": "_fullreport", "vgextend": "_vgextend", "lvextend": "_lvextend", "lvreduce": "_lvreduce",
+    "lvremove": "_lvremove", "e2fsck": "_e2fsck", "resize2fs": "_resize2fs", "xfs_growfs": "_xfs_growfs",
+    "umount": "_umount", "mount": "_mount", "lvs": "_lvs",
+}
+REPORT_OPTIONS_WITH_VALUE = ("--reportformat", "--units", "--configreport", "-o", "--config", "--select")  # options of the reports followed by a value
+LV_ATTRIBUTES = {"linear": "-wi-a-----", "thin-pool": "twi-a-tz--", "thin": "Vwi-a-tz--"}  # lv_attr of each segtype, "o" at 6th place once open
+
+
+def dm_name(vg_name, lv_name):
+    """Name of an LV under /dev/mapper (hyphens inside the names are doubled)."""
+    return f"{vg_name.replace('-', '--')}-{lv_name.replace('-', '--')}"
+
+
+class SimPV:
+    def __init__(self, name, size, uuid):
+        self.name = name
+        self.size = size
+        self.uuid = uuid
+        self.vg = None
+
+
+class SimVG:
+    def __init__(self, name, extent_size, uuid):
+        self.name = name
+        self.extent_size = extent_size
+        self.uuid = uuid
+        self.pvs = []
+        self.lvs = {}  # LV name -> SimLV
+
+    @property
+    def extent_count(self):
+        return sum(pv.size // self.extent_size for pv in self.pvs)
+
+    @property
+    def free_count(self):
+        return self.extent_count - sum(lv.extents for lv in self.lvs.values())
+
+
+class SimLV:
+    def __init__(self, vg, name, size, uuid):
+        self.vg = vg
+        self.name = name
+        self.size = size  # bytes, a multiple of the extent size of the VG (virtual for a thin LV)
+        self.uuid = uuid
+        self.segtype = "linear"  # or thin-pool, thin
+        self.pool = None  # SimLV of the thin pool of a thin LV
+        self.metadata_size = 0  # of a thin pool, in bytes
+        self.data_used = 0  # of a thin pool, bytes of its data written by its thin LVs
+        self.metadata_used = 0  # of a thin pool
+        self.filesystem = None
+
+    @property
+    def dm_path(self):
+        return f"/dev/mapper/{dm_name(self.vg.name, self.name)}"
+
+    @property
+    def extents(self):
+        """Extents of the VG taken by the LV: none for a thin LV, the data and the metadata for a thin pool."""
+        if self.segtype == "thin":
+            return 0
+        return (self.size + self.metadata_size) // self.vg.extent_size
+
+    def percent(self, used, size):
+        return f"{used * 100 / size:.2f}" if self.segtype == "thin-pool" and size else ""
+
+
+class SimFilesystem:
+    def __init__(self, lv, fs_type, size, used, mount_point, busy=False, writing_speed=0.0):
+        self.lv = lv
+        self.type = fs_type
+        self.size = size
+        self.used = used
+        self.mount_point = mount_point
+        self.mounted = mount_point is not None
+        self.busy = busy
+        self.writing_speed = writing_speed  # kB/s
+
+
+def result(argv, returncode=0, stdout="", stderr=""):
+    return subprocess.CompletedProcess(argv, returncode, stdout, stderr)
+
+
+class SimulatedExecutor(Executor):
+    """
+    In-memory model of the PVs, VGs, LVs and filesystems of a host.
+
+    The LVM and filesystem commands of the package are applied to the model (extents, mounts, usage and busy
+    state) instead of the host, and every command that changes it is recorded in `commands`. Build it with
+    the add_* methods, or from the current state of the host with from_host() to rehearse a run (--dry-run).
+    """
+
+    def __init__(self):
+        self.pvs = {}  # PV name -> SimPV
+        self.vgs = {}  # VG name -> SimVG
+        self.devices = {}  # /dev/mapper path -> SimLV
+        self.mounts = {}  # mount point -> SimFilesystem
+        self.commands = []  # the commands that changed the model, as they would be typed
+        self.calls = 0  # every command run, including the read-only ones (the processes a real run would start)
+        self.lock = threading.Lock()  # the workers of different VGs run commands in parallel
+        self._uuid = 0
+
+    def _next_uuid(self):
+        self._uuid += 1
+        return f"sim-{self._uuid:08d}"
+
+    def add_pv(self, name, size):
+        self.pvs[name] = SimPV(name, size, self._next_uuid())
+        return self.pvs[name]
+
+    def add_vg(self, name, pv_names, extent_size=DEFAULT_EXTENT_SIZE):
+        vg = self.vgs[name] = SimVG(name, extent_size, self._next_uuid())
+        for pv_name in pv_names:
+            self.pvs[pv_name].vg = vg
+            vg.pvs.append(self.pvs[pv_name])
+        return vg
+
+    def add_lv(self, vg_name, name, size):
+        vg = self.vgs[vg_name]
+        lv = vg.lvs[name] = SimLV(vg, name, -(-size // vg.extent_size) * vg.extent_size, self._next_uuid())
+        self.devices[lv.dm_path] = lv
+        return lv
+
+    def add_thin_pool(self, vg_name, name, size, metadata_size, data_used=0, metadata_used=0):
+        pool = self.add_lv(vg_name, name, size)
+        pool.segtype = "thin-pool"
+        pool.metadata_size = -(-metadata_size // pool.vg.extent_size) * pool.vg.extent_size
+        pool.data_used = data_used
+        pool.metadata_used = metadata_used
+        return pool
+
+    def add_thin_lv(self, vg_name, name, size, pool_name):
+        lv = self.add_lv(vg_name, name, size)
+        lv.segtype = "thin"
+        lv.pool = self.vgs[vg_name].lvs[pool_name]
+        return lv
+
+    def add_filesystem(self, device, fs_type, used, mount_point=None, size=None, busy=False, writing_speed=0.0):
+        lv = self.devices[device]
+        lv.filesystem = SimFilesystem(lv, fs_type, size or lv.size, used, mount_point, busy, writing_speed)
+        if mount_point is not None:
+            self.mounts[mount_point] = lv.filesystem
+        return lv.filesystem
+
+    @classmethod
+    def from_host(cls, host=None):
+        """
+        Build the model from the current state of the host, with read-only probes only.
+
+        Args:
+            host (Executor, optional): the backend of the real host. Defaults to a new SystemExecutor.
+
+        Returns:
+            SimulatedExecutor: the model of the host.
+        """
+        host = host or SystemExecutor()
+        previous = executor.set_executor(host)
+        try:
+            topology = load_topology()
+            filesystems = scan_filesystems()
+            host.sample_writes()
+            simulator = cls()
+            for pv in topology.pvs:
+                simulator.add_pv(pv.pv_name, pv.pv_size)
+            for vg in topology.vgs:
+                simulator.add_vg(vg.vg_name, [pv.pv_name for pv in vg.pvs], vg.extent_size or DEFAULT_EXTENT_SIZE)
+            for lv in sorted(topology.lvs, key=lambda lv: lv.is_thin):  # the pools before their thin LVs
+                if lv.vg_name not in simulator.vgs or lv.hidden:
+                    continue
+                if lv.is_thin_pool:
+                    simulator.add_thin_pool(lv.vg_name, lv.lv_name, lv.lv_size, lv.metadata_size,
+                                            int(lv.lv_size * lv.data_percent / 100), int(lv.metadata_size * lv.metadata_percent / 100))
+                elif lv.is_thin and lv.pool is not None:
+                    simulator.add_thin_lv(lv.vg_name, lv.lv_name, lv.lv_size, lv.pool_name)
+                else:
+                    simulator.add_lv(lv.vg_name, lv.lv_name, lv.lv_size)
+            for fs in filesystems:
+                device, mount_point = fs["Filesystem"], fs["Mount Point"]
+                if device not in simulator.devices:
+                    continue
+                simulator.add_filesystem(device, host.filesystem_type(mount_point), fs["Used"], mount_point,
+                                         size=fs["Size"], busy=host.is_busy(mount_point),
+                                         writing_speed=host.writing_speed(device) or 0.0)
+        finally:
+            executor.set_executor(previous)
+        return simulator
+
+    # Probes
+
+    def is_busy(self, mount_point):
+        fs = self.mounts.get(mount_point)
+        return fs is not None and fs.busy
+
+    def filesystem_type(self, mount_point):
+        fs = self.mounts.get(mount_point)
+        return fs.type if fs is not None else None
+
+    def mounted_lvs(self):
+        return [(fs.lv.dm_path, mount_point) for mount_point, fs in self.mounts.items()]
+
+    def usage(self, mount_point):
+        fs = self.mounts.get(mount_point)
+        if fs is None:
+            raise FileNotFoundError(f"{mount_point} is not mounted")
+        available = max(fs.size - fs.used, 0)
+        return {"Size": fs.size, "Used": fs.used, "Available": available, "Use%": -(-fs.used * 100 // fs.size) if fs.size else 0}
+
+    def sample_writes(self, interval=None):
+        pass
+
+    def writing_speed(self, device, interval=1):
+        lv = self.devices.get(device)
+        return lv.filesystem.writing_speed if lv is not None and lv.filesystem is not None else None
+
+    # Commands
+
+    def run(self, argv, timeout=None):
+        with self.lock:
+            return self._apply(argv, ["sudo"] + argv)
+
+    def run_lvm(self, argv, timeout=None):
+        with self.lock:
+            return self._apply(argv, ["lvm"] + argv)
+
+    def _apply(self, argv, typed):
+        self.calls += 1
+        handler = SIMULATED_COMMANDS.get(argv[0])
+        if handler is None:
+            return result(typed, 127, "", f"{argv[0]}: command not simulated")
+        completed = getattr(self, handler)(typed, argv[1:])
+        if completed.returncode == 0 and argv[0] not in ("fullreport", "lvs", "e2fsck"):
+            self.commands.append(shlex.join(typed))
+        elif completed.returncode != 0:
+            logging.debug(f"Simulator : {shlex.join(typed)} failed: {completed.stderr}")
+        return completed
+
+    def _lv(self, device):
+        return self.devices.get(device)
+
+    def _fullreport(self, typed, args):
+        names, position = [], 0
+        while position < len(args):  # the VG names, between the options and their values
+            if args[position] in REPORT_OPTIONS_WITH_VALUE:
+                position += 2
+                continue
+            if not args[position].startswith("-"):
+                names.append(args[position])
+            position += 1
+        missing = [name for name in names if name not in self.vgs]
+        if missing:
+            return result(typed, 5, "", f"Volume group \"{missing[0]}\" not found")
+        report = {"report": [self._vg_report(self.vgs[name]) for name in names or self.vgs]}
+        orphans = [pv for pv in self.pvs.values() if pv.vg is None]
+        if orphans and not names:  # like LVM, a report of some VGs has no orphan PVs
+            report["report"].append({"vg": [], "pv": [self._pv_report(pv, pv.size, "") for pv in orphans], "lv": [], "seg": []})
+        completed = result(typed, 0, json.dumps(report))
+        completed.report = report
+        return completed
+
+    def _lvs(self, typed, args):
+        fields = args[args.index("-o") + 1].split(",") if "-o" in args else ["lv_name", "vg_name", "lv_attr", "lv_size"]
+        selection = args[args.index("--select") + 1] if "--select" in args else None
+        segtype = selection.split("=", 1)[1] if selection is not None and selection.startswith("segtype=") else None  # the only selection simulated
+        rows = [self._lv_row(lv) for vg in self.vgs.values() for lv in vg.lvs.values() if segtype in (None, lv.segtype)]
+        report = {"report": [{"lv": [{field: row.get(field, "") for field in fields} for row in rows]}]}
+        completed = result(typed, 0, json.dumps(report))
+        completed.report = report
+        return completed
+
+    def _lv_row(self, lv):
+        attributes = LV_ATTRIBUTES[lv.segtype]
+        if lv.filesystem is not None and lv.filesystem.mounted:
+            attributes = attributes[:5] + "o" + attributes[6:]
+        return {"lv_name": lv.name, "lv_uuid": lv.uuid, "vg_name": lv.vg.name, "lv_attr": attributes, "lv_size": str(lv.size),
+                "lv_dm_path": lv.dm_path, "pool_lv": lv.pool.name if lv.pool is not None else "",
+                "data_percent": lv.percent(lv.data_used, lv.size), "metadata_percent": lv.percent(lv.metadata_used, lv.metadata_size),
+                "lv_metadata_size": str(lv.metadata_size) if lv.segtype == "thin-pool" else ""}
+
+    def _pv_report(self, pv, free, vg_name):
+        extent_size = pv.vg.extent_size if pv.vg is not None else DEFAULT_EXTENT_SIZE
+        pe_count = pv.size // extent_size if pv.vg is not None else 0
+        return {"pv_name": pv.name, "pv_uuid": pv.uuid, "vg_name": vg_name, "pv_size": str(pv.size),
+                "pv_free": str(free), "pv_pe_count": str(pe_count),
+                "pv_pe_alloc_count": str(pe_count - free // extent_size if pv.vg is not None else 0)}
+
+    def _vg_report(self, vg):
+        extent_count, free_count = vg.extent_count, vg.free_count
+        allocated = (extent_count - free_count) * vg.extent_size  # the LVs fill the PVs in order
+        pvs = []
+        for pv in vg.pvs:
+            pv_size = pv.size // vg.extent_size * vg.extent_size
+            taken = min(allocated, pv_size)
+            allocated -= taken
+            pvs.append(self._pv_report(pv, pv_size - taken, vg.name))
+        pvsegs = []
+        lvs = iter(vg.lvs.values())
+        lv, remaining = None, 0  # extents of the current LV not placed yet
+        for pv in vg.pvs:
+            start, pe_count = 0, pv.size // vg.extent_size
+            while start < pe_count:
+                while remaining == 0:
+                    lv = next(lvs, None)
+                    if lv is None:
+                        break
+                    remaining = lv.extents
+                if lv is None:
+                    break
+                size = min(remaining, pe_count - start)
+                pvsegs.append({"pv_uuid": pv.uuid, "lv_uuid": lv.uuid, "pvseg_start": str(start), "pvseg_size": str(size)})
+                start += size
+                remaining -= size
+        return {
+            "vg": [{"vg_name": vg.name, "vg_uuid": vg.uuid, "vg_attr": "wz--n-", "vg_size": str(extent_count * vg.extent_size),
+                    "vg_free": str(free_count * vg.extent_size), "vg_extent_size": str(vg.extent_size),
+                    "vg_extent_count": str(extent_count), "vg_free_count": str(free_count), "pv_count": str(len(vg.pvs)),
+                    "lv_count": str(len(vg.lvs)), "snap_count": "0"}],
+            "pv": pvs,
+            "lv": [self._lv_row(lv) for lv in vg.lvs.values()],
+            "seg": [{"lv_uuid": lv.uuid, "segtype": lv.segtype, "seg_start": "0", "seg_size": str(lv.size)} for lv in vg.lvs.values()],
+            "pvseg": pvsegs,
+        }
+
+    def _vgextend(self, typed, args):
+        vg, pv = self.vgs.get(args[0]), self.pvs.get(args[1])
+        if vg is None or pv is None:
+            return result(typed, 5, "", f"Volume group or physical volume not found: {' '.join(args)}")
+        if pv.vg is not None:
+            return result(typed, 5, "", f"Physical volume '{pv.name}' is already in volume group '{pv.vg.name}'")
+        pv.vg = vg
+        vg.pvs.append(pv)
+        return result(typed, 0, f'Volume group "{vg.name}" successfully extended')
+
+    def _resize_lv(self, typed, args, grow):
+        if "--poolmetadatasize" in args:
+            return self._extend_pool_metadata(typed, args)
+        options = [arg for arg in args if arg.startswith("-") and arg not in ("-L",)]
+        size = args[args.index("-L") + 1]
+        lv = self._lv(args[-1])
+        if lv is None:
+            return result(typed, 5, "", f"Failed to find logical volume {args[-1]}")
+        vg = lv.vg
+        if size[0] in "+-":
+            new_size = lv.size + (1 if size[0] == "+" else -1) * int(convert_to_bytes(size[1:]))
+        else:
+            new_size = int(convert_to_bytes(size))
+        new_size = -(-new_size // vg.extent_size) * vg.extent_size if grow else new_size // vg.extent_size * vg.extent_size
+        if not grow and lv.segtype == "thin-pool":
+            return result(typed, 5, "", "Thin pool volumes cannot be reduced in size yet.")
+        if grow and lv.segtype != "thin" and (new_size - lv.size) // vg.extent_size > vg.free_count:
+            return result(typed, 5, "", f'Insufficient free space: {(new_size - lv.size) // vg.extent_size} extents needed, but only {vg.free_count} available')
+        if not grow and new_size < vg.extent_size:
+            return result(typed, 5, "", f"Unable to reduce {vg.name}/{lv.name} below 1 extent.")
+        if not grow and "-f" not in options:
+            return result(typed, 5, "", f"Logical volume {lv.name} not reduced: confirmation needed (use -f).")
+        fs = lv.filesystem
+        if not grow and fs is not None and fs.size > new_size:
+            return result(typed, 5, "", f"Filesystem of {lv.name} ({fs.size} bytes) is larger than the new size ({new_size} bytes).")
+        lv.size = new_size
+        if grow and "-r" in options and fs is not None:
+            if fs.mounted and fs.type not in ONLINE_GROW_TYPES:
+                return result(typed, 5, "", f"Filesystem {fs.type} of {lv.name} can't be grown while mounted.")
+            fs.size = new_size
+        return result(typed, 0, f'Logical volume {vg.name}/{lv.name} successfully resized.')
+
+    def _extend_pool_metadata(self, typed, args):
+        size = args[args.index("--poolmetadatasize") + 1]
+        lv = self._lv(args[-1])
+        if lv is None or lv.segtype != "thin-pool":
+            return result(typed, 5, "", f"Failed to find thin pool {args[-1]}")
+        vg = lv.vg
+        grow = -(-int(convert_to_bytes(size.lstrip("+"))) // vg.extent_size) * vg.extent_size
+        if grow // vg.extent_size > vg.free_count:
+            return result(typed, 5, "", f'Insufficient free space: {grow // vg.extent_size} extents needed, but only {vg.free_count} available')
+        lv.metadata_size += grow
+        return result(typed, 0, f'Size of logical volume {vg.name}/{lv.name}_tmeta changed to {lv.metadata_size} bytes.')
+
+    def _lvextend(self, typed, args):
+        return self._resize_lv(typed, args, grow=True)
+
+    def _lvreduce(self, typed, args):
+        return self._resize_lv(typed, args, grow=False)
+
+    def _lvremove(self, typed, args):
+        lv = self._lv(args[-1])
+        if lv is None:
+            return result(typed, 5, "", f"Failed to find logical volume {args[-1]}")
+        if lv.filesystem is not None and lv.filesystem.mounted:
+            return result(typed, 5, "", f"Logical volume {lv.vg.name}/{lv.name} contains a filesystem in use.")
+        if any(thin.pool is lv for thin in lv.vg.lvs.values()):
+            return result(typed, 5, "", f"Logical volume {lv.vg.name}/{lv.name} is used by thin volumes.")
+        del lv.vg.lvs[lv.name]
+        del self.devices[lv.dm_path]
+        return result(typed, 0, f'Logical volume "{lv.name}" successfully removed.')
+
+    def _e2fsck(self, typed, args):
+        lv = self._lv(args[-1])
+        if lv is None or lv.filesystem is None:
+            return result(typed, 8, "", f"e2fsck: No such file or directory while trying to open {args[-1]}")
+        if lv.filesystem.mounted:
+            return result(typed, 8, "", f"{args[-1]} is mounted.\ne2fsck: Cannot continue, aborting.")
+        if lv.filesystem.type not in EXT_TYPES:
+            return result(typed, 8, "", f"e2fsck: Bad magic number in super-block while trying to open {args[-1]}")
+        return result(typed, 0, f"{args[-1]}: clean")
+
+    def _resize2fs(self, typed, args):
+        lv = self._lv(args[0])
+        fs = lv.filesystem if lv is not None else None
+        if fs is None:
+            return result(typed, 1, "", f"resize2fs: No such file or directory while trying to open {args[0]}")
+        if fs.type not in EXT_TYPES:
+            return result(typed, 1, "", f"resize2fs: Bad magic number in super-block while trying to open {args[0]}")
+        new_size = int(convert_to_bytes(args[1])) if len(args) > 1 else lv.size
+        if new_size > lv.size:
+            return result(typed, 1, "", f"The containing partition (or device) is only {lv.size} bytes.")
+        if new_size < fs.size and fs.mounted:
+            return result(typed, 1, "", f"On-line shrinking not supported for {args[0]}")
+        if new_size < fs.used:
+            return result(typed, 1, "", f"New size smaller than minimum ({fs.used} bytes)")
+        fs.size = new_size
+        return result(typed, 0, f"The filesystem on {args[0]} is now {new_size} bytes long.")
+
+    def _xfs_growfs(self, typed, args):
+        fs = self.mounts.get(args[-1])
+        if fs is None or fs.type != "xfs":
+            return result(typed, 1, "", f"xfs_growfs: {args[-1]} is not a mounted XFS filesystem")
+        fs.size = fs.lv.size
+        return result(typed, 0, f"data blocks changed to {fs.size // 4096}")
+
+    def _umount(self, typed, args):
+        fs = self.mounts.get(args[-1])
+        if fs is None:
+            return result(typed, 32, "", f"umount: {args[-1]}: not mounted.")
+        if fs.busy:
+            return result(typed, 32, "", f"umount: {args[-1]}: target is busy.")
+        fs.mounted = False
+        del self.mounts[args[-1]]
+        return result(typed, 0)
+
+    def _mount(self, typed, args):
+        lv = self._lv(args[0])
+        if lv is None or lv.filesystem is None:
+            return result(typed, 32, "", f"mount: {args[-1]}: special device {args[0]} does not exist.")
+        if args[1] in self.mounts:
+            return result(typed, 32, "", f"mount: {args[1]}: {args[0]} already mounted.")
+        lv.filesystem.mounted = True
+        lv.filesystem.mount_point = args[1]
+        self.mounts[args[1]] = lv.filesystem
+        return result(typed, 0)
+
+    def describe(self):
+        """
+        Describe the modelled topology.
+
+        Returns:
+            str: one line per VG, with its LVs and their filesystems below it.
+        """
+        lines = []
+        for vg in self.vgs.values():
+            lines.append(f"VG {vg.name}: {len(vg.pvs)} PVs, {vg.extent_count * vg.extent_size} bytes, {vg.free_count * vg.extent_size} free")
+            for lv in vg.lvs.values():
+                fs = lv.filesystem
+                usage = ""
+                if fs is not None:
+                    state = f"mounted on {fs.mount_point}" if fs.mounted else "not mounted"
+                    usage = f", {fs.type} {fs.size} bytes, {-(-fs.used * 100 // fs.size) if fs.size else 0}% used, {state}"
+                if lv.segtype == "thin-pool":
+                    usage = f", thin pool, data {lv.percent(lv.data_used, lv.size)}% used, metadata {lv.metadata_size} bytes {lv.percent(lv.metadata_used, lv.metadata_size)}% used"
+                elif lv.segtype == "thin":
+                    usage = f", thin in {lv.pool.name}{usage}"
+                lines.append(f"  LV {lv.name}: {lv.size} bytes{usage}")
+        orphans = [pv.name for pv in self.pvs.values() if pv.vg is None]
+        if orphans:
+            lines.append(f"Free PVs: {', '.join(orphans)}")
+        return "\n".join(lines)
+
+
+def start_dry_run():
+    """
+    Replace the host by its model for the rest of the process, so the next commands only change the model.
+
+    Returns:
+        SimulatedExecutor: the model of the host, pass it to print_dry_run() at the end of the run.
+    """
+    simulator = SimulatedExecutor.from_host()
+    executor.set_executor(simulator)
+    return simulator
+
+
+def print_dry_run(simulator):
+    """Print the commands a run would have typed and the topology it would have left."""
+    print("Commands:")
+    for command in simulator.commands:
+        print(f"  {command}")
+    if not simulator.commands:
+        print("  (none)")
+    print("Predicted topology:")
+    print(simulator.describe())
@@ -0,0 +1,56 @@
+GiB = 1024 ** 3
+MiB = 1024 ** 2
+
+MIN_INCREMENT = 1 * GiB  # the former fixed increment, and the smallest one
+SIZE_FRACTION = 0.1  # grow by at least this fraction of the current size
+TARGET_HOURS = 24  # grow by at least this many hours of the observed fill rate
+BACKOFF_WINDOW = 6 * 3600  # seconds during which the previous grows of a filesystem double its next increment
+MAX_BACKOFF = 4  # at most 2**MAX_BACKOFF times the increment
+MIN_METADATA_INCREMENT = 64 * MiB  # smallest increment of the metadata of a thin pool
+METADATA_FRACTION = 0.5  # grow the metadata of a thin pool by at least this fraction, a full one can corrupt the pool
+MAX_METADATA_SIZE = 255 * (2 ** 14 - 64) * 4 * 1024  # largest metadata of a thin pool LVM accepts (about 15.9 GiB)
+
+
+def extension_size(lv_size, growth_rate=None, vg_free=None, recent_grows=0):
+    """
+    Choose the increment of an extension.
+
+    The increment is the largest of MIN_INCREMENT, SIZE_FRACTION of the current size and TARGET_HOURS of the
+    observed fill rate, doubled for each grow of the last BACKOFF_WINDOW seconds. It's then capped to the free
+    space of the VG, so a large increment never shrinks other filesystems: when the VG has less than
+    MIN_INCREMENT free, only MIN_INCREMENT is taken from the other sources (free PVs, unused LVs, donors).
+
+    Args:
+        lv_size (int): current size of the LV in bytes.
+        growth_rate (float, optional): fill rate of its filesystem in bytes per second. Defaults to unknown.
+        vg_free (int, optional): free bytes of its VG. Defaults to unknown (no cap).
+        recent_grows (int, optional): grows of the filesystem in the last BACKOFF_WINDOW seconds. Defaults to 0.
+
+    Returns:
+        int: the increment in bytes.
+    """
+    size = max(MIN_INCREMENT, lv_size * SIZE_FRACTION, (growth_rate or 0) * TARGET_HOURS * 3600)
+    size *= 2 ** min(recent_grows, MAX_BACKOFF)
+    if vg_free is not None and size > vg_free:
+        size = max(vg_free, MIN_INCREMENT)
+    return int(size)
+
+
+def metadata_extension_size(metadata_size, growth_rate=None, recent_grows=0):
+    """
+    Choose the increment of the metadata of a thin pool.
+
+    Like extension_size, with MIN_METADATA_INCREMENT and METADATA_FRACTION, and capped so the metadata
+    doesn't grow past MAX_METADATA_SIZE.
+
+    Args:
+        metadata_size (int): current size of the metadata in bytes.
+        growth_rate (float, optional): fill rate of the metadata in bytes per second. Defaults to unknown.
+        recent_grows (int, optional): grows of the pool in the last BACKOFF_WINDOW seconds. Defaults to 0.
+
+    Returns:
+        int: the increment in bytes, 0 if the metadata is at its maximum size.
+    """
+    size = max(MIN_METADATA_INCREMENT, metadata_size * METADATA_FRACTION, (growth_rate or 0) * TARGET_HOURS * 3600)
+    size *= 2 ** min(recent_grows, MAX_BACKOFF)
+    return int(min(size, max(MAX_METADATA_SIZE - metadata_size, 0)))
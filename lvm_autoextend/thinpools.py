@@ -0,0 +1,48 @@
+def percent_usage(size, percent):
+    """Usage fields of a parsed filesystem (Size, Used, Available, Use%) from a size and a fill percentage."""
+    used = int(size * percent / 100)
+    return {"Size": size, "Used": used, "Available": size - used, "Use%": -(-used * 100 // size) if size else 0}
+
+
+def pool_usage(pool):
+    """
+    Get the fill of a thin pool, shaped like a parsed filesystem.
+
+    The forecaster, the sizing, the metrics and the worker pool take it like a filesystem: its "Filesystem" is
+    the pool device, and its "Mount Point" the key of its samples (nothing is mounted there). The fill of
+    its data is in Size, Used, Available and Use%, the one of its metadata under "Metadata".
+
+    Args:
+        pool (LV): the thin pool.
+
+    Returns:
+        dict: the usage of the pool.
+    """
+    usage = {"Filesystem": pool.dm_path, **percent_usage(pool.lv_size, pool.data_percent), "Mount Point": pool.dm_path}
+    usage["Metadata"] = metadata_usage(usage, percent_usage(pool.metadata_size, pool.metadata_percent))
+    return usage
+
+
+def metadata_usage(usage, metadata=None):
+    """
+    Get the fill of the metadata of a thin pool, shaped like a parsed filesystem with its own samples key.
+
+    Args:
+        usage (dict): the usage of the pool (see pool_usage).
+        metadata (dict, optional): Size, Used, Available and Use% of the metadata. Defaults to the ones of `usage`.
+
+    Returns:
+        dict: the usage of the metadata.
+    """
+    return {"Filesystem": usage["Filesystem"], **(metadata or usage["Metadata"]), "Mount Point": f"{usage['Mount Point']}:metadata"}
+
+
+def sample_keys(usage):
+    """Get the keys of the samples of a thin pool in the forecaster: its data, then its metadata."""
+    return [usage["Mount Point"], usage["Metadata"]["Mount Point"]]
+
+
+def add_samples(forecaster, usage):
+    """Record the fill of the data and of the metadata of a thin pool in the forecaster."""
+    forecaster.add(usage["Mount Point"], usage["Used"], usage["Available"])
+    forecaster.add(usage["Metadata"]["Mount Point"], usage["Metadata"]["Used"], usage["Metadata"]["Available"])
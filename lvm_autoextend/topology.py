@@ -0,0 +1,454 @@
+import json
+import logging
+import threading
+from .executor import run_lvm
+
+# One report for the whole LVM topology, in exact bytes and extents (no unit suffix, no locale decimal separator)
+FULLREPORT_ARGS = [
+    "fullreport", "--reportformat", "json", "--units", "b", "--nosuffix",
+    "--configreport", "vg", "-o", "vg_name,vg_uuid,vg_attr,vg_size,vg_free,vg_extent_size,vg_extent_count,vg_free_count,pv_count,lv_count,snap_count",
+    "--configreport", "pv", "-o", "pv_name,pv_uuid,vg_name,pv_size,pv_free,pv_pe_count,pv_pe_alloc_count",
+    "--configreport", "lv", "-o", "lv_name,lv_uuid,vg_name,lv_attr,lv_size,lv_dm_path,pool_lv,data_percent,metadata_percent,lv_metadata_size",
+    "--configreport", "seg", "-o", "lv_uuid,segtype,seg_start,seg_size",
+    "--configreport", "pvseg", "-o", "pv_uuid,lv_uuid,pvseg_start,pvseg_size",
+]
+# The fill of the thin pools alone, polled between two scans
+POOL_REPORT_ARGS = [
+    "lvs", "--reportformat", "json", "--units", "b", "--nosuffix", "--select", "segtype=thin-pool",
+    "-o", "vg_name,lv_name,lv_size,data_percent,metadata_percent,lv_metadata_size",
+]
+
+
+def to_int(value):
+    """
+    Convert a report value to an integer.
+
+    Args:
+        value (str): The value as printed by LVM (e.g. "1073741824", "" for an undefined value).
+
+    Returns:
+        int: The value, 0 if undefined.
+    """
+    return int(value) if value not in ("", None) else 0
+
+
+def to_float(value):
+    """Convert a report percentage (e.g. "42.17") to a float, 0.0 if undefined."""
+    return float(value) if value not in ("", None) else 0.0
+
+
+class VG:
+    __slots__ = ("vg_name", "num_pvs", "num_lvs", "num_sn", "attributes", "vsize", "vfree", "vg_uuid", "extent_size",
+                 "extent_count", "free_count", "pvs", "lvs")
+
+    def __init__(self, vg_name, num_pvs, num_lvs, num_sn, attributes, vsize, vfree, vg_uuid="", extent_size=0, extent_count=0, free_count=0):
+        self.vg_name = vg_name
+        self.num_pvs = num_pvs
+        self.num_lvs = num_lvs
+        self.num_sn = num_sn
+        self.attributes = attributes
+        self.vsize = vsize  # bytes
+        self.vfree = vfree  # bytes
+        self.vg_uuid = vg_uuid
+        self.extent_size = extent_size  # bytes
+        self.extent_count = extent_count
+        self.free_count = free_count  # free extents
+        self.pvs = []
+        self.lvs = []
+
+
+class LV:
+    __slots__ = ("lv_name", "lv_size", "vg_name", "lv_uuid", "attributes", "dm_path", "pool_name", "data_percent",
+                 "metadata_percent", "metadata_size", "vg", "pool", "thin_lvs", "segments", "pv_segments")
+
+    def __init__(self, lv_name, lv_size, vg_name, lv_uuid="", attributes="", dm_path="", pool_name="", data_percent=0.0,
+                 metadata_percent=0.0, metadata_size=0):
+        self.lv_name = lv_name
+        self.lv_size = lv_size  # bytes, the virtual size of a thin LV
+        self.vg_name = vg_name
+        self.lv_uuid = lv_uuid
+        self.attributes = attributes
+        self.dm_path = dm_path or f"/dev/mapper/{vg_name.replace('-', '--')}-{lv_name.replace('-', '--')}"
+        self.pool_name = pool_name  # thin pool of a thin LV, "" otherwise
+        self.data_percent = data_percent  # of a thin pool: fill of its data
+        self.metadata_percent = metadata_percent  # of a thin pool: fill of its metadata
+        self.metadata_size = metadata_size  # of a thin pool: bytes of its metadata LV
+        self.vg = None
+        self.pool = None  # the LV of pool_name
+        self.thin_lvs = []  # of a thin pool: the thin LVs it provisions
+        self.segments = []  # logical segments, in order
+        self.pv_segments = []  # physical extents allocated to the LV
+
+    @property
+    def dm_name(self):
+        """Name of the LV under /dev/mapper (hyphens in the VG and LV names are doubled)."""
+        return self.dm_path.split("/")[-1]
+
+    @property
+    def pvs(self):
+        """Physical volumes holding extents of the LV."""
+        return list({id(seg.pv): seg.pv for seg in self.pv_segments}.values())
+
+    @property
+    def is_thin_pool(self):
+        return self.attributes[:1] == "t"
+
+    @property
+    def is_thin(self):
+        """A thin LV: its size is virtual, the extents come from its pool as it's written."""
+        return self.attributes[:1] == "V"
+
+    @property
+    def is_open(self):
+        """Open by a process or the kernel: mounted, an active swap, a raw volume of a database, a VM disk..."""
+        return self.attributes[5:6] == "o"
+
+    @property
+    def in_snapshot(self):
+        """A snapshot or the origin of one (s, S, o, O): its extents are shared with the other."""
+        return self.attributes[:1] in ("s", "S", "o", "O")
+
+    @property
+    def hidden(self):
+        """An internal LV (e.g. [pool_tdata], [pool_tmeta]), part of another one."""
+        return self.lv_name.startswith("[")
+
+
+class PV:
+    __slots__ = ("pv_name", "vg_name", "pv_size", "pv_free", "pv_uuid", "pe_count", "pe_alloc_count", "vg", "segments")
+
+    def __init__(self, pv_name, vg_name, pv_size, pv_free, pv_uuid="", pe_count=0, pe_alloc_count=0):
+        self.pv_name = pv_name
+        self.vg_name = vg_name  # "" if the PV is not assigned to a VG
+        self.pv_size = pv_size  # bytes
+        self.pv_free = pv_free  # bytes
+        self.pv_uuid = pv_uuid
+        self.pe_count = pe_count
+        self.pe_alloc_count = pe_alloc_count
+        self.vg = None
+        self.segments = []  # physical segments, in order
+
+
+class Segment:
+    """A logical segment of an LV (seg report)."""
+    __slots__ = ("lv", "segtype", "start", "size")
+
+    def __init__(self, lv, segtype, start, size):
+        self.lv = lv
+        self.segtype = segtype
+        self.start = start  # bytes from the beginning of the LV
+        self.size = size  # bytes
+
+
+class PVSegment:
+    """A range of physical extents of a PV, allocated to an LV or free (pvseg report)."""
+    __slots__ = ("pv", "lv", "start", "size")
+
+    def __init__(self, pv, lv, start, size):
+        self.pv = pv
+        self.lv = lv  # None if the extents are free
+        self.start = start  # first physical extent
+        self.size = size  # number of physical extents
+
+
+class Topology:
+    """
+    Snapshot of the PVs, VGs and LVs of the host with their relationships linked.
+
+    Every lookup of the decision path goes through a hash index built once per scan: LVs by dm name and
+    /dev/mapper path, VGs and PVs by name, the LVs holding extents of each PV, the thin pools, and the mounted
+    filesystem of each LV and mount point (see index_filesystems).
+    """
+    def __init__(self, pvs, vgs, lvs):
+        self.pvs = pvs
+        self.vgs = vgs
+        self.lvs = lvs
+        self.vgs_by_name = {vg.vg_name: vg for vg in vgs}
+        self.pvs_by_name = {pv.pv_name: pv for pv in pvs}
+        self.lvs_by_dm_name = {lv.dm_name: lv for lv in lvs}
+        self.lvs_by_path = {lv.dm_path: lv for lv in lvs}
+        self.lvs_by_pv = {}  # PV name -> LVs with extents on it
+        for lv in lvs:
+            for pv in lv.pvs:
+                self.lvs_by_pv.setdefault(pv.pv_name, []).append(lv)
+        self.free_pvs = [pv for pv in pvs if not pv.vg_name]  # PVs in no VG, candidates for vgextend
+        self.thin_pools = [lv for lv in lvs if lv.is_thin_pool]
+        self.filesystems_by_dm_name = {}  # dm name of an LV -> its parsed filesystem
+        self.filesystems_by_mount = {}  # mount point -> parsed filesystem
+        self.lock = threading.Lock()  # the workers of different VGs update the topology in parallel
+
+    def index_filesystems(self, filesystems):
+        """
+        Index the mounted filesystems of the LVs.
+
+        Args:
+            filesystems (list): the parsed filesystems (see filesystems.scan_filesystems).
+        """
+        self.filesystems_by_dm_name = {fs["Filesystem"].split("/")[-1]: fs for fs in filesystems}
+        self.filesystems_by_mount = {fs["Mount Point"]: fs for fs in filesystems}
+
+    def lv(self, dm_name):
+        """Get an LV by its name under /dev/mapper, None if it doesn't exist."""
+        return self.lvs_by_dm_name.get(dm_name)
+
+    def vg(self, vg_name):
+        return self.vgs_by_name.get(vg_name)
+
+    def pv(self, pv_name):
+        return self.pvs_by_name.get(pv_name)
+
+    def lvs_on(self, pv_name):
+        """Get the LVs holding extents of a PV."""
+        return self.lvs_by_pv.get(pv_name, [])
+
+    def filesystem(self, dm_name):
+        """Get the mounted filesystem of an LV by its dm name, None if it's not mounted."""
+        return self.filesystems_by_dm_name.get(dm_name)
+
+    def mount(self, mount_point):
+        """Get the filesystem mounted at a mount point, None if no LV is mounted there."""
+        return self.filesystems_by_mount.get(mount_point)
+
+    # Known effects of the successful commands, applied instead of a new scan. The free space of the PVs of a
+    # VG is not followed (LVM chooses where the extents go): refresh_vg() reloads it when it matters.
+
+    def resize_lv(self, lv, size):
+        """Apply an lvextend (size > 0) or an lvreduce (size < 0) of `size` bytes, a multiple of the extent size."""
+        with self.lock:
+            if lv.is_thin_pool and lv.lv_size + size:  # the same data in a larger pool
+                lv.data_percent = lv.data_percent * lv.lv_size / (lv.lv_size + size)
+            lv.lv_size += size
+            vg = lv.vg
+            if vg is not None and vg.extent_size and not lv.is_thin:  # a thin LV takes no extent of the VG
+                vg.free_count -= size // vg.extent_size
+                vg.vfree = vg.free_count * vg.extent_size
+
+    def resize_pool_metadata(self, pool, size):
+        """Apply an lvextend --poolmetadatasize of `size` bytes, a multiple of the extent size."""
+        with self.lock:
+            if pool.metadata_size + size:
+                pool.metadata_percent = pool.metadata_percent * pool.metadata_size / (pool.metadata_size + size)
+            pool.metadata_size += size
+            vg = pool.vg
+            if vg is not None and vg.extent_size:
+                vg.free_count -= size // vg.extent_size
+                vg.vfree = vg.free_count * vg.extent_size
+
+    def update_pools(self, rows):
+        """
+        Update the size and the fill of the thin pools from a report of the pools alone (see load_pools).
+
+        Args:
+            rows (list): one dict per pool, with the fields of POOL_REPORT_ARGS.
+        """
+        with self.lock:
+            pools = {(pool.vg_name, pool.lv_name): pool for pool in self.thin_pools}
+            for values in rows:
+                pool = pools.get((values["vg_name"], values["lv_name"]))
+                if pool is None:  # created since the scan, it's watched from the next one
+                    continue
+                pool.lv_size = to_int(values["lv_size"])
+                pool.data_percent = to_float(values["data_percent"])
+                pool.metadata_percent = to_float(values["metadata_percent"])
+                pool.metadata_size = to_int(values["lv_metadata_size"])
+
+    def remove_lv(self, lv):
+        """Apply an lvremove."""
+        with self.lock:
+            vg = lv.vg
+            if vg is not None:
+                vg.lvs.remove(lv)
+                vg.num_lvs -= 1
+                if vg.extent_size and not lv.is_thin:
+                    vg.free_count += lv.lv_size // vg.extent_size
+                    vg.vfree = vg.free_count * vg.extent_size
+            self.lvs.remove(lv)
+            self.lvs_by_dm_name.pop(lv.dm_name, None)
+            self.lvs_by_path.pop(lv.dm_path, None)
+            for pv in lv.pvs:
+                self.lvs_by_pv[pv.pv_name].remove(lv)
+            if lv.pool is not None:
+                lv.pool.thin_lvs.remove(lv)
+
+    def add_pv(self, pv, vg):
+        """Apply a vgextend of a free PV."""
+        with self.lock:
+            extents = pv.pv_free // vg.extent_size if vg.extent_size else 0
+            pv.vg, pv.vg_name = vg, vg.vg_name
+            pv.pe_count, pv.pe_alloc_count = extents, 0
+            vg.pvs.append(pv)
+            vg.num_pvs += 1
+            vg.extent_count += extents
+            vg.free_count += extents
+            vg.vsize = vg.extent_count * vg.extent_size
+            vg.vfree = vg.free_count * vg.extent_size
+            if pv in self.free_pvs:
+                self.free_pvs.remove(pv)
+
+    def replace_vg(self, vg_name, report):
+        """
+        Replace a VG, its PVs and its LVs by the ones of a new report of that VG only.
+
+        Args:
+            vg_name (str): the VG to replace.
+            report (Topology): the topology loaded for that VG (see load_topology).
+        """
+        with self.lock:
+            old = self.vgs_by_name.pop(vg_name, None)
+            if old is not None:
+                self.vgs.remove(old)
+                for pv in old.pvs:
+                    self.pvs.remove(pv)
+                    self.pvs_by_name.pop(pv.pv_name, None)
+                    self.lvs_by_pv.pop(pv.pv_name, None)
+                for lv in old.lvs:
+                    self.lvs.remove(lv)
+                    self.lvs_by_dm_name.pop(lv.dm_name, None)
+                    self.lvs_by_path.pop(lv.dm_path, None)
+                    if lv.is_thin_pool:
+                        self.thin_pools.remove(lv)
+            for vg in report.vgs:
+                self.vgs.append(vg)
+                self.vgs_by_name[vg.vg_name] = vg
+            for pv in report.pvs:
+                previous = self.pvs_by_name.get(pv.pv_name)
+                if previous is not None:  # a free PV added to the VG meanwhile
+                    self.pvs.remove(previous)
+                    if previous in self.free_pvs:
+                        self.free_pvs.remove(previous)
+                self.pvs.append(pv)
+                self.pvs_by_name[pv.pv_name] = pv
+            for lv in report.lvs:
+                self.lvs.append(lv)
+                self.lvs_by_dm_name[lv.dm_name] = lv
+                self.lvs_by_path[lv.dm_path] = lv
+                for pv in lv.pvs:
+                    self.lvs_by_pv.setdefault(pv.pv_name, []).append(lv)
+                if lv.is_thin_pool:
+                    self.thin_pools.append(lv)
+
+
+def parse_fullreport(output):
+    """
+    Build the topology from the JSON output of `lvm fullreport`.
+
+    Args:
+        output (bytes): output of the fullreport command, or the report already parsed (dict).
+
+    Returns:
+        Topology: the linked PV, VG, LV and segment objects.
+    """
+    report = output if isinstance(output, dict) else json.loads(output)
+    pvs, vgs, lvs = [], [], []
+    vgs_by_name, pvs_by_uuid, lvs_by_uuid = {}, {}, {}
+
+    for group in report.get("report", []):  # one group per VG, plus one for the orphan PVs
+        for values in group.get("vg", []):
+            vg = VG(
+                vg_name=values["vg_name"],
+                num_pvs=to_int(values["pv_count"]),
+                num_lvs=to_int(values["lv_count"]),
+                num_sn=to_int(values["snap_count"]),
+                attributes=values["vg_attr"],
+                vsize=to_int(values["vg_size"]),
+                vfree=to_int(values["vg_free"]),
+                vg_uuid=values["vg_uuid"],
+                extent_size=to_int(values["vg_extent_size"]),
+                extent_count=to_int(values["vg_extent_count"]),
+                free_count=to_int(values["vg_free_count"])
+            )
+            vgs.append(vg)
+            vgs_by_name[vg.vg_name] = vg
+
+        for values in group.get("pv", []):
+            pv = PV(
+                pv_name=values["pv_name"],
+                vg_name=values.get("vg_name", ""),
+                pv_size=to_int(values["pv_size"]),
+                pv_free=to_int(values["pv_free"]),
+                pv_uuid=values["pv_uuid"],
+                pe_count=to_int(values["pv_pe_count"]),
+                pe_alloc_count=to_int(values["pv_pe_alloc_count"])
+            )
+            pvs.append(pv)
+            pvs_by_uuid[pv.pv_uuid] = pv
+
+        for values in group.get("lv", []):
+            lv = LV(
+                lv_name=values["lv_name"],
+                lv_size=to_int(values["lv_size"]),
+                vg_name=values["vg_name"],
+                lv_uuid=values["lv_uuid"],
+                attributes=values["lv_attr"],
+                dm_path=values.get("lv_dm_path", ""),
+                pool_name=values.get("pool_lv", ""),
+                data_percent=to_float(values.get("data_percent")),
+                metadata_percent=to_float(values.get("metadata_percent")),
+                metadata_size=to_int(values.get("lv_metadata_size"))
+            )
+            lvs.append(lv)
+            lvs_by_uuid[lv.lv_uuid] = lv
+
+        for values in group.get("seg", []):
+            lv = lvs_by_uuid.get(values["lv_uuid"])
+            if lv is not None:
+                lv.segments.append(Segment(lv, values["segtype"], to_int(values["seg_start"]), to_int(values["seg_size"])))
+
+        for values in group.get("pvseg", []):
+            pv = pvs_by_uuid.get(values["pv_uuid"])
+            if pv is None:
+                continue
+            lv = lvs_by_uuid.get(values.get("lv_uuid", ""))
+            segment = PVSegment(pv, lv, to_int(values["pvseg_start"]), to_int(values["pvseg_size"]))
+            pv.segments.append(segment)
+            if lv is not None:
+                lv.pv_segments.append(segment)
+
+    # Link the PVs and LVs to their VG
+    for pv in pvs:
+        pv.vg = vgs_by_name.get(pv.vg_name)
+        if pv.vg is not None:
+            pv.vg.pvs.append(pv)
+    for lv in lvs:
+        lv.vg = vgs_by_name.get(lv.vg_name)
+        if lv.vg is not None:
+            lv.vg.lvs.append(lv)
+
+    # Link the thin LVs to their pool
+    pools = {(lv.vg_name, lv.lv_name): lv for lv in lvs if lv.is_thin_pool}
+    for lv in lvs:
+        if lv.pool_name:
+            lv.pool = pools.get((lv.vg_name, lv.pool_name))
+            if lv.pool is not None:
+                lv.pool.thin_lvs.append(lv)
+
+    return Topology(pvs, vgs, lvs)
+
+
+def load_topology(args=FULLREPORT_ARGS):
+    """
+    Load the LVM topology of the host with a single `lvm fullreport` call.
+
+    Args:
+        args (list, optional): the report command, without `lvm`. Defaults to FULLREPORT_ARGS, add VG names
+            to load only these VGs.
+
+    Returns:
+        Topology: the linked PV, VG, LV and segment objects.
+    """
+    result = run_lvm(args, check=True)
+    topology = parse_fullreport(getattr(result, "report", None) or result.stdout)
+    logging.debug(f"Loaded LVM topology: {len(topology.pvs)} PVs, {len(topology.vgs)} VGs, {len(topology.lvs)} LVs.")
+    return topology
+
+
+def load_pools():
+    """
+    Read the size and the fill of every thin pool with a single `lvm lvs` call, lighter than a fullreport.
+
+    Returns:
+        list: one dict per pool, with the fields of POOL_REPORT_ARGS.
+    """
+    result = run_lvm(POOL_REPORT_ARGS, check=True)
+    report = getattr(result, "report", None) or json.loads(result.stdout)
+    return [values for group in report.get("report", []) for values in group.get("lv", [])]
@@ -0,0 +1,40 @@
+def convert_to_bytes(size):
+    """
+    Convert a size string to bytes.
+    
+    Args:
+        size (str): The size string to convert.
+        
+    Returns:
+        int: The size in bytes.
+    """
+    size_str = size[:-1].replace(',', '.')
+    unit = size[-1]
+    if unit == 'G':
+        return float(size_str) * 1024 * 1024 * 1024
+    elif unit == 'M':
+        return float(size_str) * 1024 * 1024
+    elif unit == 'K':
+        return float(size_str) * 1024
+    else:
+        return float(size_str)
+
+def getUnit(size_in_bytes, with_unit=True):
+    """
+    Get the size in the most appropriate unit.
+    
+    Args:
+        size_in_bytes (int): The size in bytes.
+        with_unit (bool, optional): Whether to include the unit in the output. Defaults to True.
+        
+    Returns:
+        str: The size in the most appropriate unit.
+    """
+    if size_in_bytes >= 1024 * 1024 * 1024:
+        return f"{size_in_bytes / (1024 * 1024 * 1024)}G" if with_unit else size_in_bytes / (1024 * 1024 * 1024)
+    elif size_in_bytes >= 1024 * 1024:
+        return f"{size_in_bytes / (1024 * 1024)}M" if with_unit else size_in_bytes / (1024 * 1024)
+    elif size_in_bytes >= 1024:
+        return f"{size_in_bytes / 1024}K" if with_unit else size_in_bytes / 1024
+    else:
+        return f"{size_in_bytes}B" if with_unit else size_in_bytes
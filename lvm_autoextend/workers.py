@@ -0,0 +1,74 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from . import lvmshell
+from .locks import LockManager, split_dm_name
+from .logs import operation
+
+MAX_WORKERS = 8  # VGs extended at the same time
+
+
+class ExtensionPool:
+    """
+    Worker pool running the extensions of different VGs in parallel.
+
+    Every operation holds the locks of its VG and LV (see locks.LockManager) for its whole duration, so the
+    operations of one VG or one LV stay serialized, across threads and across processes.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, locks=None):
+        self.locks = locks or LockManager()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lvm-autoextend")
+
+    def call(self, dm_name, function, *args):
+        """
+        Run a function while holding the locks of the VG and LV of a device (in the calling thread), as one
+        operation of the logs (see logs.operation).
+
+        Args:
+            dm_name (str): name of the LV under /dev/mapper.
+            function (callable): the operation.
+
+        Returns:
+            the result of the function.
+        """
+        with operation(f"Operation on {dm_name}", lv=dm_name, vg=split_dm_name(dm_name)[0]), self.locks.hold(dm_name):
+            return function(*args)
+
+    def submit(self, dm_name, function, *args):
+        """Run a function in the pool while holding the locks of the VG and LV of a device."""
+        return self.executor.submit(self.call, dm_name, function, *args)
+
+    def run(self, items, function, dm_name):
+        """
+        Apply a function to every item: the items of one VG are processed one after the other, the VGs in parallel.
+
+        Args:
+            items (list): the items to process (filesystems, queue entries...).
+            function (callable): the operation applied to each item.
+            dm_name (callable): returns the name under /dev/mapper of the LV of an item.
+
+        Returns:
+            list: (item, result) pairs. The result is None if the operation raised an exception.
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(split_dm_name(dm_name(item))[0], []).append(item)
+
+        def process_group(group):
+            results = []
+            for item in group:
+                try:
+                    results.append((item, self.call(dm_name(item), function, item)))
+                except Exception as e:
+                    logging.error(f"Error processing {dm_name(item)}: {e}")
+                    results.append((item, None))
+            return results
+
+        futures = [self.executor.submit(process_group, group) for group in groups.values()]
+        return [result for future in futures for result in future.result()]
+
+    def shutdown(self, wait=True):
+        """Stop the workers. Once they are done (wait), their lvm shells are closed."""
+        self.executor.shutdown(wait=wait)
+        if wait:
+            lvmshell.close_all()
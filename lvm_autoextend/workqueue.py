@@ -0,0 +1,216 @@
+import os
+import socket
+import sqlite3
+import logging
+import threading
+from time import time
+
+# queue database path
+queue_db_path = "/tmp/filesystems_to_extend.db"
+
+RETRY_DELAY = 5  # seconds before a failed entry is retried, doubled at each attempt
+MAX_RETRY_DELAY = 600
+LEASE_TIME = 1800  # seconds before the lease of a crashed consumer expires
+RENEW_INTERVAL = LEASE_TIME / 3  # seconds between two renewals of the leases of the entries being processed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    lv TEXT NOT NULL,
+    filesystem TEXT NOT NULL,
+    mount_point TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_eligible REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS entries_lv_mount_point ON entries (lv, mount_point);
+CREATE INDEX IF NOT EXISTS entries_eligible ON entries (next_eligible, priority);
+"""
+
+
+def default_owner():
+    """Lease owner of the current process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Entry:
+    def __init__(self, id, lv, filesystem, mount_point, priority, attempts):
+        self.id = id
+        self.lv = lv
+        self.filesystem = filesystem
+        self.mount_point = mount_point
+        self.priority = priority
+        self.attempts = attempts
+
+
+class WorkQueue:
+    """
+    Persistent queue of the filesystems to extend, stored in a WAL-mode SQLite database.
+
+    An entry is unique per (LV, mount point). Consumers lease the eligible entries with the highest priority,
+    then either complete them (the entry is removed) or retry them later with an exponential back-off.
+    Leases expire, so the entries of a crashed consumer are picked up again. Every process (or thread) opens
+    its own WorkQueue on the same database. A read-only WorkQueue (e.g. the GUI, which may not be allowed to
+    write the database of the scripts) opens an existing database without changing it, and can only be read.
+    """
+
+    def __init__(self, path=queue_db_path, owner=None, read_only=False):
+        self.path = path
+        self.owner = owner or default_owner()
+        if read_only:
+            self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30, isolation_level=None)
+            return
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)  # transactions are explicit
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def enqueue(self, lv, filesystem, mount_point, priority=0):
+        """
+        Add a filesystem to the queue, or raise its priority if it's already queued.
+
+        Args:
+            lv (str): name of the LV under /dev/mapper.
+            filesystem (str): device of the filesystem.
+            mount_point (str): mount point of the filesystem.
+            priority (int, optional): entries with a higher priority are processed first. Defaults to 0.
+
+        Returns:
+            bool: True if the filesystem was added, False if it was already queued.
+        """
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO entries (lv, filesystem, mount_point, priority, created) VALUES (?, ?, ?, ?, ?)",
+            (lv, filesystem, mount_point, priority, time()))
+        if cursor.rowcount:
+            return True
+        self.connection.execute(
+            "UPDATE entries SET priority = ? WHERE lv = ? AND mount_point = ? AND priority < ?",
+            (priority, lv, mount_point, priority))
+        return False
+
+    def lease(self, limit=1, lease_time=LEASE_TIME):
+        """
+        Take the eligible entries with the highest priority.
+
+        Args:
+            limit (int, optional): maximum number of entries. Defaults to 1.
+            lease_time (int, optional): seconds before the lease expires. Defaults to LEASE_TIME.
+
+        Returns:
+            list: the leased entries (Entry).
+        """
+        now = time()
+        self.connection.execute("BEGIN IMMEDIATE")  # no other consumer can lease between the select and the update
+        try:
+            rows = self.connection.execute(
+                "SELECT id, lv, filesystem, mount_point, priority, attempts FROM entries "
+                "WHERE next_eligible <= ? AND (lease_owner IS NULL OR lease_expires < ?) "
+                "ORDER BY priority DESC, next_eligible LIMIT ?",
+                (now, now, limit)).fetchall()
+            self.connection.executemany(
+                "UPDATE entries SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                [(self.owner, now + lease_time, row[0]) for row in rows])
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        return [Entry(*row[:5], row[5] + 1) for row in rows]
+
+    def renew(self, entries, lease_time=LEASE_TIME):
+        """
+        Extend the leases of entries still being processed, so they don't expire during a long extension.
+
+        Args:
+            entries (list): the leased entries (Entry). The completed or released ones are left alone.
+            lease_time (int, optional): seconds from now before the leases expire. Defaults to LEASE_TIME.
+        """
+        self.connection.executemany(
+            "UPDATE entries SET lease_expires = ? WHERE id = ? AND lease_owner = ?",
+            [(time() + lease_time, entry.id, self.owner) for entry in entries])
+
+    def complete(self, entry):
+        """Remove a processed entry from the queue."""
+        self.connection.execute("DELETE FROM entries WHERE id = ? AND lease_owner = ?", (entry.id, self.owner))
+
+    def retry(self, entry, delay=None):
+        """
+        Release an entry so it's processed again later.
+
+        Args:
+            entry (Entry): the leased entry.
+            delay (float, optional): seconds before the entry is eligible again. Defaults to an exponential
+                back-off on the number of attempts.
+        """
+        if delay is None:
+            delay = min(RETRY_DELAY * 2 ** (entry.attempts - 1), MAX_RETRY_DELAY)
+        self.connection.execute(
+            "UPDATE entries SET lease_owner = NULL, lease_expires = 0, next_eligible = ? WHERE id = ? AND lease_owner = ?",
+            (time() + delay, entry.id, self.owner))
+
+    def next_eligible_in(self):
+        """
+        Get the time until the next entry becomes eligible.
+
+        Returns:
+            float: seconds to wait (0 if an entry is eligible now), None if the queue is empty.
+        """
+        row = self.connection.execute(
+            "SELECT MIN(MAX(next_eligible, CASE WHEN lease_owner IS NULL THEN 0 ELSE lease_expires END)) FROM entries").fetchone()
+        return None if row[0] is None else max(row[0] - time(), 0)
+
+    def ages(self):
+        """
+        Get the time each queued LV has been waiting.
+
+        Returns:
+            dict: name of the LV under /dev/mapper -> seconds since it was queued.
+        """
+        now = time()
+        return {lv: now - created for lv, created in self.connection.execute("SELECT lv, MIN(created) FROM entries GROUP BY lv")}
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def is_empty(self):
+        return self.connection.execute("SELECT 1 FROM entries LIMIT 1").fetchone() is None
+
+
+class LeaseRenewer(threading.Thread):
+    """
+    Renews the leases of a batch of entries while a consumer processes them.
+
+    An extension can last longer than LEASE_TIME (e2fsck and resize2fs may run for hours), and another
+    consumer must not lease its entry meanwhile. The leases stay short, so the entries of a crashed
+    consumer are still picked up again soon. The renewer uses its own connection, as a connection belongs to
+    the thread that opened it.
+    """
+
+    def __init__(self, path, owner, entries, interval=RENEW_INTERVAL, lease_time=LEASE_TIME):
+        super().__init__(name="lease-renewer", daemon=True)
+        self.path = path
+        self.owner = owner
+        self.entries = list(entries)
+        self.interval = interval
+        self.lease_time = lease_time
+        self.stopping = threading.Event()
+
+    def run(self):
+        queue = WorkQueue(self.path, self.owner)
+        try:
+            while not self.stopping.wait(self.interval):
+                try:
+                    queue.renew(self.entries, self.lease_time)
+                except sqlite3.Error as e:  # retried at the next interval, before the leases expire
+                    logging.error(f"Queue : Error renewing the leases of {len(self.entries)} entries: {e}")
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
@@ -0,0 +1,17 @@
+import pytest
+from lvm_autoextend import core, executor
+from lvm_autoextend.simulator import SimulatedExecutor
+
+GiB = 1024 ** 3
+MiB = 1024 ** 2
+
+
+@pytest.fixture
+def host():
+    """An empty simulated host, the backend of every command and probe of the test."""
+    simulator = SimulatedExecutor()
+    previous = executor.set_executor(simulator)
+    core.scanned = False
+    yield simulator
+    executor.set_executor(previous)
+    core.scanned = False
@@ -0,0 +1,45 @@
+import pytest
+from lvm_autoextend import daemon as daemon_module
+from lvm_autoextend.daemon import Daemon, poll_interval
+from lvm_autoextend.forecast import UsageForecaster
+from conftest import GiB
+
+
+@pytest.fixture
+def daemon(host):
+    host.add_pv("/dev/sda", 4 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    lv = host.add_lv("vg", "data", GiB)
+    host.add_filesystem(lv.dm_path, "ext4", GiB // 2, "/data")
+    daemon = Daemon(max_workers=1)
+    daemon.forecaster = UsageForecaster()
+    yield daemon
+    daemon.pool.shutdown()
+
+
+def test_poll_interval_shrinks_near_the_threshold():
+    assert poll_interval(0) == 60
+    assert poll_interval(80) == poll_interval(95) == 1
+    assert 1 < poll_interval(60) < poll_interval(40) < 60
+
+
+def test_sample_records_a_mounted_filesystem(daemon):
+    obj = {"Mount Point": "/data", "Filesystem": "/dev/mapper/vg-data"}
+
+    assert daemon.sample(obj)
+    assert obj["Use%"] == 50
+    assert len(daemon.forecaster.samples["/data"]) == 1
+
+
+def test_sample_skips_a_filesystem_being_extended_or_unmounted(daemon, host, monkeypatch):
+    obj = {"Mount Point": "/data", "Filesystem": "/dev/mapper/vg-data", "Use%": 50}
+    daemon.in_progress.add("/data")
+    assert not daemon.sample(obj)
+    daemon.in_progress.clear()
+
+    assert host.run(["umount", "/data"]).returncode == 0  # unmounted as a donor by another worker
+    parent = {"Size": 100 * GiB, "Used": GiB, "Available": 99 * GiB, "Use%": 1}
+    monkeypatch.setattr(daemon_module, "statvfs_usage", lambda mount_point: parent)  # statvfs reads the parent filesystem
+    assert not daemon.sample(obj)
+    assert obj["Use%"] == 50
+    assert "/data" not in daemon.forecaster.samples
@@ -0,0 +1,71 @@
+import os
+import fcntl
+import logging
+from lvm_autoextend.locks import LockManager, ResourceLock, held_locks, split_dm_name
+
+DEAD_PID = 2 ** 22 + 1  # above the default pid_max, never a live process
+
+
+def test_lock_is_exclusive(tmp_path):
+    first, second = ResourceLock("vg-data", tmp_path), ResourceLock("vg-data", tmp_path)
+
+    assert first.acquire(blocking=False)
+    assert not second.acquire(blocking=False)
+    assert not second.acquire(timeout=0.2)
+    first.release()
+    assert second.acquire(blocking=False)
+    assert second.holder()[0] == os.getpid()
+    second.release()
+
+
+def test_dead_holder_is_logged_but_the_lock_is_never_broken(tmp_path, caplog):
+    lock = ResourceLock("vg-data", tmp_path)
+    leaked = os.open(lock.path, os.O_RDWR | os.O_CREAT)  # the descriptor of a dead holder, inherited by a running child
+    fcntl.flock(leaked, fcntl.LOCK_EX)
+    os.write(leaked, f"{DEAD_PID} 0.0\n".encode())
+    inode = os.stat(lock.path).st_ino
+
+    with caplog.at_level(logging.WARNING):
+        assert not lock.acquire(timeout=0.3)
+    assert lock.is_stale()
+    assert f"holder {DEAD_PID} is dead" in caplog.text
+    assert os.stat(lock.path).st_ino == inode  # never unlinked, the holder may still be using it
+
+    os.close(leaked)  # the child exits: the kernel releases its flock
+    assert lock.acquire(blocking=False)
+    assert lock.holder()[0] == os.getpid()
+    lock.release()
+
+
+def test_manager_takes_vg_then_lv_and_releases_all_on_failure(tmp_path):
+    manager = LockManager(tmp_path)
+    busy_lv = manager.lv("my-vg", "data")
+    assert busy_lv.acquire(blocking=False)
+
+    assert manager.acquire("my--vg-data", blocking=False) is None
+    vg = manager.vg("my-vg")
+    assert vg.acquire(blocking=False)  # released after the LV lock failed
+    vg.release()
+
+    busy_lv.release()
+    held = manager.acquire("my--vg-data", blocking=False)
+    assert [lock.name for lock in held] == ["vg-my-vg", "lv-my--vg-data"]
+    manager.release(held)
+
+
+def test_held_locks_lists_live_holders_only(tmp_path):
+    live = ResourceLock("lv-vg-data", tmp_path)
+    assert live.acquire(blocking=False)
+    (tmp_path / "vg-other.lock").write_text(f"{DEAD_PID} 0.0\n")
+    released = ResourceLock("treatment", tmp_path)
+    released.acquire(blocking=False)
+    released.release()
+
+    assert list(held_locks(tmp_path)) == ["lv-vg-data"]
+    live.release()
+    assert held_locks(tmp_path) == {}
+
+
+def test_split_dm_name():
+    assert split_dm_name("my--vg-data--1") == ("my-vg", "data-1")
+    assert split_dm_name("nodash") == ("nodash", "")
@@ -0,0 +1,106 @@
+from lvm_autoextend import core
+from lvm_autoextend.planner import plan_growth
+from conftest import GiB, MiB
+
+
+def actions(plan, dm_name):
+    return [step.action for step in plan.steps[dm_name]]
+
+
+def test_free_extents_first(host):
+    host.add_pv("/dev/sda", 10 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    host.add_pv("/dev/sdb", 10 * GiB)  # free PV, not needed
+    host.add_lv("vg", "data", GiB)
+    core.scan()
+
+    plan = core.plan_extensions(["vg-data"], "1G")
+
+    assert plan.feasible
+    assert actions(plan, "vg-data") == ["lvextend"]
+
+
+def test_sources_in_order_of_cost_and_lvextend_last(host):
+    host.add_pv("/dev/sda", 3 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    host.add_pv("/dev/sdb", GiB)
+    data = host.add_lv("vg", "data", GiB)
+    host.add_filesystem(data.dm_path, "ext4", 900 * MiB, "/data")
+    host.add_lv("vg", "spare", GiB)  # no filesystem
+    donor = host.add_lv("vg", "donor", GiB - 4 * MiB)
+    host.add_filesystem(donor.dm_path, "ext4", 50 * MiB, "/donor")
+    core.scan()
+
+    plan = core.plan_extensions(["vg-data"], "2560M")  # 4M free, the PV, the spare LV, then part of the donor
+
+    assert plan.feasible
+    assert actions(plan, "vg-data") == ["vgextend", "lvremove", "shrink", "lvextend"]
+    assert plan.steps["vg-data"][-1].size == 2560 * MiB
+
+
+def test_unused_lv_removed_once_its_remaining_size_is_taken(host):
+    host.add_pv("/dev/sda", 4 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    host.add_lv("vg", "a", GiB)
+    host.add_lv("vg", "b", GiB)
+    host.add_lv("vg", "spare", 2 * GiB)  # the only space of the VG
+    for name in ("a", "b"):
+        host.add_filesystem(f"/dev/mapper/vg-{name}", "ext4", 10 * MiB, f"/{name}")
+    core.scan()
+
+    plan = core.plan_extensions(["vg-a", "vg-b"], "1G")
+
+    assert plan.feasible
+    first, second = plan.steps["vg-a"][0], plan.steps["vg-b"][0]
+    assert (first.action, second.action) == ("lvreduce", "lvremove")
+    assert first.size + second.size == 2 * GiB
+
+
+def test_open_and_snapshot_lvs_are_never_taken(host):
+    host.add_pv("/dev/sda", 2 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    host.add_lv("vg", "data", GiB)
+    host.add_lv("vg", "swap", GiB)  # the only space of the VG
+    core.scan()
+    swap = core.topology.lv("vg-swap")
+
+    for attributes in ("-wi-ao----", "owi-a-s---", "swi-a-s---"):  # open, origin, snapshot
+        swap.attributes = attributes
+        plan = plan_growth(core.topology, [], {"vg-data": GiB})
+        assert plan.infeasible == {"vg-data": GiB}
+        assert "vg-data" not in plan.steps
+
+    swap.attributes = "-wi-a-----"
+    assert actions(plan_growth(core.topology, [], {"vg-data": GiB}), "vg-data") == ["lvremove", "lvextend"]
+
+
+def test_infeasible_lv_gets_no_step_and_keeps_the_sources(host):
+    host.add_pv("/dev/sda", 2 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    host.add_lv("vg", "big", GiB)
+    host.add_lv("vg", "small", 512 * MiB)
+    host.add_lv("vg", "spare", 512 * MiB)  # the only space of the VG
+    core.scan()
+
+    plan = core.plan_extensions(["vg-big", "vg-small"], sizes={"vg-big": 10 * GiB, "vg-small": 256 * MiB})
+
+    assert plan.infeasible == {"vg-big": 10 * GiB - 512 * MiB}
+    assert "vg-big" not in plan.steps
+    assert actions(plan, "vg-small") == ["lvreduce", "lvextend"]
+
+
+def test_busy_and_xfs_filesystems_are_never_donors(host):
+    host.add_pv("/dev/sda", 3 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    data = host.add_lv("vg", "data", GiB)
+    host.add_filesystem(data.dm_path, "ext4", 900 * MiB, "/data")
+    busy = host.add_lv("vg", "busy", GiB)
+    host.add_filesystem(busy.dm_path, "ext4", 10 * MiB, "/busy", busy=True)
+    xfs = host.add_lv("vg", "xfs", GiB)
+    host.add_filesystem(xfs.dm_path, "xfs", 10 * MiB, "/xfs")
+    core.scan()
+
+    plan = core.plan_extensions(["vg-data"], "1G")
+
+    assert "vg-data" in plan.infeasible
+    assert "vg-data" not in plan.steps
@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from lvm_autoextend.agent import Agent
+from lvm_autoextend.controller import Controller
+from lvm_autoextend.forecast import UsageForecaster
+from lvm_autoextend.locks import LockManager
+from lvm_autoextend.protocol import ProtocolError, check_token, parse_address, read_token, start_server
+from conftest import GiB
+
+
+def test_check_token():
+    assert check_token({}, None)  # no token: only served on the Unix socket
+    assert check_token({"token": "secret"}, "secret")
+    assert not check_token({"token": "wrong"}, "secret")
+    assert not check_token({}, "secret")
+    assert not check_token({"token": None}, "secret")
+
+
+def test_parse_address():
+    assert parse_address("unix:/run/agent.sock") == ("unix", "/run/agent.sock")
+    assert parse_address("10.0.0.1:7401") == ("tcp", "10.0.0.1", 7401)
+    assert parse_address("[::1]:7401") == ("tcp", "::1", 7401)
+    with pytest.raises(ValueError):
+        parse_address("10.0.0.1")
+
+
+def test_read_token(tmp_path):
+    (tmp_path / "token").write_text("secret\n")
+    assert read_token(str(tmp_path / "token")) == "secret"
+    assert read_token(None) is None
+
+
+@pytest.fixture
+def agent(host, tmp_path):
+    host.add_pv("/dev/sda", 4 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    lv = host.add_lv("vg", "data", GiB)
+    host.add_filesystem(lv.dm_path, "ext4", int(0.9 * GiB), "/data")
+    agent = Agent(token="secret", forecaster=UsageForecaster(), locks=LockManager(tmp_path))
+    yield agent
+    agent.pool.shutdown()
+
+
+def serve_and_request(agent, address, token, message):
+    async def exchange():
+        server = await start_server(agent.handle, address)
+        try:
+            return await Controller([address], token=token).request(address, message, timeout=10)
+        finally:
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(exchange())
+
+
+def test_agent_refuses_a_wrong_or_missing_token(agent, tmp_path):
+    address = f"unix:{tmp_path}/agent.sock"
+    for token in ("wrong", None):
+        with pytest.raises(ProtocolError, match="invalid token"):
+            serve_and_request(agent, address, token, {"op": "snapshot", "horizon": 300})
+
+
+def test_agent_answers_with_the_token(agent, tmp_path):
+    answer = serve_and_request(agent, f"unix:{tmp_path}/agent.sock", "secret", {"op": "snapshot", "horizon": 300})
+
+    assert answer["ok"]
+    assert [candidate["lv"] for candidate in answer["candidates"]] == ["vg-data"]
+    assert answer["candidates"][0]["feasible"]
+
+
+def test_agent_never_listens_on_tcp_without_a_token(tmp_path):
+    agent = Agent(forecaster=UsageForecaster(), locks=LockManager(tmp_path))
+    with pytest.raises(ValueError, match="token"):
+        asyncio.run(agent.run("127.0.0.1:0"))
+    agent.pool.shutdown()
+
+
+def test_extension_timeout_gives_the_san_slot_back():
+    async def hang(reader, writer):
+        await reader.readline()
+        await asyncio.sleep(10)
+
+    async def extend():
+        server = await asyncio.start_server(hang, "127.0.0.1", 0)
+        address = f"127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        controller = Controller([address], extend_timeout=0.2)
+        controller.hosts[address] = {"host": "h", "san": "san1"}
+        extended = await controller.extend(address, {"lv": "vg-data", "kind": "filesystem", "heavy": True})
+        server.close()
+        return extended, controller.heavy_slot(address).locked()
+
+    assert asyncio.run(extend()) == (False, False)
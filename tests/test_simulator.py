@@ -0,0 +1,101 @@
+import pytest
+from lvm_autoextend import core
+from lvm_autoextend.executor import Executor, run_lvm
+from lvm_autoextend.filesystems import reduce_filesystem, unmount_filesystem
+from conftest import GiB, MiB
+
+
+@pytest.fixture
+def full_vg(host):
+    """A VG without free extents: a filesystem at 90% and an almost empty donor filesystem."""
+    host.add_pv("/dev/sda", 4 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    data = host.add_lv("vg", "data", 2 * GiB)
+    host.add_filesystem(data.dm_path, "ext4", int(1.8 * GiB), "/data")
+    donor = host.add_lv("vg", "donor", 2 * GiB)
+    host.add_filesystem(donor.dm_path, "ext4", 100 * MiB, "/donor")
+    return host
+
+
+def test_donor_shrink_end_to_end(full_vg):
+    filesystems = core.scan()
+    data = next(obj for obj in filesystems if obj["Mount Point"] == "/data")
+    plan = core.plan_extensions(["vg-data"], "512M")
+    assert [step.action for step in plan.steps["vg-data"]] == ["shrink", "lvextend"]
+
+    assert core.treat_filesystem(data, plan=plan)
+
+    vg = full_vg.vgs["vg"]
+    data_lv, donor_lv = vg.lvs["data"], vg.lvs["donor"]
+    assert data_lv.size == 2 * GiB + 512 * MiB
+    assert donor_lv.size == 2 * GiB - 512 * MiB
+    assert vg.free_count == 0
+    assert data_lv.filesystem.size == data_lv.size and donor_lv.filesystem.size == donor_lv.size
+    assert data_lv.filesystem.mounted and donor_lv.filesystem.mounted
+    assert full_vg.commands == [
+        "sudo umount /data",
+        "sudo umount /donor",
+        f"sudo resize2fs /dev/mapper/vg-donor {(2 * GiB - 512 * MiB) // 1024}K",
+        f"lvm lvreduce -f -L {(2 * GiB - 512 * MiB) // 1024}K /dev/mapper/vg-donor",
+        "sudo resize2fs /dev/mapper/vg-donor",
+        "sudo mount /dev/mapper/vg-donor /donor",
+        f"lvm lvextend -L +{512 * MiB}b /dev/mapper/vg-data",
+        "sudo resize2fs /dev/mapper/vg-data",
+        "sudo mount /dev/mapper/vg-data /data",
+    ]
+    assert core.topology.lv("vg-data").lv_size == data_lv.size  # the topology followed the commands
+
+
+def test_shrink_below_the_used_space_changes_nothing(full_vg):
+    assert unmount_filesystem("/donor")
+
+    assert not reduce_filesystem("vg-donor", "ext4", "/donor", "50M")
+
+    donor_lv = full_vg.vgs["vg"].lvs["donor"]
+    assert donor_lv.size == donor_lv.filesystem.size == 2 * GiB
+    assert not any(command.startswith("lvm lvreduce") for command in full_vg.commands)
+
+
+def test_lvreduce_below_one_extent_fails(full_vg):
+    result = run_lvm(["lvreduce", "-f", "-L", f"-{2 * GiB}b", "/dev/mapper/vg-donor"])
+
+    assert result.returncode != 0
+    assert "below 1 extent" in result.stderr
+    assert full_vg.vgs["vg"].lvs["donor"].size == 2 * GiB
+
+
+def test_incomplete_backend_cant_be_instantiated():
+    class Incomplete(Executor):
+        def run(self, argv, timeout=None):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.mark.parametrize("fs_type, grow", [("ext4", "sudo resize2fs /dev/mapper/vg-data"), ("xfs", "sudo xfs_growfs /data")])
+def test_offline_extension_grows_by_the_real_type(host, fs_type, grow):
+    host.add_pv("/dev/sda", 4 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    data = host.add_lv("vg", "data", GiB)
+    host.add_filesystem(data.dm_path, fs_type, int(0.9 * GiB), "/data")
+    [obj] = core.scan()
+
+    assert core.treat_filesystem(obj, Size="512M")
+
+    assert data.filesystem.size == data.size == GiB + 512 * MiB
+    assert data.filesystem.mounted
+    assert grow in host.commands
+
+
+def test_offline_extension_refuses_unknown_types(host):
+    host.add_pv("/dev/sda", 4 * GiB)
+    host.add_vg("vg", ["/dev/sda"])
+    data = host.add_lv("vg", "data", GiB)
+    host.add_filesystem(data.dm_path, "btrfs", int(0.9 * GiB), "/data")
+    [obj] = core.scan()
+
+    assert not core.treat_filesystem(obj, Size="512M")
+
+    assert data.size == GiB  # the LV isn't extended under a filesystem that can't follow
+    assert data.filesystem.mounted
@@ -0,0 +1,78 @@
+import sqlite3
+import pytest
+from time import sleep
+from unittest import mock
+from lvm_autoextend import workqueue
+from lvm_autoextend.workqueue import LeaseRenewer, WorkQueue
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "queue.db")
+
+
+def test_enqueue_is_unique_and_raises_priority(path):
+    queue = WorkQueue(path, "a")
+
+    assert queue.enqueue("vg-low", "/dev/mapper/vg-low", "/low")
+    assert queue.enqueue("vg-high", "/dev/mapper/vg-high", "/high", priority=1)
+    assert not queue.enqueue("vg-low", "/dev/mapper/vg-low", "/low", priority=5)
+    assert len(queue) == 2
+    assert [entry.lv for entry in queue.lease(limit=2)] == ["vg-low", "vg-high"]
+
+
+def test_leased_entry_is_not_leased_again_until_its_lease_expires(path):
+    with mock.patch.object(workqueue, "time", return_value=1000.0):
+        first, second = WorkQueue(path, "a"), WorkQueue(path, "b")
+        first.enqueue("vg-data", "/dev/mapper/vg-data", "/data")
+        [entry] = first.lease(lease_time=60)
+        assert entry.attempts == 1
+        assert second.lease() == []
+    with mock.patch.object(workqueue, "time", return_value=1061.0):  # the first consumer crashed
+        [entry] = second.lease()
+        assert entry.attempts == 2
+        first.complete(entry)  # not its lease anymore
+        assert len(second) == 1
+        second.complete(entry)
+        assert second.is_empty()
+
+
+def test_retry_backs_off_exponentially(path):
+    queue = WorkQueue(path, "a")
+    queue.enqueue("vg-data", "/dev/mapper/vg-data", "/data")
+    now = 1000.0
+    for attempt, delay in enumerate([5, 10, 20, 40], start=1):
+        with mock.patch.object(workqueue, "time", return_value=now):
+            [entry] = queue.lease()
+            assert entry.attempts == attempt
+            queue.retry(entry)
+            assert queue.lease() == []
+            assert queue.next_eligible_in() == delay
+        now += delay
+    with mock.patch.object(workqueue, "time", return_value=now):
+        [entry] = queue.lease()
+        entry.attempts = 20
+        queue.retry(entry)
+        assert queue.next_eligible_in() == workqueue.MAX_RETRY_DELAY
+
+
+def test_renewed_lease_outlives_its_lease_time(path):
+    queue = WorkQueue(path, "a")
+    queue.enqueue("vg-data", "/dev/mapper/vg-data", "/data")
+    entries = queue.lease(lease_time=0.3)
+    renewer = LeaseRenewer(path, "a", entries, interval=0.05, lease_time=0.3)
+    renewer.start()
+    try:
+        sleep(0.6)  # twice the lease time
+        assert WorkQueue(path, "b").lease() == []
+    finally:
+        renewer.stop()
+
+
+def test_read_only_queue_never_writes(path):
+    WorkQueue(path, "a").enqueue("vg-data", "/dev/mapper/vg-data", "/data")
+    reader = WorkQueue(path, read_only=True)
+
+    assert list(reader.ages()) == ["vg-data"]
+    with pytest.raises(sqlite3.OperationalError):
+        reader.enqueue("vg-other", "/dev/mapper/vg-other", "/other")